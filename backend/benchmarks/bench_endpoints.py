@@ -0,0 +1,177 @@
+# benchmarks/bench_endpoints.py
+"""
+End-to-end benchmark of every FastAPI endpoint against a mock AnkiConnect
+and a fake LLM backend; no Anki desktop or OpenAI key needed.
+
+Reports throughput, p50/p99 latency and upstream calls (AnkiConnect HTTP
+requests and LLM calls) per request. Run from the backend directory:
+    python -m benchmarks.bench_endpoints --requests 50 --concurrency 10
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+_tmp = tempfile.mkdtemp(prefix="anki-bench-")
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ["LLM_CACHE_PATH"] = os.path.join(_tmp, "llm_cache.sqlite3")
+os.environ["IMAGE_INDEX_PATH"] = os.path.join(_tmp, "image_index.sqlite3")
+os.environ["JOBS_DB_PATH"] = os.path.join(_tmp, "jobs.sqlite3")
+os.environ["LOG_FILE"] = os.path.join(_tmp, "logs.txt")
+# Keep the report readable: the app logs every request
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+# The fake client has no quota; measure the app, not the OpenAI rate limiter
+os.environ.setdefault("LLM_RPM", "0")
+os.environ.setdefault("LLM_TPM", "0")
+
+import httpx  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from src import main, processing  # noqa: E402
+from benchmarks.fake_openai import FakeAsyncOpenAI  # noqa: E402
+from benchmarks.mock_anki import MockAnki  # noqa: E402
+
+TEXT = "\n\n".join(
+    f"During meeting {i} she brought up the issue of delays, and we had to tackle it before the deadline."
+    for i in range(20)
+)
+
+
+def _png() -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (800, 600), (250, 250, 250)).save(out, format="PNG")
+    return out.getvalue()
+
+
+def scenarios(counter):
+    png = _png()
+
+    def unique(prefix):
+        return f"{prefix} {next(counter)}"
+
+    async def process_text(client, mode):
+        return await client.post("/process", data={"text": unique(TEXT), "mode": mode, "deckName": "bench", "use_cache": "false"})
+
+    async def process_image(client):
+        files = [("files", (f"{unique('img')}.png", png, "image/png"))]
+        return await client.post("/process", data={"mode": "manual", "use_cache": "false"}, files=files)
+
+    async def add_cards(client):
+        pairs = [{"Front": f"We {{{{c1::{unique('expr')}}}}} it.", "Back": "x"} for _ in range(50)]
+        return await client.post("/add_cards", json={"deckName": "bench", "pairs": pairs})
+
+    async def full_manual(client):
+        pairs = "\n".join(f"Front: {unique('manual')}\nBack: meaning" for _ in range(20))
+        return await client.post("/full_manual_add_cards", json={"deckName": "bench", "pairs": pairs})
+
+    async def red_manual_adding(client):
+        resp = await client.get("/get_cards_red", params={"deck_name": "red"})
+        card = resp.json()["cards"][0]
+        data = [{
+            "noteId": card["noteId"], "oldFront": card["Front"], "oldBack": card["Back"],
+            "newSuggestions": [{"Front": card["Front"], "Back": card["Back"], "selected": True}],
+        }]
+        return await client.post("/update_cards_red_manual_adding", json={"deckName": "red", "data": data})
+
+    async def job_process(client):
+        resp = await client.post("/jobs/process", data={"text": unique(TEXT), "use_cache": "false"})
+        job_id = resp.json()["jobId"]
+        while True:
+            resp = await client.get(f"/jobs/{job_id}")
+            if resp.json()["status"] in ("done", "failed", "cancelled"):
+                return resp
+            await asyncio.sleep(0.01)
+
+    return {
+        "GET /get_decks": lambda c: c.get("/get_decks"),
+        "POST /process text manual": lambda c: process_text(c, "manual"),
+        "POST /process text auto": lambda c: process_text(c, "auto"),
+        "POST /process image": process_image,
+        "POST /add_cards x50": add_cards,
+        "POST /full_manual_add_cards x20": full_manual,
+        "GET /get_cards_red": lambda c: c.get("/get_cards_red", params={"deck_name": "red"}),
+        "POST /update_cards_red_auto": lambda c: c.post("/update_cards_red_auto", params={"deck_name": "red", "use_cache": "false"}),
+        "GET /update_cards_red_manual_get": lambda c: c.get(
+            "/update_cards_red_manual_get", params={"deck_name": "red", "cards_num": 10, "use_cache": "false"}
+        ),
+        "POST /update_cards_red_manual_adding": red_manual_adding,
+        "POST /jobs/process (until done)": job_process,
+        "GET /llm_cache_stats": lambda c: c.get("/llm_cache_stats"),
+    }
+
+
+async def run_scenario(client, call, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            resp = await call(client)
+            latencies.append(time.perf_counter() - start)
+            if resp.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return time.perf_counter() - start, sorted(latencies), errors
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+async def main_async(args, out):
+    mock = MockAnki(latency=args.anki_latency, failure_rate=args.failure_rate, seed=0)
+    mock.seed_notes("red", 20, flag=1)
+    main.anki_service.client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=mock.app), base_url="http://anki"
+    )
+    llm = processing.client = FakeAsyncOpenAI(latency=args.llm_latency)
+    async with main.lifespan(main.app):
+        await run_scenarios(args, out, mock, llm)
+
+
+async def run_scenarios(args, out, mock, llm):
+    counter = iter(range(10**9))
+    print(
+        f"{'endpoint':<36}{'req/s':>8}{'p50 ms':>9}{'p99 ms':>9}{'anki/req':>10}{'llm/req':>9}{'errors':>8}",
+        file=out,
+    )
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://backend", timeout=None) as client:
+        for name, call in scenarios(counter).items():
+            if args.only and args.only not in name:
+                continue
+            anki_before, llm_before = mock.requests, llm.responses.calls
+            elapsed, latencies, errors = await run_scenario(client, call, args.requests, args.concurrency)
+            n = len(latencies)
+            print(
+                f"{name:<36}{n / elapsed:>8.1f}{statistics.median(latencies) * 1000:>9.1f}"
+                f"{percentile(latencies, 0.99) * 1000:>9.1f}{(mock.requests - anki_before) / n:>10.1f}"
+                f"{(llm.responses.calls - llm_before) / n:>9.1f}{errors:>8}",
+                file=out,
+            )
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20, help="Requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Fake LLM latency, seconds")
+    parser.add_argument("--anki-latency", type=float, default=0.005, help="Mock AnkiConnect latency, seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of AnkiConnect actions that fail")
+    parser.add_argument("--only", default="", help="Run only endpoints whose name contains this")
+    args = parser.parse_args()
+
+    asyncio.run(main_async(args, sys.stdout))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,128 @@
+# benchmarks/bench_event_loop.py
+"""
+Event-loop latency under mixed load, with CPU-bound card processing run
+inline on the loop vs. handed to the offload pools (src/offload.py).
+
+Heavy requests fetch and rewrite a deck of red-flagged imported notes with
+long, sound-tagged fields (/update_cards_red_manual_get). Meanwhile a ticker
+measures how late the loop wakes up and a client keeps calling
+/get_decks. The mock AnkiConnect runs in its own process so its work
+doesn't count. Run from the backend directory:
+    python -m benchmarks.bench_event_loop --notes 2000 --requests 4
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_startup import free_port, wait_for_port
+
+_tmp = tempfile.mkdtemp(prefix="anki-bench-")
+_anki_port = free_port()
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ["ANKI_CONNECT_URL"] = f"http://127.0.0.1:{_anki_port}"
+os.environ["LLM_CACHE_PATH"] = os.path.join(_tmp, "llm_cache.sqlite3")
+os.environ["IMAGE_INDEX_PATH"] = os.path.join(_tmp, "image_index.sqlite3")
+os.environ["JOBS_DB_PATH"] = os.path.join(_tmp, "jobs.sqlite3")
+os.environ["LOG_FILE"] = os.path.join(_tmp, "logs.txt")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+# The fake client has no quota; measure the app, not the OpenAI rate limiter
+os.environ.setdefault("LLM_RPM", "0")
+os.environ.setdefault("LLM_TPM", "0")
+
+import httpx  # noqa: E402
+
+from src import main, offload, processing  # noqa: E402
+from src.cache import ResponseCache  # noqa: E402
+from benchmarks.fake_openai import FakeAsyncOpenAI  # noqa: E402
+
+
+def pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] * 1000
+
+
+async def run_mode(client, args):
+    stop = asyncio.Event()
+    lags, small = [], []
+
+    async def ticker(interval=0.005):
+        while not stop.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            lags.append(time.perf_counter() - start - interval)
+
+    async def light():
+        while not stop.is_set():
+            start = time.perf_counter()
+            (await client.get("/get_decks")).raise_for_status()
+            small.append(time.perf_counter() - start)
+            await asyncio.sleep(0.01)
+
+    async def heavy():
+        resp = await client.get(
+            "/update_cards_red_manual_get",
+            params={"deck_name": "Red", "cards_num": args.notes, "use_cache": "false"},
+        )
+        resp.raise_for_status()
+        return len(resp.json())
+
+    background = [asyncio.create_task(ticker()), asyncio.create_task(light())]
+    start = time.perf_counter()
+    cards = await asyncio.gather(*(heavy() for _ in range(args.requests)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await asyncio.gather(*background)
+    return elapsed, sum(cards), lags, small
+
+
+async def main_async(args):
+    anki = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.mock_anki", "--port", str(_anki_port), "--red-notes", str(args.notes)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        if not wait_for_port(_anki_port, time.perf_counter() + 60):
+            sys.exit("mock AnkiConnect did not start")
+        processing.client = FakeAsyncOpenAI(latency=args.latency)
+        async with main.lifespan(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://backend", timeout=None) as client:
+                for name in ("inline", "offload"):
+                    offload.shutdown()
+                    # A fresh response cache per mode; a fuller one makes every write slower
+                    processing.response_cache = ResponseCache(os.path.join(_tmp, f"llm_cache_{name}.sqlite3"))
+                    if name == "inline":
+                        offload.set_executor("thread", None)
+                        offload.set_executor("process", None)
+                    # Warm up: connections and, when offloading, the pool processes
+                    await client.get(
+                        "/update_cards_red_manual_get", params={"deck_name": "Red", "cards_num": 50, "use_cache": "false"}
+                    )
+                    elapsed, cards, lags, small = await run_mode(client, args)
+                    print(
+                        f"{name:<8} {args.requests} x {args.notes} red cards in {elapsed:.2f}s ({cards} results) | "
+                        f"loop lag p50 {pct(lags, 0.5):.1f} ms p99 {pct(lags, 0.99):.1f} ms max {max(lags) * 1000:.0f} ms | "
+                        f"/get_decks p50 {pct(small, 0.5):.0f} ms p99 {pct(small, 0.99):.0f} ms (n={len(small)})"
+                    )
+    finally:
+        offload.shutdown()
+        anki.terminate()
+        anki.wait()
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=2000, help="Red notes in the deck")
+    parser.add_argument("--requests", type=int, default=4, help="Concurrent heavy requests")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake LLM latency per call, seconds")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    run()
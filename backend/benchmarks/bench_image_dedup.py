@@ -0,0 +1,121 @@
+# benchmarks/bench_image_dedup.py
+"""
+Vision calls for repeat screenshots, with and without perceptual-hash dedup.
+
+Each round uploads a few distinct text pages plus resized, recompressed and
+margin-cropped copies of them to /process; the second round sends fresh
+copies of the same pages, as when a user pastes them again later. Run from
+the backend directory:
+    python -m benchmarks.bench_image_dedup --pages 4 --copies 2
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+from io import BytesIO
+
+_tmp = tempfile.mkdtemp(prefix="anki-bench-")
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ["LLM_CACHE_PATH"] = os.path.join(_tmp, "llm_cache.sqlite3")
+os.environ["IMAGE_INDEX_PATH"] = os.path.join(_tmp, "image_index.sqlite3")
+os.environ["JOBS_DB_PATH"] = os.path.join(_tmp, "jobs.sqlite3")
+os.environ["LOG_FILE"] = os.path.join(_tmp, "logs.txt")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+# The fake client has no quota; measure the app, not the OpenAI rate limiter
+os.environ.setdefault("LLM_RPM", "0")
+os.environ.setdefault("LLM_TPM", "0")
+
+import httpx  # noqa: E402
+from PIL import Image, ImageDraw, ImageFont  # noqa: E402
+
+from src import main, processing  # noqa: E402
+from benchmarks.fake_openai import FakeAsyncOpenAI  # noqa: E402
+from benchmarks.mock_anki import MockAnki  # noqa: E402
+
+WORDS = (
+    "the meeting issue delays tackle deadline project budget client team report schedule risk plan "
+    "review estimate scope release feedback priority decision agenda summary outcome follow"
+).split()
+
+
+def make_page(seed: int, width: int = 1170, height: int = 2532) -> Image.Image:
+    """A phone screenshot of a page of text, with a light status bar on top."""
+    rnd = random.Random(seed)
+    img = Image.new("RGB", (width, height), (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    draw.rectangle([0, 0, width, 100], fill=(240, 240, 240))
+    font = ImageFont.load_default(size=42)
+    y = 150
+    while y < height - 100:
+        # Wrap within the margins, ragged right like real text
+        words = [rnd.choice(WORDS)]
+        limit = width - 120 - rnd.randint(0, 300)
+        while draw.textlength(" ".join(words + [WORDS[0]]), font=font) < limit:
+            words.append(rnd.choice(WORDS))
+        draw.text((60, y), " ".join(words), fill=(20, 20, 20), font=font)
+        y += 124 if rnd.random() < 0.1 else 62
+    return img
+
+
+def encode(img: Image.Image, fmt: str = "PNG", quality: int = 90) -> bytes:
+    out = BytesIO()
+    img.save(out, format=fmt, quality=quality)
+    return out.getvalue()
+
+
+def copies(img: Image.Image, round_no: int, count: int):
+    """Re-screenshots of the same page: resized, recompressed or with margins cropped off."""
+    width, height = img.size
+    variants = [
+        lambda: encode(img.resize((width * 3 // 4, height * 3 // 4)), "JPEG", 75 - round_no),
+        lambda: encode(img.crop((0, 100, width, height))),
+        lambda: encode(img.crop((20, 40, width - 20, height - 40)).resize((width // 2, height // 2))),
+    ]
+    return [variants[(round_no + i) % len(variants)]() for i in range(count)]
+
+
+async def run_rounds(client, llm, pages, copies_per_page):
+    calls = []
+    for round_no in range(2):
+        files = []
+        for p, page in enumerate(pages):
+            uploads = ([encode(page)] if round_no == 0 else []) + copies(page, round_no, copies_per_page)
+            files.extend(("files", (f"page{p}-{round_no}-{i}.png", data, "image/png")) for i, data in enumerate(uploads))
+        before = llm.responses.calls
+        resp = await client.post("/process", data={"mode": "manual", "skip_known": "false"}, files=files)
+        resp.raise_for_status()
+        calls.append((len(files), llm.responses.calls - before))
+    return calls
+
+
+async def main_async(args):
+    mock = MockAnki()
+    main.anki_service.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=mock.app), base_url="http://anki")
+    llm = processing.client = FakeAsyncOpenAI(latency=0.0)
+    # One image per vision call, so calls count the images that were sent
+    main.IMAGE_PACK_MAX_IMAGES = 1
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://backend", timeout=None) as client:
+            for name, distance in (("no dedup", -1), ("dedup", main.IMAGE_DEDUP_DISTANCE)):
+                main.IMAGE_DEDUP_DISTANCE = processing.image_index.max_distance = distance
+                # Different pages per mode, so the response cache can't carry over
+                pages = [make_page(seed + (100 if distance >= 0 else 0)) for seed in range(args.pages)]
+                results = await run_rounds(client, llm, pages, args.copies)
+                print(
+                    f"{name:<9} " + "  ".join(f"round {i + 1}: {n} uploads -> {c} vision calls" for i, (n, c) in enumerate(results))
+                )
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=4, help="Distinct pages per round")
+    parser.add_argument("--copies", type=int, default=2, help="Extra copies of each page per round")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,89 @@
+# benchmarks/bench_image_packing.py
+"""
+Vision calls and instruction tokens for a batch of phone screenshots sent to
+/process, one image per call vs. packed several to a call under the pixel
+budget. Also checks that every upload still gets its own cards back.
+
+Run from the backend directory:
+    python -m benchmarks.bench_image_packing --images 10
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+_tmp = tempfile.mkdtemp(prefix="anki-bench-")
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ["LLM_CACHE_PATH"] = os.path.join(_tmp, "llm_cache.sqlite3")
+os.environ["IMAGE_INDEX_PATH"] = os.path.join(_tmp, "image_index.sqlite3")
+os.environ["JOBS_DB_PATH"] = os.path.join(_tmp, "jobs.sqlite3")
+os.environ["LOG_FILE"] = os.path.join(_tmp, "logs.txt")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+# The fake client has no quota; measure the app, not the OpenAI rate limiter
+os.environ.setdefault("LLM_RPM", "0")
+os.environ.setdefault("LLM_TPM", "0")
+
+import httpx  # noqa: E402
+
+from src import main, processing  # noqa: E402
+from src.chunking import estimate_tokens  # noqa: E402
+from benchmarks.bench_image_dedup import encode, make_page  # noqa: E402
+from benchmarks.fake_openai import FakeAsyncOpenAI  # noqa: E402
+from benchmarks.mock_anki import MockAnki  # noqa: E402
+
+
+class RecordingResponses:
+    """Passes calls to the fake and keeps each request's instructions and image count."""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.requests = []
+
+    async def create(self, **kwargs):
+        images = sum(part.get("type") == "input_image" for part in kwargs["input"][0]["content"])
+        self.requests.append((kwargs["instructions"], images))
+        return await self.inner.create(**kwargs)
+
+
+async def main_async(args):
+    mock = MockAnki()
+    main.anki_service.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=mock.app), base_url="http://anki")
+    llm = processing.client = FakeAsyncOpenAI(latency=args.latency)
+    llm.responses = recorder = RecordingResponses(llm.responses)
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://backend", timeout=None) as client:
+            for name, max_images in (("one per call", 1), ("packed", main.IMAGE_PACK_MAX_IMAGES)):
+                main.IMAGE_PACK_MAX_IMAGES = max_images
+                # Different pages per mode, so neither the response cache nor the image index carries over
+                offset = 1000 if max_images > 1 else 0
+                files = [
+                    ("files", (f"shot{i}.png", encode(make_page(offset + i)), "image/png"))
+                    for i in range(args.images)
+                ]
+                recorder.requests.clear()
+                start = time.perf_counter()
+                resp = await client.post("/process", data={"mode": "manual", "skip_known": "false"}, files=files)
+                elapsed = time.perf_counter() - start
+                resp.raise_for_status()
+                cards = resp.json()["cards"]
+                instruction_tokens = sum(estimate_tokens(instructions) for instructions, _ in recorder.requests)
+                packs = "+".join(str(images) for _, images in recorder.requests)
+                print(
+                    f"{name:<13} {args.images} images -> {len(recorder.requests)} vision calls ({packs}), "
+                    f"instructions {instruction_tokens} tokens, {len(cards)} cards, wall {elapsed:.2f}s"
+                )
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.3, help="Fake LLM latency per call, seconds")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,99 @@
+# benchmarks/bench_images.py
+"""
+Payload size and end-to-end latency of image extraction with and without
+preprocessing (downscale + recompress before base64).
+
+The fake LLM charges a fixed latency plus upload time at --bandwidth MB/s.
+Run from the backend directory:
+    python -m benchmarks.bench_images --images 5
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+from io import BytesIO
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+# The fake client has no quota; measure the app, not the OpenAI rate limiter
+os.environ.setdefault("LLM_RPM", "0")
+os.environ.setdefault("LLM_TPM", "0")
+
+from PIL import Image, ImageDraw  # noqa: E402
+
+from src import processing  # noqa: E402
+from src.images import preprocess_image_async, sniff_mime_type  # noqa: E402
+from src.utils import encode_base64  # noqa: E402
+from benchmarks.fake_openai import FakeAsyncOpenAI  # noqa: E402
+
+
+def make_screenshot(width=3024, height=4032, seed=0) -> bytes:
+    """A phone-camera sized PNG with lines of 'text' and some sensor noise."""
+    rnd = random.Random(seed)
+    img = Image.new("RGB", (width, height), (245, 245, 240))
+    draw = ImageDraw.Draw(img)
+    for y in range(80, height - 80, 60):
+        x = 80
+        while x < width - 200:
+            w = rnd.randint(40, 180)
+            draw.rectangle([x, y, x + w, y + 28], fill=(30, 30, 30))
+            x += w + 25
+    noise = Image.effect_noise((width, height), 12).convert("RGB")
+    img = Image.blend(img, noise, 0.08)
+    out = BytesIO()
+    img.save(out, format="PNG")
+    return out.getvalue()
+
+
+class BandwidthFakeResponses:
+    def __init__(self, inner, bandwidth_mb_s):
+        self.inner = inner
+        self.bandwidth = bandwidth_mb_s * 1024 * 1024
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        payload_size = len(str(kwargs.get("input")))
+        await asyncio.sleep(payload_size / self.bandwidth)
+        return await self.inner.create(**kwargs)
+
+
+async def run(images, preprocess):
+    payload = 0
+    start = time.perf_counter()
+
+    async def one(content):
+        nonlocal payload
+        mime_type = sniff_mime_type(content)
+        if preprocess:
+            content, mime_type = await preprocess_image_async(content)
+        b64 = encode_base64(content)
+        payload += len(b64)
+        return await processing.extract_pairs_from_image(b64, use_cache=False, mime_type=mime_type)
+
+    await asyncio.gather(*(one(c) for c in images))
+    return payload, time.perf_counter() - start
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.3, help="Fake LLM latency per call, seconds")
+    parser.add_argument("--bandwidth", type=float, default=2.0, help="Upload bandwidth, MB/s")
+    args = parser.parse_args()
+
+    images = [make_screenshot(seed=i) for i in range(args.images)]
+    for preprocess in (False, True):
+        fake = FakeAsyncOpenAI(latency=args.latency)
+        fake.responses = BandwidthFakeResponses(fake.responses, args.bandwidth)
+        processing.client = fake
+        payload, elapsed = await run(images, preprocess)
+        print(
+            f"preprocess={str(preprocess):<5} images={len(images)} "
+            f"payload={payload / 1024 / 1024:.2f}MB wall={elapsed:.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
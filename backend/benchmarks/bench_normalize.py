@@ -0,0 +1,50 @@
+# benchmarks/bench_normalize.py
+"""
+CPU time to normalize the Front and Back of a batch of notesInfo entries
+(sound tags, markup, entities, cloze targets): one note field at a time vs.
+the whole batch in one pass (src/normalize.py). Fields look like those of
+an imported shared deck. Run from the backend directory:
+    python -m benchmarks.bench_normalize --notes 2000
+"""
+
+import argparse
+import time
+
+from src.normalize import field_values, normalize_fields
+from benchmarks.mock_anki import imported_fields
+
+
+def per_field(values):
+    return [normalize_fields([value]) for value in values]
+
+
+def batch(values):
+    return normalize_fields(values)
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=2000)
+    parser.add_argument("--chars", type=int, default=1500, help="Length of each field's example text")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    infos = [
+        {"noteId": i, "fields": {name: {"value": value} for name, value in imported_fields(i, args.chars).items()}}
+        for i in range(args.notes)
+    ]
+    values = field_values(infos, "Front") + field_values(infos, "Back")
+    expected = batch(values).text
+    assert [result.text[0] for result in per_field(values)] == expected
+
+    for name, func in (("per field", per_field), ("batch", batch)):
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            func(values)
+            best = min(best, time.perf_counter() - start)
+        print(f"{name:<10} {len(values)} fields ({sum(map(len, values)) / 1e6:.1f} M chars) in {best * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    run()
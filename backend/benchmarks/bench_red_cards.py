@@ -0,0 +1,96 @@
+# benchmarks/bench_red_cards.py
+"""
+Wall-clock and LLM call comparison of red-card rewriting: fixed-size chunks
+run serially and concurrently, then adaptively sized chunks.
+
+"lost" counts cards that came back without suggestions, e.g. because the
+model answered a chunk with the wrong number of items.
+
+Run from the backend directory:
+    python -m benchmarks.bench_red_cards --cards 200 --latency 0.5 --concurrency 8 --mismatch-rate 0.1
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+# The fake client has no quota; measure the app, not the OpenAI rate limiter
+os.environ.setdefault("LLM_RPM", "0")
+os.environ.setdefault("LLM_TPM", "0")
+
+from src import processing  # noqa: E402
+from src.adaptive import ChunkSizer, run_adaptive_chunks  # noqa: E402
+from src.chunking import estimate_tokens  # noqa: E402
+from src.utils import apply_manual_changes_for_chunk  # noqa: E402
+from benchmarks.fake_openai import FakeAsyncOpenAI  # noqa: E402
+
+
+async def schedule_chunks(items, chunk_size, process_chunk, max_concurrency):
+    """Fixed-size chunks with at most `max_concurrency` in flight; per-chunk results in order."""
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def run(chunk):
+        async with semaphore:
+            return await process_chunk(chunk)
+
+    chunks = [items[i : i + chunk_size] for i in range(0, len(items), chunk_size)]
+    return await asyncio.gather(*(run(chunk) for chunk in chunks))
+
+
+def _lost(results):
+    return sum(1 for r in results if not r["New"])
+
+
+async def run_fixed(cards, batch_size, concurrency):
+    async def rewrite_chunk(chunk):
+        new_cards_chunk = await processing.change_anki_pairs(chunk, use_cache=False)
+        return apply_manual_changes_for_chunk(chunk=chunk, new_cards_chunk=new_cards_chunk)
+
+    chunk_results = await schedule_chunks(cards, batch_size, rewrite_chunk, max_concurrency=concurrency)
+    return [r for results in chunk_results for r in results]
+
+
+async def run_adaptive(cards, batch_size, concurrency):
+    sizer = ChunkSizer(processing.CHANGE_PAIRS_MAX_OUTPUT_TOKENS, initial_size=batch_size)
+
+    async def rewrite_chunk(chunk):
+        return await processing.rewrite_pairs(chunk, use_cache=False)
+
+    outcomes = await run_adaptive_chunks(
+        cards, rewrite_chunk, sizer, lambda out: estimate_tokens(json.dumps(out)), max_concurrency=concurrency
+    )
+    results = []
+    for chunk, new_cards_chunk in outcomes:
+        if isinstance(new_cards_chunk, Exception):
+            new_cards_chunk = [[] for _ in chunk]
+        results.extend(apply_manual_changes_for_chunk(chunk=chunk, new_cards_chunk=new_cards_chunk))
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cards", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.5, help="Fake LLM latency per call, seconds")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mismatch-rate", type=float, default=0.1, help="Chance a multi-card answer drops an item")
+    args = parser.parse_args()
+
+    cards = [{"noteId": i, "Front": f"expression {i}", "Back": "meaning"} for i in range(args.cards)]
+    runs = [("fixed", run_fixed, 1), ("fixed", run_fixed, args.concurrency), ("adaptive", run_adaptive, args.concurrency)]
+    for name, run, concurrency in runs:
+        processing.client = FakeAsyncOpenAI(latency=args.latency, mismatch_rate=args.mismatch_rate)
+        start = time.perf_counter()
+        results = await run(cards, args.batch_size, concurrency)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name:<9} concurrency={concurrency:<3} cards={len(results):<5} lost={_lost(results):<4} "
+            f"llm_calls={processing.client.responses.calls:<4} wall={elapsed:.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,109 @@
+# benchmarks/bench_startup.py
+"""
+Cold start: time to import the app and time from launching uvicorn until
+the first /get_decks answer, against the mock AnkiConnect. Also reports
+which heavy packages the import pulled in.
+
+Run from the backend directory:
+    python -m benchmarks.bench_startup --runs 5
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+PROBE = (
+    "import sys, time; t = time.perf_counter(); import src.main; "
+    "print(time.perf_counter() - t, 'openai' in sys.modules, 'PIL.Image' in sys.modules, len(sys.modules))"
+)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port: int, deadline: float) -> bool:
+    while time.perf_counter() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1.0).close()
+            return True
+        except OSError:
+            time.sleep(0.01)
+    return False
+
+
+def wait_until_ok(url: str, deadline: float) -> bool:
+    while time.perf_counter() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return True
+        except httpx.TransportError:
+            pass
+        time.sleep(0.01)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="anki-bench-")
+    anki_port, app_port = free_port(), free_port()
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "benchmark"),
+        "ANKI_CONNECT_URL": f"http://127.0.0.1:{anki_port}",
+        "LLM_CACHE_PATH": os.path.join(tmp, "llm_cache.sqlite3"),
+        "JOBS_DB_PATH": os.path.join(tmp, "jobs.sqlite3"),
+        "LOG_FILE": os.path.join(tmp, "logs.txt"),
+        "LOG_LEVEL": "ERROR",
+    }
+    anki = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.mock_anki", "--port", str(anki_port)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        if not wait_for_port(anki_port, time.perf_counter() + 30):
+            sys.exit("mock AnkiConnect did not start")
+
+        imports = []
+        for _ in range(args.runs):
+            out = subprocess.run([sys.executable, "-c", PROBE], env=env, capture_output=True, text=True, check=True)
+            seconds, openai_loaded, pil_loaded, modules = out.stdout.split()[-4:]
+            imports.append(float(seconds))
+
+        first_answer = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            server = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "src.main:app", "--port", str(app_port), "--log-level", "error"],
+                env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            try:
+                if not wait_until_ok(f"http://127.0.0.1:{app_port}/get_decks", start + 60):
+                    sys.exit("server did not answer /get_decks")
+                first_answer.append(time.perf_counter() - start)
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        anki.terminate()
+        anki.wait()
+
+    print(f"import src.main             {statistics.median(imports) * 1000:6.0f} ms  (median of {args.runs})")
+    print(f"launch to first /get_decks  {statistics.median(first_answer) * 1000:6.0f} ms")
+    print(f"modules loaded {modules}, openai loaded {openai_loaded}, PIL loaded {pil_loaded}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# benchmarks/bench_streaming.py
+"""
+Time to first card: buffered extraction vs. streaming the Responses event stream.
+
+Run from the backend directory:
+    python -m benchmarks.bench_streaming --latency 2.0 --runs 5
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+# The fake client has no quota; measure the app, not the OpenAI rate limiter
+os.environ.setdefault("LLM_RPM", "0")
+os.environ.setdefault("LLM_TPM", "0")
+
+from src import processing  # noqa: E402
+from benchmarks.fake_openai import FakeAsyncOpenAI  # noqa: E402
+
+TEXT = "During the meeting she brought up the issue of delays, and we had to tackle it. " * 10
+
+
+async def buffered(text):
+    start = time.perf_counter()
+    cards = await processing.extract_pairs_from_text(text, use_cache=False)
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed, len(cards)
+
+
+async def streamed(text):
+    start = time.perf_counter()
+    first, count = None, 0
+    async for _ in processing.stream_pairs_from_text(text, use_cache=False):
+        count += 1
+        if first is None:
+            first = time.perf_counter() - start
+    return first, time.perf_counter() - start, count
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=2.0, help="Fake LLM latency per call, seconds")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    processing.client = FakeAsyncOpenAI(latency=args.latency)
+    for name, run in (("buffered", buffered), ("streamed", streamed)):
+        results = [await run(f"{TEXT} {name} {i}") for i in range(args.runs)]
+        print(
+            f"{name:<9} first card {statistics.median(r[0] for r in results):.2f}s  "
+            f"all cards {statistics.median(r[1] for r in results):.2f}s  cards/run {results[0][2]}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,147 @@
+# benchmarks/bench_upload_memory.py
+"""
+Peak server memory for image uploads: the server's peak RSS (VmHWM) grows
+by how much while /process handles --images camera photos in one request?
+Also times the rejection of an upload over the size limit.
+
+The app runs in a uvicorn subprocess with the fake LLM and the mock
+AnkiConnect, so the client's own buffers don't count. Linux only (reads
+/proc). Run from the backend directory:
+    python -m benchmarks.bench_upload_memory --images 10
+"""
+
+import argparse
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+import httpx
+
+
+def make_photo(seed: int, width: int = 4032, height: int = 3024) -> bytes:
+    """A phone-camera JPEG of a page of 'text' with sensor noise, a few MB like the real thing."""
+    from PIL import Image, ImageDraw
+
+    rnd = random.Random(seed)
+    img = Image.new("RGB", (width, height), (235, 232, 225))
+    draw = ImageDraw.Draw(img)
+    for y in range(120, height - 120, 70):
+        x = 120
+        while x < width - 250:
+            w = rnd.randint(40, 220)
+            draw.rectangle([x, y, x + w, y + 32], fill=(40, 40, 40))
+            x += w + 28
+    img = Image.blend(img, Image.effect_noise((width, height), 20).convert("RGB"), 0.1)
+    out = BytesIO()
+    img.save(out, format="JPEG", quality=88)
+    return out.getvalue()
+
+
+def peak_rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    raise RuntimeError("VmHWM not found")
+
+
+def serve(port: int) -> None:
+    """Child process: the app with fake upstreams, on `port`."""
+    import uvicorn
+
+    from src import main, processing
+    from benchmarks.fake_openai import FakeAsyncOpenAI
+    from benchmarks.mock_anki import MockAnki
+
+    mock = MockAnki()
+    main.anki_service.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=mock.app), base_url="http://anki")
+    processing.client = FakeAsyncOpenAI(latency=0.0)
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="error")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=10)
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve)
+        return
+
+    tmp = tempfile.mkdtemp(prefix="anki-bench-")
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "benchmark"),
+        "LLM_CACHE_PATH": os.path.join(tmp, "llm_cache.sqlite3"),
+        "IMAGE_INDEX_PATH": os.path.join(tmp, "image_index.sqlite3"),
+        "JOBS_DB_PATH": os.path.join(tmp, "jobs.sqlite3"),
+        "LOG_FILE": os.path.join(tmp, "logs.txt"),
+        "LOG_LEVEL": "ERROR",
+        "LLM_RPM": "0",
+        "LLM_TPM": "0",
+    }
+    photos = [make_photo(seed) for seed in range(args.images)]
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.bench_upload_memory", "--serve", str(port)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        with httpx.Client(base_url=url, timeout=600) as client:
+            deadline = time.perf_counter() + 60
+            while True:
+                try:
+                    client.get("/llm_cache_stats")
+                    break
+                except httpx.TransportError:
+                    if time.perf_counter() > deadline:
+                        sys.exit("server did not start")
+                    time.sleep(0.05)
+            # Warm up: load Pillow, open the caches
+            client.post(
+                "/process", data={"mode": "manual", "skip_known": "false"},
+                files=[("files", ("warmup.jpg", make_photo(99, 400, 300), "image/jpeg"))],
+            ).raise_for_status()
+            before = peak_rss_mb(server.pid)
+
+            files = [("files", (f"photo{i}.jpg", data, "image/jpeg")) for i, data in enumerate(photos)]
+            start = time.perf_counter()
+            resp = client.post("/process", data={"mode": "manual", "skip_known": "false", "use_cache": "false"}, files=files)
+            elapsed = time.perf_counter() - start
+            resp.raise_for_status()
+            after = peak_rss_mb(server.pid)
+
+            oversized = os.urandom(64 * 1024 * 1024)
+            start = time.perf_counter()
+            rejected = client.post(
+                "/process", data={"mode": "manual"}, files=[("files", ("huge.jpg", b"\xff\xd8\xff" + oversized, "image/jpeg"))]
+            )
+            reject_elapsed = time.perf_counter() - start
+            peak = peak_rss_mb(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+
+    total_mb = sum(len(p) for p in photos) / 1024 / 1024
+    print(f"{args.images} photos, {total_mb:.1f} MB uploaded, {len(resp.json()['cards'])} cards in {elapsed:.2f}s")
+    print(f"server peak RSS {before:.0f} MB before -> {after:.0f} MB after (+{after - before:.0f} MB)")
+    print(
+        f"64 MB upload: HTTP {rejected.status_code} in {reject_elapsed:.2f}s, "
+        f"peak RSS +{peak - after:.0f} MB"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# benchmarks/fake_openai.py
+
+import asyncio
+import json
+import random
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+
+class FakeStream:
+    """Like openai.AsyncStream: async-iterable events, closed with close() or `async with`."""
+
+    def __init__(self, events):
+        self._events = events
+        self.closed = False
+
+    def __aiter__(self):
+        return self._events
+
+    async def close(self) -> None:
+        self.closed = True
+        await self._events.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+
+class FakeResponses:
+    """Stands in for `AsyncOpenAI().responses` with a configurable latency."""
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.0, mismatch_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        # Chance that a multi-card change_anki_pairs answer drops one item
+        self.mismatch_rate = mismatch_rate
+        self.calls = 0
+
+    def _cards_for(self, payload: Any, nested: bool, call: int, images: int = 0) -> List[Any]:
+        # change_anki_pairs sends a JSON list of {Front, Back}: one improved card per input
+        if isinstance(payload, list) and all(isinstance(p, dict) and "Front" in p for p in payload):
+            cards = [
+                [{"Front": f"We need to {{{{c1::{p['Front']}}}}} now.\n\n[definition]", "Back": p.get("Back", "")}]
+                for p in payload
+            ]
+            if len(cards) > 1 and random.random() < self.mismatch_rate:
+                cards.pop()
+            return cards
+        # Packed image extraction: a handful of cards per image, each naming its image
+        if images:
+            return [
+                {"Image": n, "Front": f"She {{{{c1::brought up {call}.{n}.{i}}}}} again.\n\n[to mention]", "Back": "mention, raise"}
+                for n in range(1, images + 1)
+                for i in range(3)
+            ]
+        # Text / image extraction: a handful of cards per request
+        cards = [
+            {"Front": f"She {{{{c1::brought up {call}.{i}}}}} again.\n\n[to mention]", "Back": "mention, raise"}
+            for i in range(3)
+        ]
+        return [[card] for card in cards] if nested else cards
+
+    async def create(self, **kwargs: Dict[str, Any]):
+        self.calls += 1
+        call = self.calls
+        latency = self.latency + random.uniform(0, self.jitter)
+        if kwargs.pop("stream", False):
+            return FakeStream(self._stream(self._respond(kwargs, call), latency))
+        await asyncio.sleep(latency)
+        return self._respond(kwargs, call)
+
+    async def _stream(self, response, latency: float, deltas: int = 20):
+        """Responses event stream: the output text arrives in `deltas` pieces spread over `latency`."""
+        text = response.output_text
+        step = max(1, -(-len(text) // deltas))
+        for i in range(0, len(text), step):
+            await asyncio.sleep(latency / deltas)
+            yield SimpleNamespace(type="response.output_text.delta", delta=text[i : i + step])
+        done_type = "response.incomplete" if response.status == "incomplete" else "response.completed"
+        yield SimpleNamespace(type=done_type, response=response)
+
+    def _respond(self, kwargs: Dict[str, Any], call: int):
+        raw_input = kwargs.get("input")
+        try:
+            payload = json.loads(raw_input) if isinstance(raw_input, str) else raw_input
+        except ValueError:
+            payload = raw_input
+        # Follow the requested schema: "Cards" is either a list of cards or a list of lists
+        schema = (kwargs.get("text") or {}).get("format", {}).get("schema", {})
+        items = schema.get("properties", {}).get("Cards", {}).get("items", {})
+        nested = items.get("type") == "array"
+        # Attributed cards: count the images the request packs together
+        images = 0
+        if "Image" in items.get("properties", {}):
+            images = sum(
+                part.get("type") == "input_image"
+                for message in payload for part in message.get("content", [])
+            )
+        output_text = json.dumps({"Cards": self._cards_for(payload, nested, call, images)})
+        # Like the API, stop at max_output_tokens (~4 characters per token) and report it
+        limit = (kwargs.get("max_output_tokens") or 0) * 4
+        if limit and len(output_text) > limit:
+            return SimpleNamespace(
+                output_text=output_text[:limit],
+                output=[],
+                status="incomplete",
+                incomplete_details=SimpleNamespace(reason="max_output_tokens"),
+            )
+        return SimpleNamespace(output_text=output_text, output=[], status="completed")
+
+
+class FakeAsyncOpenAI:
+    """Minimal fake of `openai.AsyncOpenAI` exposing only `responses.create` and `close`."""
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.0, mismatch_rate: float = 0.0):
+        self.responses = FakeResponses(latency=latency, jitter=jitter, mismatch_rate=mismatch_rate)
+
+    async def close(self):
+        pass
@@ -0,0 +1,189 @@
+# benchmarks/mock_anki.py
+"""
+In-process fake of the AnkiConnect API with configurable latency and failure rate.
+
+Use `MockAnki().app` as an ASGI app (e.g. with httpx.ASGITransport), or run it
+as a standalone server in place of Anki:
+    python -m benchmarks.mock_anki --port 8765 --latency 0.01
+"""
+
+import argparse
+import asyncio
+import random
+import re
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+
+
+class MockAnki:
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.notes: Dict[int, Dict[str, Any]] = {}
+        self.cards: Dict[int, Dict[str, Any]] = {}  # cardId -> {"noteId", "flags"}
+        self.decks = {"Default"}
+        self.calls: Counter = Counter()  # per action, including actions inside 'multi'
+        self.requests = 0  # HTTP round trips
+        self._next_id = int(time.time() * 1000)
+        self.app = FastAPI()
+        self.app.post("/")(self._endpoint)
+
+    # --- state helpers ---
+
+    def _new_id(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+    def seed_notes(
+        self, deck: str, count: int, flag: int = 0, fields: Optional[Callable[[int], Dict[str, str]]] = None
+    ) -> List[int]:
+        """Creates `count` notes in `deck`, with all their cards set to `flag`. `fields(i)` gives note i's fields."""
+        ids = []
+        for i in range(count):
+            note_fields = fields(i) if fields else {"Front": f"seed expression {deck} {i}", "Back": "meaning"}
+            note_id = self._add_note(deck, note_fields)
+            for card_id in self.notes[note_id]["cards"]:
+                self.cards[card_id]["flags"] = flag
+            ids.append(note_id)
+        return ids
+
+    def _add_note(self, deck: str, fields: Dict[str, str]) -> int:
+        self.decks.add(deck)
+        note_id, card_id = self._new_id(), self._new_id()
+        self.notes[note_id] = {"deck": deck, "fields": dict(fields), "mod": int(time.time()), "cards": [card_id]}
+        self.cards[card_id] = {"noteId": note_id, "flags": 0}
+        return note_id
+
+    def _matches(self, note_id: int, query: str) -> bool:
+        note = self.notes[note_id]
+        deck = re.search(r'deck:"([^"]*)"', query)
+        if deck and note["deck"] != deck.group(1):
+            return False
+        flag = re.search(r"flag:(\d+)", query)
+        if flag and not any(self.cards[c]["flags"] == int(flag.group(1)) for c in note["cards"]):
+            return False
+        edited = re.search(r"edited:(\d+)", query)
+        if edited and note["mod"] < time.time() - int(edited.group(1)) * 86400:
+            return False
+        return True
+
+    # --- actions ---
+
+    def _add_note_action(self, note: Dict[str, Any]) -> int:
+        front = note["fields"].get("Front", "")
+        if not note.get("options", {}).get("allowDuplicate", False):
+            for existing in self.notes.values():
+                if existing["deck"] == note["deckName"] and existing["fields"].get("Front") == front:
+                    raise ValueError("cannot create note because it is a duplicate")
+        return self._add_note(note["deckName"], note["fields"])
+
+    def _dispatch(self, action: str, params: Dict[str, Any]) -> Any:
+        self.calls[action] += 1
+        if action != "version" and self.random.random() < self.failure_rate:
+            raise RuntimeError("simulated AnkiConnect failure")
+        if action == "version":
+            return 6
+        if action == "deckNames":
+            return sorted(self.decks)
+        if action == "addNote":
+            return self._add_note_action(params["note"])
+        if action == "addNotes":
+            results = []
+            for note in params["notes"]:
+                try:
+                    results.append(self._add_note_action(note))
+                except ValueError:
+                    results.append(None)
+            return results
+        if action == "updateNoteModel":
+            note = self.notes.get(params["note"]["id"])
+            if note is None:
+                raise ValueError("note was not found")
+            note["fields"].update(params["note"]["fields"])
+            note["mod"] = int(time.time())
+            return None
+        if action == "findNotes":
+            return [n for n in self.notes if self._matches(n, params.get("query", ""))]
+        if action == "notesInfo":
+            infos = []
+            for note_id in params["notes"]:
+                note = self.notes.get(note_id)
+                if note is None:
+                    infos.append({})
+                    continue
+                infos.append({
+                    "noteId": note_id,
+                    "modelName": "Cloze",
+                    "tags": [],
+                    "mod": note["mod"],
+                    "cards": list(note["cards"]),
+                    "fields": {k: {"value": v, "order": i} for i, (k, v) in enumerate(note["fields"].items())},
+                })
+            return infos
+        if action == "notesModTime":
+            return [{"noteId": n, "mod": self.notes[n]["mod"]} for n in params["notes"] if n in self.notes]
+        if action == "deleteNotes":
+            for note_id in params["notes"]:
+                note = self.notes.pop(note_id, None)
+                for card_id in (note or {}).get("cards", []):
+                    self.cards.pop(card_id, None)
+            return None
+        if action == "setSpecificValueOfCard":
+            card = self.cards.get(params["card"])
+            if card is None:
+                raise ValueError("card was not found")
+            for key, value in zip(params["keys"], params["newValues"]):
+                card[key] = int(value)
+            return [True] * len(params["keys"])
+        if action == "multi":
+            results = []
+            for sub in params["actions"]:
+                try:
+                    results.append({"result": self._dispatch(sub["action"], sub.get("params", {})), "error": None})
+                except Exception as e:
+                    results.append({"result": None, "error": str(e)})
+            return results
+        raise ValueError("unsupported action")
+
+    async def _endpoint(self, request: Request):
+        body = await request.json()
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        try:
+            return {"result": self._dispatch(body["action"], body.get("params", {})), "error": None}
+        except Exception as e:
+            return {"result": None, "error": str(e)}
+
+
+def imported_fields(i: int, chars: int = 1500) -> Dict[str, str]:
+    """Fields like those of a shared deck: HTML markup, sound tags and a long example text."""
+    filler = f"an example sentence {i} with <b>markup</b>&nbsp;and more words<br>"
+    body = (filler * (chars // len(filler) + 1))[:chars]
+    return {
+        "Front": f"[sound:word{i}.mp3] expression {i}<div>{body}</div>[sound:sentence{i}.mp3]",
+        "Back": f"meaning {i}<br>{body}[sound:back{i}.mp3]",
+    }
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--red-notes", type=int, default=0, help="Seed this many red-flagged imported notes in deck 'Red'")
+    args = parser.parse_args()
+    mock = MockAnki(latency=args.latency, failure_rate=args.failure_rate)
+    if args.red_notes:
+        mock.seed_notes("Red", args.red_notes, flag=1, fields=imported_fields)
+    uvicorn.run(mock.app, host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# src/adaptive.py
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkOutputError(Exception):
+    """
+    The model's answer does not cover the chunk: the output was truncated or
+    holds a different number of items than were sent. Smaller chunks usually fix it.
+    """
+
+    def __init__(self, message: str, truncated: bool = False):
+        super().__init__(message)
+        self.truncated = truncated
+
+
+class ChunkSizer:
+    """
+    Picks how many cards go into the next LLM call.
+
+    Keeps a moving average of output tokens per input card and sizes chunks
+    so the expected output fills `headroom` of `max_output_tokens`. After a
+    successful call the size may at most double; after a truncated or
+    mismatched one it drops to half the failed chunk.
+    """
+
+    def __init__(
+        self,
+        max_output_tokens: int,
+        initial_size: int = 5,
+        min_size: int = 1,
+        max_size: int = 50,
+        headroom: float = 0.7,
+        smoothing: float = 0.3,
+    ):
+        self.max_output_tokens = max_output_tokens
+        self.min_size = min_size
+        self.max_size = max_size
+        self.headroom = headroom
+        self.smoothing = smoothing
+        self.tokens_per_card: Optional[float] = None
+        self._size = float(max(min_size, min(initial_size, max_size)))
+
+    @property
+    def size(self) -> int:
+        return int(self._size)
+
+    def _clamp(self, size: float) -> float:
+        return float(max(self.min_size, min(self.max_size, size)))
+
+    def record_success(self, cards: int, output_tokens: int) -> None:
+        per_card = output_tokens / max(cards, 1)
+        if self.tokens_per_card is None:
+            self.tokens_per_card = per_card
+        else:
+            self.tokens_per_card += self.smoothing * (per_card - self.tokens_per_card)
+        target = self.headroom * self.max_output_tokens / max(self.tokens_per_card, 1.0)
+        self._size = self._clamp(min(target, self._size * 2))
+
+    def record_failure(self, cards: int, truncated: bool = False) -> None:
+        if truncated:
+            # The whole budget was not enough for `cards` cards
+            floor = self.max_output_tokens / max(cards, 1)
+            self.tokens_per_card = max(self.tokens_per_card or 0.0, floor)
+        self._size = self._clamp(min(self._size, cards / 2))
+        logger.info(f"Chunk of {cards} cards failed{' (truncated)' if truncated else ''}, next size {self.size}")
+
+
+ChunkOutcome = Tuple[List[Any], Union[Any, Exception]]
+
+
+async def run_adaptive_chunks(
+    items: Sequence[Any],
+    process_chunk: Callable[[List[Any]], Awaitable[Any]],
+    sizer: ChunkSizer,
+    output_tokens: Callable[[Any], int],
+    max_concurrency: int = 4,
+    on_outcome: Optional[Callable[[List[Any], Union[Any, Exception]], Awaitable[None]]] = None,
+) -> List[ChunkOutcome]:
+    """
+    Runs `process_chunk` over `items` in chunks sized by `sizer`, at most
+    `max_concurrency` at a time. Each chunk is sized when a slot frees up,
+    so later chunks use what earlier responses taught the sizer.
+
+    A chunk failing with ChunkOutputError is split in half and both halves
+    are retried, down to single items. Every item ends up in exactly one
+    returned (chunk, result) pair, in input order; the result is the
+    exception for chunks that could not be processed. `on_outcome` is
+    awaited as each pair becomes final.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    outcomes: List[Tuple[int, List[Any], Union[Any, Exception]]] = []
+
+    async def finish(start: int, chunk: List[Any], result: Union[Any, Exception]) -> None:
+        outcomes.append((start, chunk, result))
+        if on_outcome:
+            await on_outcome(chunk, result)
+
+    async def handle(start: int, chunk: List[Any], holding_slot: bool = False) -> None:
+        if not holding_slot:
+            await semaphore.acquire()
+        try:
+            result = await process_chunk(chunk)
+        except ChunkOutputError as e:
+            semaphore.release()
+            sizer.record_failure(len(chunk), truncated=e.truncated)
+            if len(chunk) == 1:
+                logger.error(f"Giving up on a single card after: {e}")
+                await finish(start, chunk, e)
+                return
+            mid = len(chunk) // 2
+            await asyncio.gather(handle(start, chunk[:mid]), handle(start + mid, chunk[mid:]))
+            return
+        except Exception as e:
+            semaphore.release()
+            logger.error(f"Chunk of {len(chunk)} cards failed: {e}")
+            await finish(start, chunk, e)
+            return
+        semaphore.release()
+        sizer.record_success(len(chunk), output_tokens(result))
+        await finish(start, chunk, result)
+
+    tasks = []
+    cursor = 0
+    while cursor < len(items):
+        await semaphore.acquire()
+        chunk = list(items[cursor : cursor + sizer.size])
+        tasks.append(asyncio.create_task(handle(cursor, chunk, holding_slot=True)))
+        cursor += len(chunk)
+    await asyncio.gather(*tasks)
+    outcomes.sort(key=lambda o: o[0])
+    return [(chunk, result) for _, chunk, result in outcomes]
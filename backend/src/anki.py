@@ -1,70 +1,404 @@
 # src/anki.py
 
+import asyncio
+import json
+import time
 import httpx
 import logging
-from typing import List, Dict, Any
-from httpx import ConnectError
+from typing import Awaitable, Callable, List, Dict, Any, Optional
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+from src import offload
+from src.metrics import ANKI_METHOD_DURATION, ANKI_REQUEST_DURATION, ERRORS, UPSTREAM_CALLS
 
 logger = logging.getLogger(__name__)
 
+ANKI_NOT_RUNNING_ERROR = "Anki is not running. Please launch Anki and ensure AnkiConnect is enabled."
+
+# Actions that are safe to repeat if a response is lost. Anything else (addNote
+# in particular) is only retried when the request provably never reached Anki.
+IDEMPOTENT_ACTIONS = {
+    "version",
+    "deckNames",
+    "findNotes",
+    "notesInfo",
+    "notesModTime",
+    "updateNoteModel",
+    "setSpecificValueOfCard",
+}
+
+
+class AnkiUnavailableError(Exception):
+    """Raised without contacting AnkiConnect while the circuit breaker is open."""
+
+
+def _is_idempotent(payload: Dict[str, Any]) -> bool:
+    action = payload.get("action")
+    if action == "multi":
+        return all(_is_idempotent(a) for a in payload.get("params", {}).get("actions", []))
+    return action in IDEMPOTENT_ACTIONS
+
+
+def _is_retryable(exc: BaseException, idempotent: bool) -> bool:
+    if isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        # The request was never sent, so even addNote cannot be duplicated
+        return True
+    if isinstance(exc, httpx.TransportError):
+        return idempotent
+    if isinstance(exc, httpx.HTTPStatusError):
+        return idempotent and exc.response.status_code >= 500
+    return False
+
+
+def _to_html(value):
+    # Ensure line breaks render in Anki by converting to <br>
+    return value.replace("\n", "<br>") if isinstance(value, str) else value
+
+
+def _build_cloze_note(deck_name: str, front: str, back: str) -> Dict[str, Any]:
+    return {
+        "deckName": deck_name,
+        "modelName": "Cloze",
+        "fields": {"Front": _to_html(front), "Back": _to_html(back)},
+        "options": {
+            "allowDuplicate": False,
+            "duplicateScopeOptions": {
+                "deckName": deck_name,
+                "checkChildren": True,
+                "checkAllModels": True,
+            },
+        },
+        "tags": [],
+    }
+
+
+class AnkiHealth:
+    """
+    Shared liveness state for AnkiConnect.
+
+    The last probe result is cached for `ttl` seconds. A stale "up" result is
+    returned immediately while a refresh runs in the background; a stale "down"
+    (or unknown) result waits for a fresh probe. Concurrent callers share one
+    in-flight probe.
+    """
+
+    def __init__(self, probe: Callable[[], Awaitable[bool]], ttl: float = 5.0):
+        self._probe = probe
+        self.ttl = ttl
+        self._alive: Optional[bool] = None
+        self._checked_at = 0.0
+        self._inflight: Optional[asyncio.Task] = None
+
+    def _is_fresh(self) -> bool:
+        return self._alive is not None and time.monotonic() - self._checked_at < self.ttl
+
+    def _set(self, alive: bool) -> None:
+        self._alive = alive
+        self._checked_at = time.monotonic()
+
+    def mark_up(self) -> None:
+        self._set(True)
+
+    def mark_down(self) -> None:
+        if self._alive is not False:
+            logger.error("AnkiConnect is unreachable, marking Anki as down")
+        self._set(False)
+
+    async def _run_probe(self) -> bool:
+        try:
+            alive = await self._probe()
+        except Exception as e:
+            logger.error(f"AnkiConnect probe error: {e}")
+            alive = False
+        self._set(alive)
+        return alive
+
+    def _start_probe(self) -> asyncio.Task:
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.ensure_future(self._run_probe())
+        return self._inflight
+
+    async def is_alive(self) -> bool:
+        if self._is_fresh():
+            return self._alive
+        if self._alive:
+            # Serve the last known good state and refresh in the background
+            self._start_probe()
+            return True
+        return await asyncio.shield(self._start_probe())
+
+
+class CircuitBreaker:
+    """
+    Fails AnkiConnect calls fast after repeated transport errors.
+
+    After `failure_threshold` consecutive failures the circuit opens and calls
+    are rejected for `reset_timeout` seconds. Then a single trial call is let
+    through (half-open): success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._trial or time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        if self._opened_at is None:
+            return True
+        if not self._trial and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._trial = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        if self._opened_at is not None:
+            logger.info("AnkiConnect circuit closed")
+        self.failures = 0
+        self._opened_at = None
+        self._trial = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._trial or (self._opened_at is None and self.failures >= self.failure_threshold):
+            logger.error(f"AnkiConnect circuit open after {self.failures} consecutive failures")
+            self._opened_at = time.monotonic()
+            self._trial = False
+
+    def release_trial(self) -> None:
+        """Gives up a half-open trial that ended without an outcome (e.g. cancelled), so another call can try."""
+        self._trial = False
+
+
 class AnkiService:
-    def __init__(self, base_url: str):
-        self.client = httpx.AsyncClient(base_url=base_url)
+    def __init__(
+        self,
+        base_url: str,
+        batch_size: int = 50,
+        health_ttl: float = 5.0,
+        timeout: float = 5.0,
+        connect_timeout: float = 2.0,
+        max_connections: int = 10,
+        max_keepalive_connections: int = 5,
+        keepalive_expiry: float = 5.0,
+        retry_attempts: int = 3,
+        retry_max_wait: float = 2.0,
+        breaker_threshold: int = 5,
+        breaker_reset: float = 10.0,
+    ):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        # Created by open(), normally from the app lifespan
+        self.client: Optional[httpx.AsyncClient] = None
+        self.batch_size = batch_size
+        self.retry_attempts = retry_attempts
+        self.retry_max_wait = retry_max_wait
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        self.health = AnkiHealth(self._probe_version, ttl=health_ttl)
 
-    async def is_anki_running(self) -> bool:
+    def open(self) -> httpx.AsyncClient:
+        """Creates the connection pool if it does not exist yet and returns it."""
+        if self.client is None:
+            # AnkiConnect speaks plain HTTP/1.1, so there is no HTTP/2 to negotiate
+            self.client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                limits=self.limits,
+            )
+        return self.client
+
+    async def aclose(self) -> None:
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def _probe_version(self) -> bool:
         try:
-            response = await self.client.post(
-                "/", json={"action": "version", "version": 6}, timeout=5.0
+            response = await self.open().post(
+                "/", json={"action": "version", "version": 6}
             )
+            UPSTREAM_CALLS.inc(service="anki", operation="version", outcome="ok")
             return response.status_code == 200
         except httpx.RequestError:
+            UPSTREAM_CALLS.inc(service="anki", operation="version", outcome="error")
             logger.error("Launch Anki!!!")
             return False
 
+    async def is_anki_running(self) -> bool:
+        if self.breaker.state == "open":
+            return False
+        return await self.health.is_alive()
+
+    async def _post(self, payload: Dict[str, Any], timeout: Optional[float] = None) -> httpx.Response:
+        """
+        POST to AnkiConnect with retries and the circuit breaker.
+
+        Connection failures are retried for every action; lost responses and
+        5xx errors only for idempotent ones, so a note is never added twice.
+        """
+        idempotent = _is_idempotent(payload)
+        retrying = AsyncRetrying(
+            stop=stop_after_attempt(self.retry_attempts),
+            wait=wait_random_exponential(multiplier=0.2, max=self.retry_max_wait),
+            retry=retry_if_exception(lambda e: _is_retryable(e, idempotent)),
+            before_sleep=lambda rs: logger.warning(
+                f"Retrying AnkiConnect {payload.get('action')} after "
+                f"{type(rs.outcome.exception()).__name__} (attempt {rs.attempt_number})"
+            ),
+            reraise=True,
+        )
+        async for attempt in retrying:
+            with attempt:
+                response = await self._post_once(payload, timeout)
+        return response
+
+    async def _post_once(self, payload: Dict[str, Any], timeout: Optional[float]) -> httpx.Response:
+        """Single POST, keeping the health state and circuit breaker in sync with the outcome."""
+        action = payload.get("action", "")
+        if not self.breaker.allow():
+            UPSTREAM_CALLS.inc(service="anki", operation=action, outcome="rejected")
+            raise AnkiUnavailableError(ANKI_NOT_RUNNING_ERROR)
+        kwargs = {}
+        if timeout is not None:
+            kwargs["timeout"] = httpx.Timeout(timeout, connect=self.connect_timeout)
+        start = time.perf_counter()
+        settled = False
+        try:
+            response = await self.open().post("/", json=payload, **kwargs)
+            if response.status_code >= 500:
+                response.raise_for_status()
+        except Exception as e:
+            ANKI_REQUEST_DURATION.observe(time.perf_counter() - start, action=action)
+            UPSTREAM_CALLS.inc(service="anki", operation=action, outcome="error")
+            ERRORS.inc(stage="anki", type=type(e).__name__)
+            if isinstance(e, (httpx.TransportError, httpx.HTTPStatusError)):
+                self.breaker.record_failure()
+                settled = True
+            if isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout)):
+                self.health.mark_down()
+            raise
+        else:
+            ANKI_REQUEST_DURATION.observe(time.perf_counter() - start, action=action)
+            UPSTREAM_CALLS.inc(service="anki", operation=action, outcome="ok")
+            self.breaker.record_success()
+            settled = True
+            self.health.mark_up()
+            return response
+        finally:
+            # Cancelled or failed for a reason that says nothing about Anki: free a half-open
+            # trial, or every later call would be rejected
+            if not settled:
+                self.breaker.release_trial()
+
+    @ANKI_METHOD_DURATION.timed(method="add_card")
     async def add_card(self, deck_name: str, front: str, back: str) -> Dict[str, Any]:
         """Adds a new note in Anki using Cloze model with fields 'Front' and 'Back'."""
         if not await self.is_anki_running():
             return {
                 "success": False,
-                "error": "Anki is not running. Please launch Anki and ensure AnkiConnect is enabled.",
+                "error": ANKI_NOT_RUNNING_ERROR,
             }
-        # Ensure line breaks render in Anki by converting to <br>
-        front_html = front.replace("\n", "<br>") if isinstance(front, str) else front
-        back_html = back.replace("\n", "<br>") if isinstance(back, str) else back
         payload = {
             "action": "addNote",
             "version": 6,
-            "params": {
-                "note": {
-                    "deckName": deck_name,
-                    "modelName": "Cloze",
-                    "fields": {"Front": front_html, "Back": back_html},
-                    "options": {
-                        "allowDuplicate": False,
-                        "duplicateScopeOptions": {
-                            "deckName": deck_name,
-                            "checkChildren": True,
-                            "checkAllModels": True,
-                        },
-                    },
-                    "tags": [],
-                }
-            },
+            "params": {"note": _build_cloze_note(deck_name, front, back)},
         }
-        logger.info(payload)
+        logger.debug("addNote payload: %s", payload)
         try:
-            response = await self.client.post("/", json=payload, timeout=5.0)
+            response = await self._post(payload)
             response.raise_for_status()
             response_json = response.json()
             if response_json.get("error"):
                 logger.error(f"Error adding card: {response_json['error']}")
                 return {"success": False, "error": response_json["error"]}
-            logger.info(f"Added card: {front} - {back}")
+            logger.debug("Added card: %s - %s", front, back)
             return {"success": True, "noteId": response_json["result"]}
         except Exception as e:
             logger.error(f"Add card error: {e}")
             return {"success": False, "error": str(e)}
 
+    @ANKI_METHOD_DURATION.timed(method="add_cards_bulk")
+    async def add_cards_bulk(
+        self, deck_name: str, cards: List[Dict[str, str]], batch_size: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Adds many Cloze notes using one AnkiConnect 'multi' request per batch.
+        `cards` is a list of {"Front", "Back"} dicts. Returns one result per card,
+        in the same order, shaped like add_card's: {"success", "noteId"} or {"success", "error"}.
+        """
+        if not cards:
+            return []
+        if not await self.is_anki_running():
+            return [{"success": False, "error": ANKI_NOT_RUNNING_ERROR} for _ in cards]
+
+        batch_size = batch_size or self.batch_size
+        results: List[Dict[str, Any]] = []
+        for i in range(0, len(cards), batch_size):
+            batch = cards[i : i + batch_size]
+            payload = {
+                "action": "multi",
+                "version": 6,
+                "params": {
+                    "actions": [
+                        {
+                            "action": "addNote",
+                            "version": 6,
+                            "params": {
+                                "note": _build_cloze_note(
+                                    deck_name, card.get("Front", ""), card.get("Back", "")
+                                )
+                            },
+                        }
+                        for card in batch
+                    ]
+                },
+            }
+            logger.info(f"Adding {len(batch)} cards to deck '{deck_name}' in one request")
+            try:
+                response = await self._post(payload, timeout=self.timeout + 0.1 * len(batch))
+                response.raise_for_status()
+                response_json = response.json()
+                if response_json.get("error"):
+                    logger.error(f"Error adding cards: {response_json['error']}")
+                    results.extend({"success": False, "error": response_json["error"]} for _ in batch)
+                    continue
+                action_results = response_json.get("result") or []
+            except Exception as e:
+                logger.error(f"Add cards bulk error: {e}")
+                results.extend({"success": False, "error": str(e)} for _ in batch)
+                continue
+
+            for idx, card in enumerate(batch):
+                item = action_results[idx] if idx < len(action_results) else None
+                # Each multi entry is {"result": ..., "error": ...} for version 6 actions
+                if isinstance(item, dict) and "error" in item:
+                    error, note_id = item.get("error"), item.get("result")
+                else:
+                    error, note_id = None, item
+                if error or note_id is None:
+                    error = error or "No result returned by AnkiConnect"
+                    logger.error(f"Error adding card: {error}")
+                    results.append({"success": False, "error": error})
+                else:
+                    logger.debug("Added card: %s - %s", card.get("Front"), card.get("Back"))
+                    results.append({"success": True, "noteId": note_id})
+        return results
+
+    @ANKI_METHOD_DURATION.timed(method="update_card")
     async def update_card(self, note_id: int, front: str, back: str) -> Dict[str, Any]:
         """
         Updates an existing note's fields 'Front' and 'Back'.
@@ -73,13 +407,10 @@ class AnkiService:
         if not await self.is_anki_running():
             return {
                 "success": False,
-                "error": "Anki is not running. Please launch Anki and ensure AnkiConnect is enabled.",
+                "error": ANKI_NOT_RUNNING_ERROR,
             }
 
-        # Ensure line breaks render in Anki by converting to <br>
-        front_html = front.replace("\n", "<br>") if isinstance(front, str) else front
-        back_html = back.replace("\n", "<br>") if isinstance(back, str) else back
-        update_fields = {"Front": front_html, "Back": back_html}
+        update_fields = {"Front": _to_html(front), "Back": _to_html(back)}
 
         payload = {
             "action": "updateNoteModel",
@@ -93,24 +424,87 @@ class AnkiService:
             }
         }
         try:
-            response = await self.client.post("/", json=payload, timeout=5.0)
+            response = await self._post(payload)
             response.raise_for_status()
             response_json = response.json()
             if response_json.get("error"):
                 logger.error(f"Error updating card: {response_json['error']}")
                 return {"success": False, "error": response_json["error"]}
-            logger.info(f"Updated card noteId={note_id}: {front} - {back}")
+            logger.debug("Updated card noteId=%s: %s - %s", note_id, front, back)
             return {"success": True}
         except Exception as e:
             logger.error(f"Update card error: {e}")
             return {"success": False, "error": str(e)}
         
+    @ANKI_METHOD_DURATION.timed(method="update_cards_bulk")
+    async def update_cards_bulk(
+        self, updates: List[Dict[str, Any]], batch_size: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Updates many notes using one AnkiConnect 'multi' request per batch.
+        `updates` is a list of {"noteId", "Front", "Back"} dicts. Returns one
+        {"success"} or {"success", "error"} result per update, in order.
+        """
+        if not updates:
+            return []
+        if not await self.is_anki_running():
+            return [{"success": False, "error": ANKI_NOT_RUNNING_ERROR} for _ in updates]
+
+        batch_size = batch_size or self.batch_size
+        results: List[Dict[str, Any]] = []
+        for i in range(0, len(updates), batch_size):
+            batch = updates[i : i + batch_size]
+            payload = {
+                "action": "multi",
+                "version": 6,
+                "params": {
+                    "actions": [
+                        {
+                            "action": "updateNoteModel",
+                            "version": 6,
+                            "params": {
+                                "note": {
+                                    "id": u["noteId"],
+                                    "fields": {"Front": _to_html(u["Front"]), "Back": _to_html(u["Back"])},
+                                    "modelName": "Cloze",
+                                }
+                            },
+                        }
+                        for u in batch
+                    ]
+                },
+            }
+            try:
+                response = await self._post(payload, timeout=self.timeout + 0.05 * len(batch))
+                response.raise_for_status()
+                response_json = response.json()
+                if response_json.get("error"):
+                    logger.error(f"Error updating cards: {response_json['error']}")
+                    results.extend({"success": False, "error": response_json["error"]} for _ in batch)
+                    continue
+                action_results = response_json.get("result") or []
+            except Exception as e:
+                logger.error(f"Update cards bulk error: {e}")
+                results.extend({"success": False, "error": str(e)} for _ in batch)
+                continue
+
+            for idx in range(len(batch)):
+                item = action_results[idx] if idx < len(action_results) else None
+                if isinstance(item, dict) and item.get("error"):
+                    results.append({"success": False, "error": item["error"]})
+                elif idx >= len(action_results):
+                    results.append({"success": False, "error": "No result returned by AnkiConnect"})
+                else:
+                    results.append({"success": True})
+        return results
+
+    @ANKI_METHOD_DURATION.timed(method="get_cards_red")
     async def get_cards_red(self, deck_name: str) -> List[int]:
         """
         Returns card IDs that have a red flag in the given deck.
         """
         if not await self.is_anki_running():
-            print("Anki is not running")
+            logger.error("Anki is not running")
             return []
         payload = {
             "action": "findNotes",
@@ -118,20 +512,72 @@ class AnkiService:
             "params": {"query": f"deck:\"{deck_name}\" flag:1"},
         }
         try:
-            response = await self.client.post("/", json=payload, timeout=5.0)
+            response = await self._post(payload)
             response.raise_for_status()
             response_json = response.json()
-            logger.info(response_json)
+            logger.debug("findNotes response: %s", response_json)
 
             if response_json.get("error"):
                 logger.error(f"Error fetching red card IDs: {response_json['error']}")
                 return []
-            logger.info(f"Got {len(response_json)} red cards")
+            logger.info(f"Got {len(response_json.get('result') or [])} red cards")
             return response_json.get("result", [])
         except Exception as e:
             logger.error(f"get_cards_red error: {e}")
             return []
 
+    @ANKI_METHOD_DURATION.timed(method="find_notes")
+    async def find_notes(self, query: str) -> Optional[List[int]]:
+        """
+        Returns note IDs matching an Anki search query, or None if the search failed.
+        """
+        if not await self.is_anki_running():
+            return None
+        payload = {
+            "action": "findNotes",
+            "version": 6,
+            "params": {"query": query},
+        }
+        try:
+            response = await self._post(payload)
+            response.raise_for_status()
+            response_json = response.json()
+            if response_json.get("error"):
+                logger.error(f"Error finding notes: {response_json['error']}")
+                return None
+            return response_json.get("result", [])
+        except Exception as e:
+            logger.error(f"find_notes error: {e}")
+            return None
+
+    @ANKI_METHOD_DURATION.timed(method="notes_mod_time")
+    async def notes_mod_time(self, note_ids: List[int]) -> Optional[Dict[int, int]]:
+        """
+        Returns {noteId: mod} for the given notes without their fields, or None
+        if the request failed (e.g. an AnkiConnect without notesModTime).
+        """
+        if not await self.is_anki_running():
+            return None
+        if not note_ids:
+            return {}
+        payload = {
+            "action": "notesModTime",
+            "version": 6,
+            "params": {"notes": note_ids},
+        }
+        try:
+            response = await self._post(payload)
+            response.raise_for_status()
+            response_json = response.json()
+            if response_json.get("error"):
+                logger.error(f"Error in notesModTime: {response_json['error']}")
+                return None
+            return {item["noteId"]: item["mod"] for item in response_json.get("result") or []}
+        except Exception as e:
+            logger.error(f"notes_mod_time error: {e}")
+            return None
+
+    @ANKI_METHOD_DURATION.timed(method="cards_info")
     async def cards_info(self, card_ids: List[int]) -> List[Dict[str, Any]]:
         """
         Utility to retrieve detailed card info for a list of card IDs.
@@ -144,9 +590,10 @@ class AnkiService:
             "params": {"notes": card_ids},
         }
         try:
-            resp = await self.client.post("/", json=payload, timeout=5.0)
+            resp = await self._post(payload)
             resp.raise_for_status()
-            data = resp.json()
+            # notesInfo of a whole deck runs to megabytes; decode it off the event loop
+            data = await offload.run(json.loads, resp.content, size=len(resp.content))
             if data.get("error"):
                 logger.error(f"Error in cardsInfo: {data['error']}")
                 return []
@@ -157,6 +604,7 @@ class AnkiService:
         
     # In src/anki.py
 
+    @ANKI_METHOD_DURATION.timed(method="delete_note")
     async def delete_note(self, note_id: int) -> Dict[str, Any]:
         """
         Deletes a single note by its note ID.
@@ -165,7 +613,7 @@ class AnkiService:
         if not await self.is_anki_running():
             return {
                 "success": False,
-                "error": "Anki is not running. Please launch Anki and ensure AnkiConnect is enabled.",
+                "error": ANKI_NOT_RUNNING_ERROR,
             }
         payload = {
             "action": "deleteNotes",
@@ -175,7 +623,31 @@ class AnkiService:
             }
         }
         try:
-            resp = await self.client.post("/", json=payload, timeout=5.0)
+            resp = await self._post(payload)
+            resp.raise_for_status()
+            data = resp.json()
+            if data.get("error"):
+                return {"success": False, "error": data["error"]}
+            return {"success": True}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    @ANKI_METHOD_DURATION.timed(method="delete_notes")
+    async def delete_notes(self, note_ids: List[int]) -> Dict[str, Any]:
+        """
+        Deletes many notes in one request.
+        Returns {"success": True} or {"success": False, "error": "..."} for the whole call.
+        """
+        if not note_ids:
+            return {"success": True}
+        if not await self.is_anki_running():
+            return {
+                "success": False,
+                "error": ANKI_NOT_RUNNING_ERROR,
+            }
+        payload = {"action": "deleteNotes", "version": 6, "params": {"notes": list(note_ids)}}
+        try:
+            resp = await self._post(payload)
             resp.raise_for_status()
             data = resp.json()
             if data.get("error"):
@@ -184,15 +656,16 @@ class AnkiService:
         except Exception as e:
             return {"success": False, "error": str(e)}
 
+    @ANKI_METHOD_DURATION.timed(method="get_decks")
     async def get_decks(self) -> Dict[str, Any]:
         if not await self.is_anki_running():
             return {
                 "success": False,
-                "error": "Anki is not running. Please launch Anki and ensure AnkiConnect is enabled.",
+                "error": ANKI_NOT_RUNNING_ERROR,
             }
         payload = {"action": "deckNames", "version": 6}
         try:
-            response = await self.client.post("/", json=payload, timeout=5.0)
+            response = await self._post(payload)
             response.raise_for_status()
             response_json = response.json()
             if response_json.get("error"):
@@ -203,36 +676,40 @@ class AnkiService:
             logger.error(f"get_decks error: {e}")
             return {"success": False, "error": str(e)}
         
-    async def set_note_cards_flag_yellow(self, note_id: int) -> Dict[str, Any]:
+    @ANKI_METHOD_DURATION.timed(method="set_flags_bulk")
+    async def set_flags_bulk(self, note_ids: List[int], flag: int) -> Dict[str, Any]:
         """
-        From the note info, gather all card IDs for this note
-        and set their flags to 2 (yellow/orange).
-        
+        Sets the flag of every card belonging to `note_ids`.
+        Card IDs are resolved with a single 'notesInfo' call, then all flags are
+        set in one 'multi' request of 'setSpecificValueOfCard' actions.
+
         Returns a dict like:
         {
         "success": bool,
-        "details": [ 
-            { "cardId": 1234, "changed": True/False, "error": "..." }, 
+        "details": [
+            { "noteId": 1, "cardId": 1234, "changed": True/False, "error": "..." },
             ...
         ]
         }
         """
+        if not note_ids:
+            return {"success": False, "error": "No notes to flag", "details": []}
         if not await self.is_anki_running():
             return {
                 "success": False,
-                "error": "Anki is not running. Please launch Anki and ensure AnkiConnect is enabled.",
+                "error": ANKI_NOT_RUNNING_ERROR,
             }
 
-        # 1) Get the cards for this note using 'notesInfo'
+        # 1) Get the cards for all notes using one 'notesInfo'
         payload_notes_info = {
             "action": "notesInfo",
             "version": 6,
             "params": {
-                "notes": [note_id]
+                "notes": list(note_ids)
             }
         }
         try:
-            resp = await self.client.post("/", json=payload_notes_info, timeout=5.0)
+            resp = await self._post(payload_notes_info)
             resp.raise_for_status()
             data = resp.json()
             if data.get("error"):
@@ -242,14 +719,6 @@ class AnkiService:
                     "details": []
                 }
             notes_result = data.get("result", [])
-            if not notes_result:
-                return {
-                    "success": False,
-                    "error": f"No note found with note_id={note_id}",
-                    "details": []
-                }
-            # notes_result[0] should be the note data
-            cards_list = notes_result[0].get("cards", [])
         except Exception as e:
             return {
                 "success": False,
@@ -257,43 +726,61 @@ class AnkiService:
                 "details": []
             }
 
-        # 2) For each card, set flags=2 with 'setSpecificValueOfCard'
-        results = []
-        for card_id in cards_list:
-            payload_flag = {
-                "action": "setSpecificValueOfCard",
-                "version": 6,
-                "params": {
-                    "card": card_id,
-                    "keys": ["flags"],       # We only want to change "flags"
-                    "newValues": [2],      # 2 => "orange/yellow"
-                    "warning_check": True    # Required for changing these DB values
-                }
+        targets = []  # (note_id, card_id)
+        for note in notes_result:
+            # notesInfo returns {} for unknown note IDs
+            if not note:
+                continue
+            for card_id in note.get("cards", []):
+                targets.append((note.get("noteId"), card_id))
+        if not targets:
+            return {
+                "success": False,
+                "error": f"No cards found for note_ids={list(note_ids)}",
+                "details": []
             }
-            try:
-                resp_flag = await self.client.post("/", json=payload_flag, timeout=5.0)
-                resp_flag.raise_for_status()
-                data_flag = resp_flag.json()
-                if data_flag.get("error"):
-                    results.append({
-                        "cardId": card_id,
-                        "changed": False,
-                        "error": data_flag["error"]
-                    })
-                else:
-                    # data_flag["result"] is typically [true or false] for each item
-                    # but we can assume success = all true if no error
-                    results.append({
-                        "cardId": card_id,
-                        "changed": True,
-                        "error": None
-                    })
-            except Exception as e:
-                results.append({
-                    "cardId": card_id,
-                    "changed": False,
-                    "error": str(e)
-                })
+
+        # 2) Set flags for every card in one 'multi' request
+        payload_flags = {
+            "action": "multi",
+            "version": 6,
+            "params": {
+                "actions": [
+                    {
+                        "action": "setSpecificValueOfCard",
+                        "version": 6,
+                        "params": {
+                            "card": card_id,
+                            "keys": ["flags"],       # We only want to change "flags"
+                            "newValues": [flag],
+                            "warning_check": True    # Required for changing these DB values
+                        }
+                    }
+                    for _, card_id in targets
+                ]
+            }
+        }
+        results = []
+        try:
+            resp_flags = await self._post(payload_flags, timeout=self.timeout + 0.05 * len(targets))
+            resp_flags.raise_for_status()
+            data_flags = resp_flags.json()
+            if data_flags.get("error"):
+                action_results = [{"error": data_flags["error"]}] * len(targets)
+            else:
+                action_results = data_flags.get("result") or []
+        except Exception as e:
+            action_results = [{"error": str(e)}] * len(targets)
+
+        for idx, (note_id, card_id) in enumerate(targets):
+            item = action_results[idx] if idx < len(action_results) else {"error": "No result returned by AnkiConnect"}
+            error = item.get("error") if isinstance(item, dict) else None
+            results.append({
+                "noteId": note_id,
+                "cardId": card_id,
+                "changed": not error,
+                "error": error
+            })
 
         # If any card changed successfully, success=True
         any_changed = any(r["changed"] for r in results)
@@ -301,3 +788,10 @@ class AnkiService:
             "success": any_changed,
             "details": results
         }
+
+    async def set_note_cards_flag_yellow(self, note_id: int) -> Dict[str, Any]:
+        """
+        Sets the flags of all cards of this note to 2 (yellow/orange).
+        See set_flags_bulk for the returned dict; timed as set_flags_bulk.
+        """
+        return await self.set_flags_bulk([note_id], 2)
@@ -0,0 +1,253 @@
+# src/batch.py
+
+import asyncio
+import json
+import logging
+import os
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Batch statuses after which no more output will appear
+FINISHED_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def parse_batch_output(text: str) -> Dict[str, Dict[str, Any]]:
+    """Maps custom_id to response body for the successful lines of a batch output JSONL file."""
+    results = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        response = item.get("response") or {}
+        if item.get("error") or response.get("status_code") != 200:
+            logger.warning(f"Batch request {item.get('custom_id')} failed: {item.get('error') or response}")
+            continue
+        results[item["custom_id"]] = response.get("body") or {}
+    return results
+
+
+class BatchBackend:
+    """Runs a JSONL file of Responses API requests offline."""
+
+    async def submit(self, path: str) -> str:
+        """Submits the request file and returns a batch id."""
+        raise NotImplementedError
+
+    async def status(self, batch_id: str) -> str:
+        """Returns the Batch API status, e.g. "in_progress" or one of FINISHED_STATUSES."""
+        raise NotImplementedError
+
+    async def results(self, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        """Returns custom_id -> response body for the requests that succeeded so far."""
+        raise NotImplementedError
+
+
+class OpenAIBatchBackend(BatchBackend):
+    """
+    OpenAI Batch API: half-price requests completed within `completion_window`.
+
+    Takes a function returning the AsyncOpenAI client, so the client is only
+    created once a batch is actually used.
+    """
+
+    def __init__(self, get_client: Callable[[], Any], endpoint: str = "/v1/responses", completion_window: str = "24h"):
+        self.get_client = get_client
+        self.endpoint = endpoint
+        self.completion_window = completion_window
+
+    @property
+    def client(self):
+        return self.get_client()
+
+    async def submit(self, path: str) -> str:
+        with open(path, "rb") as f:
+            uploaded = await self.client.files.create(file=f, purpose="batch")
+        batch = await self.client.batches.create(
+            input_file_id=uploaded.id, endpoint=self.endpoint, completion_window=self.completion_window
+        )
+        return batch.id
+
+    async def status(self, batch_id: str) -> str:
+        batch = await self.client.batches.retrieve(batch_id)
+        return batch.status
+
+    async def results(self, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        batch = await self.client.batches.retrieve(batch_id)
+        if not batch.output_file_id:
+            return {}
+        content = await self.client.files.content(batch.output_file_id)
+        return parse_batch_output(content.text)
+
+
+class LocalBatchBackend(BatchBackend):
+    """
+    File-based stand-in for the Batch API, for tests and offline development.
+
+    Each submitted file is copied into `directory` and its lines are answered
+    by `respond(body)` in a background task; the output JSONL appears next to
+    it once every line is done. A batch interrupted by a restart is picked up
+    again on the next status check.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        respond: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+        concurrency: int = 4,
+    ):
+        self.directory = directory
+        self.respond = respond
+        self.concurrency = concurrency
+        self._tasks: Dict[str, asyncio.Task] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, batch_id: str, kind: str) -> str:
+        return os.path.join(self.directory, f"{batch_id}.{kind}.jsonl")
+
+    async def submit(self, path: str) -> str:
+        batch_id = f"local-{uuid.uuid4().hex}"
+        with open(path, "rb") as src, open(self._path(batch_id, "input"), "wb") as dst:
+            dst.write(src.read())
+        self._start(batch_id)
+        return batch_id
+
+    def _start(self, batch_id: str) -> None:
+        task = self._tasks.get(batch_id)
+        if task is None or task.done():
+            self._tasks[batch_id] = asyncio.create_task(self._run(batch_id))
+
+    async def _answer(self, line: Dict[str, Any], semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                body = await self.respond(line["body"])
+            except Exception as e:
+                return {"custom_id": line["custom_id"], "response": None, "error": {"message": str(e)}}
+        return {"custom_id": line["custom_id"], "response": {"status_code": 200, "body": body}, "error": None}
+
+    async def _run(self, batch_id: str) -> None:
+        with open(self._path(batch_id, "input"), encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f if line.strip()]
+        semaphore = asyncio.Semaphore(self.concurrency)
+        answers = await asyncio.gather(*(self._answer(line, semaphore) for line in lines))
+        tmp_path = self._path(batch_id, "output") + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for answer in answers:
+                f.write(json.dumps(answer, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self._path(batch_id, "output"))
+
+    async def status(self, batch_id: str) -> str:
+        if os.path.exists(self._path(batch_id, "output")):
+            return "completed"
+        if not os.path.exists(self._path(batch_id, "input")):
+            return "failed"
+        task = self._tasks.get(batch_id)
+        if task is not None and task.done() and task.exception() is not None:
+            logger.error(f"Local batch {batch_id} failed: {task.exception()}")
+            return "failed"
+        self._start(batch_id)
+        return "in_progress"
+
+    async def results(self, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        path = self._path(batch_id, "output")
+        if not os.path.exists(path):
+            return {}
+        with open(path, encoding="utf-8") as f:
+            return parse_batch_output(f.read())
+
+
+class BatchManifest:
+    """
+    Durable progress of one offline run, stored as JSON at `path`.
+
+    `chunks` maps custom_id to the cards sent in that request; `done` holds
+    the custom_ids whose results were applied and `results` what applying
+    them returned. `batch_id` is set while a submitted batch is outstanding.
+    """
+
+    def __init__(self, path: str, data: Dict[str, Any]):
+        self.path = path
+        self.data = data
+
+    @classmethod
+    def load(cls, path: str) -> Optional["BatchManifest"]:
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return cls(path, json.load(f))
+
+    @classmethod
+    def create(cls, path: str, chunks: Dict[str, List[Dict[str, Any]]], **extra: Any) -> "BatchManifest":
+        manifest = cls(path, {**extra, "chunks": chunks, "done": [], "results": [], "batch_id": None, "rounds": 0})
+        manifest.save()
+        return manifest
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def pending(self) -> List[str]:
+        done = set(self.data["done"])
+        return [custom_id for custom_id in self.data["chunks"] if custom_id not in done]
+
+
+async def run_batch(
+    manifest: BatchManifest,
+    backend: BatchBackend,
+    build_request: Callable[[List[Dict[str, Any]]], Dict[str, Any]],
+    apply: Callable[[Dict[str, Dict[str, Any]]], Awaitable[List[Any]]],
+    poll_interval: float = 30.0,
+    max_rounds: int = 3,
+    on_status: Optional[Callable[[str, str], Awaitable[None]]] = None,
+) -> List[str]:
+    """
+    Drives `manifest` to completion and returns the custom_ids left without a result.
+
+    Pending chunks are written as one JSONL file (a line per chunk, built by
+    `build_request`) and submitted. Once the batch finishes, every returned
+    result is handed to `apply` in a single call and recorded as done.
+    Chunks missing from the output are resubmitted, up to `max_rounds`
+    batches in total. The manifest is saved after each step, so a restarted
+    run polls the outstanding batch instead of submitting it again.
+    """
+    while True:
+        if manifest.data["batch_id"] is None:
+            pending = manifest.pending()
+            if not pending or manifest.data["rounds"] >= max_rounds:
+                return pending
+            manifest.data["rounds"] += 1
+            path = f"{os.path.splitext(manifest.path)[0]}.round{manifest.data['rounds']}.jsonl"
+            with open(path, "w", encoding="utf-8") as f:
+                for custom_id in pending:
+                    line = {
+                        "custom_id": custom_id,
+                        "method": "POST",
+                        "url": "/v1/responses",
+                        "body": build_request(manifest.data["chunks"][custom_id]),
+                    }
+                    f.write(json.dumps(line, ensure_ascii=False) + "\n")
+            manifest.data["batch_id"] = await backend.submit(path)
+            manifest.save()
+            logger.info(f"Submitted batch {manifest.data['batch_id']} with {len(pending)} requests")
+
+        batch_id = manifest.data["batch_id"]
+        status = await backend.status(batch_id)
+        if on_status:
+            await on_status(batch_id, status)
+        if status not in FINISHED_STATUSES:
+            await asyncio.sleep(poll_interval)
+            continue
+
+        # Expired or cancelled batches still return whatever finished in time
+        done = set(manifest.data["done"])
+        results = {k: v for k, v in (await backend.results(batch_id)).items() if k not in done}
+        logger.info(f"Batch {batch_id} {status}: {len(results)} new results")
+        if results:
+            manifest.data["results"].extend(await apply(results))
+            manifest.data["done"].extend(results)
+        manifest.data["batch_id"] = None
+        manifest.save()
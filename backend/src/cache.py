@@ -0,0 +1,148 @@
+# src/cache.py
+
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from src.sqlite_store import connect
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(model: str, instructions: str, schema: Any, payload: Any) -> str:
+    """Content hash of everything that determines an LLM response."""
+    blob = json.dumps(
+        {"model": model, "instructions": instructions, "schema": schema, "input": payload},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier cache for LLM responses: an in-memory LRU in front of a SQLite file.
+
+    Entries older than `max_age` seconds are treated as misses and purged; the
+    disk tier is trimmed (least recently used first) once it exceeds `max_bytes`.
+    Memory hits count as uses too: their times are written with the next set.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        memory_items: int = 256,
+        max_bytes: int = 100 * 1024 * 1024,
+        max_age: float = 30 * 24 * 3600,
+    ):
+        self.path = path
+        self.memory_items = memory_items
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        # Last memory hit per key, not yet written to the disk tier
+        self._touched: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = connect(self.path)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+                " created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _remember(self, key: str, value: str, created: float) -> None:
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key: str) -> Optional[tuple]:
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if time.time() - row[1] > self.max_age:
+                db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                db.commit()
+                return None
+            db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+            db.commit()
+            return row
+
+    def _disk_set(self, key: str, value: str, created: float, touched: Dict[str, float]) -> None:
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            db = self._db()
+            db.executemany("UPDATE responses SET accessed = ? WHERE key = ?", [(t, k) for k, t in touched.items()])
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, created, created),
+            )
+            self._evict(db)
+            db.commit()
+
+    def _evict(self, db: sqlite3.Connection) -> None:
+        db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,))
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in db.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._memory.get(key)
+        if entry is not None and time.time() - entry[1] <= self.max_age:
+            self._memory.move_to_end(key)
+            self._touched[key] = time.time()
+            self.hits_memory += 1
+            return entry[0]
+        self._memory.pop(key, None)
+        try:
+            row = await asyncio.to_thread(self._disk_get, key)
+        except sqlite3.Error as e:
+            logger.error(f"Response cache read error: {e}")
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits_disk += 1
+        self._remember(key, row[0], row[1])
+        return row[0]
+
+    async def set(self, key: str, value: str) -> None:
+        created = time.time()
+        self._remember(key, value, created)
+        touched, self._touched = self._touched, {}
+        try:
+            await asyncio.to_thread(self._disk_set, key, value, created, touched)
+        except sqlite3.Error as e:
+            logger.error(f"Response cache write error: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits_memory + self.hits_disk + self.misses
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_rate": (self.hits_memory + self.hits_disk) / lookups if lookups else 0.0,
+            "memory_items": len(self._memory),
+        }
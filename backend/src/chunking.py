@@ -0,0 +1,62 @@
+# src/chunking.py
+
+import re
+from typing import List
+
+_PARAGRAPH_SPLIT = re.compile(r"\n\s*\n")
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?…])[\"')\]]*\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for English text (~4 characters per token)."""
+    return max(1, len(text) // 4)
+
+
+def _split_long(text: str, max_tokens: int) -> List[str]:
+    """Splits a paragraph into sentences, and over-long sentences into word runs."""
+    pieces = []
+    for sentence in _SENTENCE_SPLIT.split(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if estimate_tokens(sentence) <= max_tokens:
+            pieces.append(sentence)
+            continue
+        words, current = sentence.split(), []
+        for word in words:
+            if current and estimate_tokens(" ".join(current + [word])) > max_tokens:
+                pieces.append(" ".join(current))
+                current = []
+            current.append(word)
+        if current:
+            pieces.append(" ".join(current))
+    return pieces
+
+
+def split_text(text: str, max_tokens: int = 1500) -> List[str]:
+    """
+    Splits text into segments of at most ~max_tokens, breaking on paragraph
+    boundaries first and on sentence boundaries inside long paragraphs.
+    Short neighbouring paragraphs are packed into the same segment.
+    """
+    pieces = []
+    for paragraph in _PARAGRAPH_SPLIT.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) <= max_tokens:
+            pieces.append(paragraph)
+        else:
+            pieces.extend(_split_long(paragraph, max_tokens))
+
+    segments, current, current_tokens = [], [], 0
+    for piece in pieces:
+        tokens = estimate_tokens(piece)
+        if current and current_tokens + tokens > max_tokens:
+            segments.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        segments.append("\n\n".join(current))
+    return segments
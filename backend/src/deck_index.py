@@ -0,0 +1,148 @@
+# src/deck_index.py
+
+import asyncio
+import logging
+import math
+import time
+from typing import Dict, List, Optional, Set
+
+from src.anki import AnkiService
+from src.normalize import field_values, normalize_fields
+from src.utils import card_key, cloze_target
+
+logger = logging.getLogger(__name__)
+
+
+def _front_key(front: str) -> str:
+    return " ".join(front.lower().split())
+
+
+class _DeckState:
+    def __init__(self):
+        self.notes: Dict[int, tuple] = {}  # noteId -> (mod, cloze key, front key)
+        self.by_key: Dict[str, Set[int]] = {}
+        self.synced_at: Optional[float] = None
+        self.lock = asyncio.Lock()
+
+    def _link(self, key: str, note_id: int) -> None:
+        if key:
+            self.by_key.setdefault(key, set()).add(note_id)
+
+    def _unlink(self, key: str, note_id: int) -> None:
+        ids = self.by_key.get(key)
+        if ids:
+            ids.discard(note_id)
+            if not ids:
+                del self.by_key[key]
+
+    def put(self, note_id: int, mod: int, front: str) -> None:
+        self.drop(note_id)
+        entry = (mod, cloze_target(front), _front_key(front))
+        self.notes[note_id] = entry
+        self._link(entry[1], note_id)
+        self._link(entry[2], note_id)
+
+    def drop(self, note_id: int) -> None:
+        entry = self.notes.pop(note_id, None)
+        if entry:
+            self._unlink(entry[1], note_id)
+            self._unlink(entry[2], note_id)
+
+
+class DeckIndex:
+    """
+    Local mirror of each deck's notes, keyed by normalized cloze target and Front text,
+    so generated cards can be checked for duplicates without a round trip per card.
+
+    A sync lists the deck's note IDs with findNotes and fetches notesInfo only for
+    new notes and notes edited since the previous sync. 'edited:N' only resolves to
+    whole days, so its matches are narrowed with notesModTime (no field contents)
+    to the notes whose mod time differs from the mirror's.
+    """
+
+    def __init__(self, anki_service: AnkiService, sync_interval: float = 30.0, batch_size: int = 500):
+        self.anki_service = anki_service
+        self.sync_interval = sync_interval
+        self.batch_size = batch_size
+        self._decks: Dict[str, _DeckState] = {}
+
+    def _state(self, deck_name: str) -> _DeckState:
+        return self._decks.setdefault(deck_name, _DeckState())
+
+    async def sync(self, deck_name: str, force: bool = False) -> bool:
+        """Brings the deck mirror up to date. Returns False if Anki could not be queried."""
+        state = self._state(deck_name)
+        async with state.lock:
+            if not force and state.synced_at and time.time() - state.synced_at < self.sync_interval:
+                return True
+            started = time.time()
+            deck_query = f'deck:"{deck_name}"'
+            note_ids = await self.anki_service.find_notes(deck_query)
+            if note_ids is None:
+                return False
+
+            current = set(note_ids)
+            to_fetch = current - state.notes.keys()
+            if state.synced_at:
+                # 'edited:n' matches notes modified in the last n days: a coarse pre-filter
+                days = max(1, math.ceil((started - state.synced_at) / 86400))
+                edited = await self.anki_service.find_notes(f"{deck_query} edited:{days}")
+                if edited is None:
+                    return False
+                candidates = sorted(current.intersection(edited) & state.notes.keys())
+                mods = await self.anki_service.notes_mod_time(candidates)
+                if mods is None:
+                    to_fetch.update(candidates)
+                else:
+                    to_fetch.update(n for n, mod in mods.items() if state.notes[n][0] != mod)
+
+            for note_id in state.notes.keys() - current:
+                state.drop(note_id)
+
+            fetch = sorted(to_fetch)
+            for i in range(0, len(fetch), self.batch_size):
+                infos = [
+                    info
+                    for info in await self.anki_service.cards_info(fetch[i : i + self.batch_size])
+                    if info and state.notes.get(info.get("noteId"), (None,))[0] != info.get("mod", 0)
+                ]
+                # One normalization pass per batch rather than per note
+                fronts = normalize_fields(field_values(infos, "Front")).text
+                for info, front in zip(infos, fronts):
+                    state.put(info.get("noteId"), info.get("mod", 0), front)
+
+            state.synced_at = started
+            logger.info(f"Deck index '{deck_name}': {len(state.notes)} notes, fetched {len(fetch)}")
+            return True
+
+    def find_duplicate(self, deck_name: str, card: Dict[str, str]) -> Optional[int]:
+        """Returns the note ID of an existing note with the same cloze target or Front, if any."""
+        state = self._decks.get(deck_name)
+        if state is None:
+            return None
+        for key in (cloze_target(card.get("Front", "")), _front_key(card.get("Front", ""))):
+            ids = state.by_key.get(key) if key else None
+            if ids:
+                return next(iter(ids))
+        return None
+
+    def add(self, deck_name: str, note_id: int, card: Dict[str, str]) -> None:
+        """Records a note we just created, so it counts as known before the next sync."""
+        self._state(deck_name).put(note_id, 0, card.get("Front", ""))
+
+    async def split_duplicates(self, deck_name: str, cards: List[Dict[str, str]]) -> List[Optional[int]]:
+        """
+        For each card returns the note ID it duplicates (an existing note, or 0 for an
+        earlier card in the same list), or None if it is new.
+        """
+        await self.sync(deck_name)
+        seen = set()
+        duplicates: List[Optional[int]] = []
+        for card in cards:
+            key = card_key(card)
+            existing = self.find_duplicate(deck_name, card)
+            if existing is None and key in seen:
+                existing = 0
+            seen.add(key)
+            duplicates.append(existing)
+        return duplicates
@@ -0,0 +1,123 @@
+# src/image_index.py
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.images import hash_distance
+from src.sqlite_store import connect
+
+logger = logging.getLogger(__name__)
+
+
+class ImageIndex:
+    """
+    Persistent map from perceptual image hashes (see images.image_hash) to the
+    cards extracted from those images.
+
+    A lookup matches any stored image within `max_distance` bits, so a repeat
+    screenshot of the same page reuses the earlier extraction even when it was
+    resized or cropped differently. Entries carry a version (model and prompt)
+    and only match lookups with the same one.
+
+    Hashes are scanned in memory; rows written by other processes are picked
+    up on the next lookup. The oldest entries beyond `max_entries` are dropped.
+    """
+
+    def __init__(self, path: str, max_distance: int = 32, max_entries: int = 20000):
+        self.path = path
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # (row id, hash, version) of every row seen so far
+        self._entries: List[Tuple[int, str, str]] = []
+        self._last_id = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = connect(self.path)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS images ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, hash TEXT NOT NULL, version TEXT NOT NULL,"
+                " cards TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _refresh(self, db: sqlite3.Connection) -> None:
+        rows = db.execute(
+            "SELECT id, hash, version FROM images WHERE id > ? ORDER BY id", (self._last_id,)
+        ).fetchall()
+        if rows:
+            self._entries.extend(rows)
+            self._last_id = rows[-1][0]
+
+    def _lookup(self, image_hash: str, version: str) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            db = self._db()
+            self._refresh(db)
+            best = None
+            for row_id, value, entry_version in self._entries:
+                if entry_version != version or len(value) != len(image_hash):
+                    continue
+                distance = hash_distance(value, image_hash)
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, row_id)
+            if best is None:
+                return None
+            row = db.execute("SELECT cards FROM images WHERE id = ?", (best[1],)).fetchone()
+            if row is None:
+                # Trimmed by another process
+                self._entries = [e for e in self._entries if e[0] != best[1]]
+                return None
+            return json.loads(row[0])
+
+    def _add(self, image_hash: str, version: str, cards: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT INTO images (hash, version, cards, created) VALUES (?, ?, ?, ?)",
+                (image_hash, version, json.dumps(cards, ensure_ascii=False), time.time()),
+            )
+            db.execute(
+                "DELETE FROM images WHERE id <= (SELECT MAX(id) FROM images) - ?", (self.max_entries,)
+            )
+            db.commit()
+            self._refresh(db)
+            if len(self._entries) > self.max_entries:
+                self._entries = self._entries[-self.max_entries:]
+
+    async def lookup(self, image_hash: str, version: str) -> Optional[List[Dict[str, Any]]]:
+        """Cards of the closest stored near-duplicate of `image_hash`, or None."""
+        try:
+            cards = await asyncio.to_thread(self._lookup, image_hash, version)
+        except sqlite3.Error as e:
+            logger.error(f"Image index read error: {e}")
+            cards = None
+        if cards is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return cards
+
+    async def add(self, image_hash: str, version: str, cards: List[Dict[str, Any]]) -> None:
+        try:
+            await asyncio.to_thread(self._add, image_hash, version, cards)
+        except sqlite3.Error as e:
+            logger.error(f"Image index write error: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+        }
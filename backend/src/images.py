@@ -0,0 +1,199 @@
+# src/images.py
+
+import functools
+import logging
+import os
+from io import BytesIO
+from typing import List, Optional, Sequence, Tuple
+
+from src import offload
+
+logger = logging.getLogger(__name__)
+
+# Longest edge (px) kept for OCR-style extraction; larger images are downscaled
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1600"))
+# Output encoding: JPEG or WEBP
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG").upper()
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "80"))
+IMAGE_GRAYSCALE = os.getenv("IMAGE_GRAYSCALE", "false").lower() in ("1", "true", "yes")
+IMAGE_PREPROCESS = os.getenv("IMAGE_PREPROCESS", "true").lower() in ("1", "true", "yes")
+
+# Perceptual hash: a difference hash over IMAGE_HASH_SIZE x IMAGE_HASH_SIZE
+# brightness gradients (256 bits by default). Copies of one screenshot that
+# were resized, recompressed or cropped a little stay within
+# IMAGE_DEDUP_DISTANCE differing bits; different text pages measured 85+ apart.
+IMAGE_HASH_SIZE = int(os.getenv("IMAGE_HASH_SIZE", "16"))
+IMAGE_DEDUP_DISTANCE = int(os.getenv("IMAGE_DEDUP_DISTANCE", "32"))
+
+# Images sent together in one vision call: at most IMAGE_PACK_MAX_IMAGES
+# (1 disables packing) and IMAGE_PACK_PIXELS pixels in total. An image
+# larger than the budget on its own still goes alone.
+IMAGE_PACK_PIXELS = int(os.getenv("IMAGE_PACK_PIXELS", "4000000"))
+IMAGE_PACK_MAX_IMAGES = int(os.getenv("IMAGE_PACK_MAX_IMAGES", "6"))
+
+_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+def sniff_mime_type(content: bytes) -> Optional[str]:
+    """Returns the image MIME type from magic bytes, or None if not a supported image."""
+    if content.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if content.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if content[:4] == b"RIFF" and content[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def preprocess_image(
+    content: bytes,
+    max_edge: int = IMAGE_MAX_EDGE,
+    fmt: str = IMAGE_FORMAT,
+    quality: int = IMAGE_QUALITY,
+    grayscale: bool = IMAGE_GRAYSCALE,
+) -> Tuple[bytes, str]:
+    """
+    Decodes an image, downscales it so the longest edge is at most `max_edge`,
+    optionally converts it to grayscale and re-encodes it as `fmt`.
+    Returns (encoded bytes, MIME type). If the result is not smaller than the
+    input (or decoding fails), the original bytes are returned unchanged.
+    """
+    # Imported here so the server starts without loading Pillow
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    original_mime = sniff_mime_type(content) or "image/jpeg"
+    try:
+        with Image.open(BytesIO(content)) as img:
+            if max(img.size) > max_edge:
+                # JPEGs are decoded straight at the smallest 1/2, 1/4 or 1/8
+                # scale that still covers the target, not at full resolution
+                scale = max_edge / max(img.size)
+                img.draft(img.mode, (round(img.width * scale), round(img.height * scale)))
+                img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            # Rotate after downscaling; the box is square, so the result is the same
+            img = ImageOps.exif_transpose(img)
+            if grayscale:
+                img = img.convert("L")
+            elif img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            out = BytesIO()
+            img.save(out, format=fmt, quality=quality, optimize=True)
+    except (UnidentifiedImageError, OSError, ValueError) as e:
+        logger.error(f"Image preprocessing failed, sending original: {e}")
+        return content, original_mime
+
+    processed = out.getvalue()
+    if len(processed) >= len(content):
+        return content, original_mime
+    return processed, _MIME_TYPES.get(fmt, "image/jpeg")
+
+
+async def preprocess_image_async(content: bytes, **kwargs) -> Tuple[bytes, str]:
+    """
+    Runs preprocess_image in the offload thread pool so the event loop isn't
+    blocked; Pillow releases the GIL while decoding, resizing and encoding.
+    """
+    if not IMAGE_PREPROCESS:
+        return content, sniff_mime_type(content) or "image/jpeg"
+    return await offload.run(functools.partial(preprocess_image, content, **kwargs), kind="thread")
+
+
+def image_hash(content: bytes, hash_size: int = IMAGE_HASH_SIZE) -> Optional[str]:
+    """
+    Difference hash of an image as a hex string, or None if it can't be decoded.
+
+    Uniform margins (the colour of the bottom-right pixel, e.g. page background
+    or a light status bar) are trimmed first, so crops that only cut into the
+    margins hash the same.
+    """
+    from PIL import Image, ImageChops, ImageOps, UnidentifiedImageError
+
+    try:
+        with Image.open(BytesIO(content)) as img:
+            # JPEGs are decoded at a reduced scale; the hash needs only a few pixels
+            img.draft("L", (hash_size * 16, hash_size * 16))
+            gray = ImageOps.exif_transpose(img).convert("L")
+    except (UnidentifiedImageError, OSError, ValueError) as e:
+        logger.error(f"Image hashing failed: {e}")
+        return None
+
+    gray.thumbnail((hash_size * 16, hash_size * 16), Image.BOX)
+    background = Image.new("L", gray.size, gray.getpixel((gray.width - 1, gray.height - 1)))
+    box = ImageChops.difference(gray, background).point(lambda p: 255 if p > 24 else 0).getbbox()
+    if box:
+        gray = gray.crop(box)
+    pixels = gray.resize((hash_size + 1, hash_size), Image.BOX).tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{value:0{hash_size * hash_size // 4}x}"
+
+
+async def image_hash_async(content: bytes, **kwargs) -> Optional[str]:
+    """Runs image_hash in the offload thread pool."""
+    return await offload.run(functools.partial(image_hash, content, **kwargs), kind="thread")
+
+
+def hash_distance(a: str, b: str) -> int:
+    """Number of differing bits between two image hashes."""
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def near_duplicate_groups(hashes: Sequence[Optional[str]], max_distance: int = IMAGE_DEDUP_DISTANCE) -> List[List[int]]:
+    """
+    Groups indices of `hashes` whose hash is within `max_distance` of a group's
+    first member, in input order. Missing hashes always get a group of their own.
+    """
+    groups: List[List[int]] = []
+    for i, value in enumerate(hashes):
+        if value is not None:
+            for group in groups:
+                first = hashes[group[0]]
+                if first is not None and len(first) == len(value) and hash_distance(first, value) <= max_distance:
+                    group.append(i)
+                    break
+            else:
+                groups.append([i])
+        else:
+            groups.append([i])
+    return groups
+
+
+def image_pixels(content: bytes) -> Optional[int]:
+    """Width x height of an encoded image, read from its header only; None if it can't be parsed."""
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(BytesIO(content)) as img:
+            width, height = img.size
+    except (UnidentifiedImageError, OSError, ValueError):
+        return None
+    return width * height
+
+
+def pack_images(
+    pixels: Sequence[Optional[int]],
+    pixel_budget: int = IMAGE_PACK_PIXELS,
+    max_images: int = IMAGE_PACK_MAX_IMAGES,
+) -> List[List[int]]:
+    """
+    Groups image indices for packed extraction: first-fit by decreasing size,
+    so each group holds at most `max_images` images and `pixel_budget` pixels.
+    Unknown sizes count as the whole budget. Groups and their members are in
+    input order.
+    """
+    order = sorted(range(len(pixels)), key=lambda i: -(pixels[i] or pixel_budget))
+    groups: List[List[int]] = []
+    totals: List[int] = []
+    for i in order:
+        size = pixels[i] or pixel_budget
+        for g, group in enumerate(groups):
+            if len(group) < max_images and totals[g] + size <= pixel_budget:
+                group.append(i)
+                totals[g] += size
+                break
+        else:
+            groups.append([i])
+            totals.append(size)
+    return sorted((sorted(group) for group in groups), key=lambda group: group[0])
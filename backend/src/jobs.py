@@ -0,0 +1,433 @@
+# src/jobs.py
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+
+from src.sqlite_store import connect
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TERMINAL_STATUSES = (DONE, FAILED, CANCELLED)
+
+
+class JobStore:
+    """
+    SQLite persistence for jobs and their progress events.
+
+    The file is the job queue shared by every server process: a process
+    `claim`s a queued job, keeps its lease alive with `heartbeat`, and jobs
+    whose owner stopped heartbeating are handed back by `requeue_stale`.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL,"
+            " params TEXT NOT NULL, result TEXT, error TEXT,"
+            " created REAL NOT NULL, updated REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS job_events ("
+            " job_id TEXT NOT NULL, seq INTEGER NOT NULL, data TEXT NOT NULL,"
+            " PRIMARY KEY (job_id, seq));"
+        )
+        # Columns added for multi-process workers; older files get them on open
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, ddl in (
+            ("owner", "owner TEXT"),
+            ("heartbeat", "heartbeat REAL"),
+            ("cancel_requested", "cancel_requested INTEGER NOT NULL DEFAULT 0"),
+            ("checkpoint", "checkpoint TEXT"),
+        ):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {ddl}")
+        self._conn.commit()
+
+    def create(self, job_id: str, kind: str, params: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, status, params, created, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, QUEUED, json.dumps(params), now, now),
+            )
+            self._conn.commit()
+
+    def update(
+        self, job_id: str, status: str, result: Any = None, error: Optional[str] = None,
+        event: Optional[Dict[str, Any]] = None,
+    ) -> Optional[int]:
+        """Sets the job's status; with an `event`, stores it in the same transaction and returns its seq."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = COALESCE(?, result), error = ?, updated = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id),
+            )
+            seq = self._insert_event(job_id, event) if event is not None else None
+            self._conn.commit()
+        return seq
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, kind, status, params, result, error, created, updated, checkpoint FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "kind": row[1],
+            "status": row[2],
+            "params": json.loads(row[3]),
+            "result": json.loads(row[4]) if row[4] else None,
+            "error": row[5],
+            "created": row[6],
+            "updated": row[7],
+            "checkpoint": json.loads(row[8]) if row[8] else None,
+        }
+
+    def claim(self, owner: str) -> Optional[str]:
+        """Marks the oldest queued job as running under `owner` and returns its id, or None."""
+        with self._lock:
+            while True:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = ? ORDER BY created LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is None:
+                    return None
+                now = time.time()
+                # Conditional so two processes racing for the same row cannot both win
+                claimed = self._conn.execute(
+                    "UPDATE jobs SET status = ?, owner = ?, heartbeat = ?, updated = ? WHERE id = ? AND status = ?",
+                    (RUNNING, owner, now, now, row[0], QUEUED),
+                ).rowcount
+                self._conn.commit()
+                if claimed:
+                    return row[0]
+
+    def cancel_queued(self, job_id: str, event: Dict[str, Any]) -> Optional[int]:
+        """
+        Cancels a job nobody has claimed yet and stores `event` with it; returns
+        the event's seq, or None if the job is no longer queued.
+        """
+        with self._lock:
+            cancelled = self._conn.execute(
+                "UPDATE jobs SET status = ?, updated = ? WHERE id = ? AND status = ?",
+                (CANCELLED, time.time(), job_id, QUEUED),
+            ).rowcount
+            seq = self._insert_event(job_id, event) if cancelled else None
+            self._conn.commit()
+        return seq
+
+    def save_checkpoint(self, job_id: str, checkpoint: Dict[str, Any]) -> None:
+        """Stores how far a running job got; it is handed back to the handler if the job is re-queued."""
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET checkpoint = ? WHERE id = ?", (json.dumps(checkpoint), job_id))
+            self._conn.commit()
+
+    def request_cancel(self, job_id: str) -> None:
+        """Flags a job running in another process; its owner cancels it on the next heartbeat."""
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            self._conn.commit()
+
+    def heartbeat(self, owner: str, job_ids: List[str]) -> List[str]:
+        """Renews `owner`'s lease on `job_ids`; returns those flagged for cancellation."""
+        if not job_ids:
+            return []
+        marks = ", ".join("?" * len(job_ids))
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET heartbeat = ? WHERE owner = ? AND id IN ({marks})",
+                (time.time(), owner, *job_ids),
+            )
+            self._conn.commit()
+            rows = self._conn.execute(
+                f"SELECT id FROM jobs WHERE cancel_requested = 1 AND id IN ({marks})", job_ids
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def _requeue(self, where: str, params: tuple) -> List[str]:
+        # The job runs again from its checkpoint, replaying the progress the checkpoint
+        # covers. Its events are kept so seq keeps growing (a client resuming from
+        # Last-Event-ID misses nothing); a "reset" event tells clients to drop the
+        # progress they received before it.
+        with self._lock:
+            rows = self._conn.execute(f"SELECT id FROM jobs WHERE status = ? AND {where}", (RUNNING, *params)).fetchall()
+            job_ids = [r[0] for r in rows]
+            for job_id in job_ids:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, owner = NULL, heartbeat = NULL, updated = ? WHERE id = ?",
+                    (QUEUED, time.time(), job_id),
+                )
+                self._insert_event(job_id, {"type": "reset", "reason": "requeued"})
+            self._conn.commit()
+        return job_ids
+
+    def release(self, owner: str) -> List[str]:
+        """Puts `owner`'s running jobs back in the queue, e.g. when its process shuts down."""
+        return self._requeue("owner = ?", (owner,))
+
+    def requeue_stale(self, lease: float) -> List[str]:
+        """Puts back running jobs whose owner has not heartbeated for `lease` seconds."""
+        return self._requeue("(heartbeat IS NULL OR heartbeat < ?)", (time.time() - lease,))
+
+    def _insert_event(self, job_id: str, event: Dict[str, Any]) -> int:
+        seq = self._conn.execute(
+            "SELECT COALESCE(MAX(seq), 0) + 1 FROM job_events WHERE job_id = ?", (job_id,)
+        ).fetchone()[0]
+        self._conn.execute(
+            "INSERT INTO job_events (job_id, seq, data) VALUES (?, ?, ?)",
+            (job_id, seq, json.dumps(event)),
+        )
+        return seq
+
+    def add_event(self, job_id: str, event: Dict[str, Any]) -> int:
+        with self._lock:
+            seq = self._insert_event(job_id, event)
+            self._conn.commit()
+        return seq
+
+    def events_since(self, job_id: str, seq: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, seq)
+            ).fetchall()
+        return [{"seq": r[0], **json.loads(r[1])} for r in rows]
+
+
+class JobContext:
+    """
+    Handed to job handlers to report progress. `checkpoint` is what the handler
+    last saved with save_checkpoint before the job was re-queued, or None on the
+    first run.
+    """
+
+    def __init__(self, manager: "JobManager", job_id: str, checkpoint: Optional[Dict[str, Any]] = None):
+        self.manager = manager
+        self.job_id = job_id
+        self.checkpoint = checkpoint
+
+    async def emit(self, event_type: str, **data: Any) -> None:
+        await self.manager.emit(self.job_id, {"type": event_type, **data})
+
+    async def save_checkpoint(self, checkpoint: Dict[str, Any]) -> None:
+        """Persists progress the handler can resume from; `checkpoint` must not change afterwards."""
+        self.checkpoint = checkpoint
+        await asyncio.to_thread(self.manager.store.save_checkpoint, self.job_id, checkpoint)
+
+
+JobHandler = Callable[[JobContext, Dict[str, Any]], Awaitable[Any]]
+
+
+class JobManager:
+    """
+    Runs registered job kinds on a pool of asyncio workers.
+
+    Jobs and their progress events are persisted in a JobStore, which also
+    serves as the queue: any server process sharing the store may claim a
+    job, so jobs spread over every process. Running jobs hold a lease renewed
+    every `heartbeat_interval`; a job whose owner died is re-queued once the
+    lease has gone `lease` seconds without renewal, and stop() hands this
+    process's jobs back immediately.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        workers: int = 2,
+        poll_interval: float = 1.0,
+        heartbeat_interval: float = 10.0,
+        lease: float = 30.0,
+    ):
+        self.store = store
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.lease = lease
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._handlers: Dict[str, JobHandler] = {}
+        # Wakes idle workers when this process submits a job; other processes' jobs are found by polling
+        self._wakeup: "asyncio.Queue[None]" = asyncio.Queue()
+        self._worker_tasks: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        self._handlers[kind] = handler
+
+    async def start(self) -> None:
+        await self._requeue_stale()
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._worker_tasks.append(asyncio.create_task(self._heartbeat()))
+
+    async def stop(self) -> None:
+        handlers = list(self._running.values())
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        # The workers cancel their handlers; wait for them to unwind before the
+        # clients they use are closed
+        await asyncio.gather(*handlers, return_exceptions=True)
+        self._worker_tasks = []
+        for job_id in await asyncio.to_thread(self.store.release, self.owner):
+            logger.info(f"Released unfinished job {job_id}")
+
+    async def submit(self, kind: str, params: Dict[str, Any]) -> str:
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = uuid.uuid4().hex
+        await asyncio.to_thread(self.store.create, job_id, kind, params)
+        self._wakeup.put_nowait(None)
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def cancel(self, job_id: str) -> bool:
+        """Cancels a queued or running job. Returns False if it already finished."""
+        job = await self.get(job_id)
+        if job is None or job["status"] in TERMINAL_STATUSES:
+            return False
+        task = self._running.get(job_id)
+        event = {"type": "status", "status": CANCELLED, "error": None}
+        if task is not None:
+            task.cancel()
+        elif (seq := await asyncio.to_thread(self.store.cancel_queued, job_id, event)) is not None:
+            self._notify(job_id, seq, event)
+        else:
+            # Running in another process
+            await asyncio.to_thread(self.store.request_cancel, job_id)
+        return True
+
+    async def emit(self, job_id: str, event: Dict[str, Any]) -> None:
+        seq = await asyncio.to_thread(self.store.add_event, job_id, event)
+        self._notify(job_id, seq, event)
+
+    def _notify(self, job_id: str, seq: int, event: Dict[str, Any]) -> None:
+        for queue in self._subscribers.get(job_id, ()):
+            queue.put_nowait({"seq": seq, **event})
+
+    async def events(self, job_id: str, after: int = 0) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yields stored then live events of a job until it reaches a terminal status.
+
+        Events emitted in this process arrive immediately; those of a job run
+        by another process are picked up from the store every `poll_interval`.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        try:
+            last = after
+            while True:
+                for event in await asyncio.to_thread(self.store.events_since, job_id, last):
+                    last = event["seq"]
+                    yield event
+                    if event["type"] == "status" and event["status"] in TERMINAL_STATUSES:
+                        return
+                job = await self.get(job_id)
+                if job is None:
+                    return
+                if job["status"] in TERMINAL_STATUSES:
+                    # Finished since the read above; its final event was stored with the status
+                    for event in await asyncio.to_thread(self.store.events_since, job_id, last):
+                        yield event
+                    return
+                try:
+                    event = await asyncio.wait_for(queue.get(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    continue
+                if event["seq"] <= last:
+                    continue
+                last = event["seq"]
+                yield event
+                if event["type"] == "status" and event["status"] in TERMINAL_STATUSES:
+                    return
+        finally:
+            self._subscribers[job_id].discard(queue)
+            if not self._subscribers[job_id]:
+                del self._subscribers[job_id]
+
+    async def _finish(self, job_id: str, status: str, result: Any = None, error: Optional[str] = None) -> None:
+        # Status and its event in one transaction: a reader that sees the job finished
+        # also finds the final event
+        event = {"type": "status", "status": status, "error": error}
+        seq = await asyncio.to_thread(self.store.update, job_id, status, result, error, event)
+        self._notify(job_id, seq, event)
+
+    async def _requeue_stale(self) -> None:
+        for job_id in await asyncio.to_thread(self.store.requeue_stale, self.lease):
+            logger.info(f"Re-queueing job {job_id} abandoned by its worker")
+            self._wakeup.put_nowait(None)
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                cancelled = await asyncio.to_thread(self.store.heartbeat, self.owner, list(self._running))
+                for job_id in cancelled:
+                    task = self._running.get(job_id)
+                    if task is not None:
+                        task.cancel()
+                await self._requeue_stale()
+            except Exception as e:
+                logger.exception(f"Job heartbeat error: {e}")
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = None
+            try:
+                job_id = await asyncio.to_thread(self.store.claim, self.owner)
+                if job_id is None:
+                    try:
+                        await asyncio.wait_for(self._wakeup.get(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"Job worker error for {job_id}: {e}")
+
+    async def _run(self, job_id: str) -> None:
+        job = await self.get(job_id)
+        handler = self._handlers.get(job["kind"])
+        if handler is None:
+            await self._finish(job_id, FAILED, error=f"Unknown job kind: {job['kind']}")
+            return
+        await self.emit(job_id, {"type": "status", "status": RUNNING, "error": None})
+
+        task = asyncio.create_task(handler(JobContext(self, job_id, job["checkpoint"]), job["params"]))
+        self._running[job_id] = task
+        try:
+            # wait() rather than awaiting the task, so stopping the worker is not
+            # mistaken for cancelling the job (awaiting would cancel the task too)
+            try:
+                await asyncio.wait({task})
+            except asyncio.CancelledError:
+                # The worker itself is being stopped; stop() hands the job back
+                task.cancel()
+                raise
+            if task.cancelled():
+                await self._finish(job_id, CANCELLED)
+            elif task.exception() is not None:
+                e = task.exception()
+                logger.error(f"Job {job_id} failed: {e}", exc_info=e)
+                await self._finish(job_id, FAILED, error=str(e))
+            else:
+                await self._finish(job_id, DONE, result=task.result())
+        finally:
+            self._running.pop(job_id, None)
@@ -0,0 +1,55 @@
+# src/json_stream.py
+
+import json
+from typing import Any, Dict, List, Optional
+
+
+class CardStreamParser:
+    """
+    Incremental parser for {"Cards": [...]} model output.
+
+    Feed it text deltas as they arrive; `feed` returns the card objects that
+    were completed by that delta. Every JSON object nested below the root is
+    taken to be a card, which holds for both the flat and the nested
+    (list of lists) Cards schemas. The full text is kept in `text`.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._card_start: Optional[int] = None
+        self._card_depth = 0
+
+    def feed(self, delta: str) -> List[Dict[str, Any]]:
+        self.text += delta
+        cards = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+                if ch == "{" and self._depth >= 2 and self._card_start is None:
+                    self._card_start = i
+                    self._card_depth = self._depth
+            elif ch in "}]":
+                if ch == "}" and self._card_start is not None and self._depth == self._card_depth:
+                    card = json.loads(text[self._card_start : i + 1])
+                    if isinstance(card, dict):
+                        cards.append(card)
+                    self._card_start = None
+                self._depth -= 1
+        self._pos = len(text)
+        return cards
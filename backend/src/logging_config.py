@@ -0,0 +1,152 @@
+# src/logging_config.py
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+# Log records longer than this are truncated before they reach the queue
+LOG_MAX_MESSAGE_CHARS = int(os.getenv("LOG_MAX_MESSAGE_CHARS", "2000"))
+# Share of over-long INFO/DEBUG records that are kept at all (errors are always kept)
+LOG_LARGE_SAMPLE_RATE = float(os.getenv("LOG_LARGE_SAMPLE_RATE", "1.0"))
+
+_STANDARD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.Handler] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, plus any `extra` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def truncate(text: str, limit: int = LOG_MAX_MESSAGE_CHARS) -> str:
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... ({len(text) - limit} chars truncated)"
+
+
+class TruncatingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueues records for the background listener. The message is rendered and
+    truncated here, so only a short string crosses the queue; over-long
+    INFO/DEBUG records are sampled at LOG_LARGE_SAMPLE_RATE.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = truncate(record.getMessage())
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            # Render once; prepare() then only truncates
+            record.msg = record.getMessage()
+            record.args = None
+        except Exception:
+            self.handleError(record)
+            return
+        if (
+            record.levelno < logging.WARNING
+            and LOG_LARGE_SAMPLE_RATE < 1.0
+            and len(record.msg) > LOG_MAX_MESSAGE_CHARS
+            and random.random() >= LOG_LARGE_SAMPLE_RATE
+        ):
+            return
+        super().emit(record)
+
+
+def _parse_levels(spec: str) -> Dict[str, str]:
+    """Parses 'src.anki=WARNING,src.processing=DEBUG' into a dict."""
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, level = item.partition("=")
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging() -> None:
+    """
+    Routes all logging through a queue to a background thread that writes JSON
+    lines to stdout and a size-rotated file, so callers never block on I/O.
+
+    Configured with LOG_LEVEL, LOG_LEVELS (per-module), LOG_FILE, LOG_MAX_BYTES,
+    LOG_BACKUP_COUNT and LOG_FORMAT (json or text). A "{pid}" in LOG_FILE is
+    replaced with the process id, so server processes rotate separate files.
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    if os.getenv("LOG_FORMAT", "json").lower() == "text":
+        formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(name)s - %(message)s", "%Y-%m-%d %H:%M:%S")
+    else:
+        formatter = JsonFormatter()
+
+    handlers = [logging.StreamHandler(sys.stdout)]
+    log_file = os.getenv("LOG_FILE", "logs.txt").replace("{pid}", str(os.getpid()))
+    if log_file:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            log_file,
+            maxBytes=int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+            backupCount=int(os.getenv("LOG_BACKUP_COUNT", "5")),
+            encoding="utf-8",
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.Queue = queue.Queue(-1)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    _queue_handler = TruncatingQueueHandler(log_queue)
+    root.addHandler(_queue_handler)
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    for name, level in _parse_levels(os.getenv("LOG_LEVELS", "httpx=WARNING")).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """
+    Flushes queued records and stops the background writer. Later records go
+    straight to stdout until setup_logging is called again.
+    """
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    root = logging.getLogger()
+    root.removeHandler(_queue_handler)
+    _listener.stop()
+    formatter = _listener.handlers[0].formatter
+    for handler in _listener.handlers:
+        handler.close()
+    fallback = logging.StreamHandler(sys.stdout)
+    fallback.setFormatter(formatter)
+    root.addHandler(fallback)
+    _listener = None
+    _queue_handler = None
@@ -9,52 +9,165 @@ from fastapi import (
     status,
     Body,
     Query,
+    Header,
 )
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
 import os
 import dotenv
 import logging
-from io import BytesIO
-import sys
 import asyncio
-from typing import Dict, List, Any, Optional
+import json
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Collection, Dict, List, Any, Optional
 
 from src.utils import (
-    image_to_base64, 
+    encode_base64_async,
     read_and_validate_image, 
     apply_auto_changes_for_chunk, 
     apply_manual_changes_for_chunk,
+    cards_text_size,
+    merge_streams,
     remove_sound_tags,
     )
-from src.processing import extract_pairs_from_text, extract_pairs_from_image, change_anki_pairs
+from src.processing import (
+    iter_pairs_from_text,
+    extract_pairs_from_images,
+    stream_pairs_from_text,
+    stream_pairs_from_images,
+    rewrite_pairs,
+    change_pairs_request,
+    batch_output_text,
+    respond_locally,
+    response_cache,
+    image_index,
+    get_client as get_openai_client,
+    close_client as close_openai_client,
+    CHANGE_PAIRS_MAX_OUTPUT_TOKENS,
+)
+from src.adaptive import ChunkSizer, run_adaptive_chunks
+from src.chunking import estimate_tokens
+from src.prompts import PROMPTS
+from src.batch import BatchManifest, LocalBatchBackend, OpenAIBatchBackend, run_batch
 from src.anki import AnkiService
+from src.images import (
+    IMAGE_DEDUP_DISTANCE,
+    IMAGE_PACK_MAX_IMAGES,
+    IMAGE_PACK_PIXELS,
+    image_hash_async,
+    image_pixels,
+    near_duplicate_groups,
+    pack_images,
+    preprocess_image_async,
+)
+from src.jobs import JobContext, JobManager, JobStore
+from src import offload
+from src.deck_index import DeckIndex
+from src.normalize import normalize_notes
+from src.ratelimit import rate_limit_key
+from src.metrics import REGISTRY, HTTP_REQUEST_DURATION, STAGE_DURATION, ERRORS, IMAGES_DEDUPLICATED
+from src.logging_config import setup_logging, stop_logging
 
 dotenv.load_dotenv()
 
-handler = logging.StreamHandler(sys.stdout)
-formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
-handler.setFormatter(formatter)
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-    filename="logs.txt",
-    filemode="a",
-)
+# Configure logging (queue-based, JSON lines to stdout and a rotating logs.txt)
+setup_logging()
 logger = logging.getLogger(__name__)
-logger.addHandler(handler)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Owns the outbound clients: the AnkiConnect pool is opened here and the
+    OpenAI client, created on the first model call, is closed here too, as
+    are the offload pools and the log writer (restarted if an earlier
+    lifespan in this process stopped it).
+    """
+    setup_logging()
+    anki_service.open()
+    await job_manager.start()
+    try:
+        yield
+    finally:
+        await job_manager.stop()
+        await anki_service.aclose()
+        await close_openai_client()
+        offload.shutdown()
+        stop_logging()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Define the Anki-Connect endpoint and default deck name
 DEFAULT_DECK_NAME = os.getenv("DEFAULT_DECK_NAME", "test")
 ANKI_CONNECT_URL = os.getenv("ANKI_CONNECT_URL", "http://localhost:8765")
+# Number of notes sent to AnkiConnect per bulk request
+ANKI_BATCH_SIZE = int(os.getenv("ANKI_BATCH_SIZE", "50"))
+# Seconds to trust the last AnkiConnect liveness check
+ANKI_HEALTH_TTL = float(os.getenv("ANKI_HEALTH_TTL", "5"))
+# AnkiConnect client tuning: timeouts (seconds), connection pool, retries and circuit breaker
+ANKI_TIMEOUT = float(os.getenv("ANKI_TIMEOUT", "5"))
+ANKI_CONNECT_TIMEOUT = float(os.getenv("ANKI_CONNECT_TIMEOUT", "2"))
+ANKI_MAX_CONNECTIONS = int(os.getenv("ANKI_MAX_CONNECTIONS", "10"))
+ANKI_KEEPALIVE_EXPIRY = float(os.getenv("ANKI_KEEPALIVE_EXPIRY", "5"))
+ANKI_RETRY_ATTEMPTS = int(os.getenv("ANKI_RETRY_ATTEMPTS", "3"))
+ANKI_BREAKER_THRESHOLD = int(os.getenv("ANKI_BREAKER_THRESHOLD", "5"))
+ANKI_BREAKER_RESET = float(os.getenv("ANKI_BREAKER_RESET", "10"))
+# Red cards sent to the LLM in the first change_anki_pairs call (later calls are sized
+# from the output token budget, up to RED_CARDS_MAX_BATCH_SIZE), and how many calls run at once
+RED_CARDS_BATCH_SIZE = int(os.getenv("RED_CARDS_BATCH_SIZE", "5"))
+RED_CARDS_MAX_BATCH_SIZE = int(os.getenv("RED_CARDS_MAX_BATCH_SIZE", "50"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+# Minimum seconds between incremental deck index syncs with Anki
+DECK_INDEX_SYNC_INTERVAL = float(os.getenv("DECK_INDEX_SYNC_INTERVAL", "30"))
+# Background jobs: SQLite file for job state (shared by all server processes),
+# worker tasks per process, and seconds without a heartbeat before a running
+# job is considered abandoned by a dead process and re-queued
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_LEASE = float(os.getenv("JOB_LEASE", "30"))
+# Offline red card rewrites: "openai" (Batch API) or "local" (file-based stand-in),
+# where manifests and JSONL files are kept, and how often to poll a submitted batch
+LLM_BATCH_BACKEND = os.getenv("LLM_BATCH_BACKEND", "openai")
+BATCH_DIR = os.getenv("BATCH_DIR", "batches")
+BATCH_POLL_INTERVAL = float(os.getenv("BATCH_POLL_INTERVAL", "30"))
+# Batches per offline run: resubmissions of missing chunks and split mismatched ones
+BATCH_MAX_ROUNDS = int(os.getenv("BATCH_MAX_ROUNDS", "6"))
 
 # Initialize AnkiService
-anki_service = AnkiService(ANKI_CONNECT_URL)
+anki_service = AnkiService(
+    ANKI_CONNECT_URL,
+    batch_size=ANKI_BATCH_SIZE,
+    health_ttl=ANKI_HEALTH_TTL,
+    timeout=ANKI_TIMEOUT,
+    connect_timeout=ANKI_CONNECT_TIMEOUT,
+    max_connections=ANKI_MAX_CONNECTIONS,
+    keepalive_expiry=ANKI_KEEPALIVE_EXPIRY,
+    retry_attempts=ANKI_RETRY_ATTEMPTS,
+    breaker_threshold=ANKI_BREAKER_THRESHOLD,
+    breaker_reset=ANKI_BREAKER_RESET,
+)
+
+if LLM_BATCH_BACKEND == "local":
+    batch_backend = LocalBatchBackend(os.path.join(BATCH_DIR, "local"), respond_locally)
+else:
+    batch_backend = OpenAIBatchBackend(get_openai_client)
+
+# Shared across requests so every rewrite benefits from what earlier responses taught it
+red_cards_sizer = ChunkSizer(
+    CHANGE_PAIRS_MAX_OUTPUT_TOKENS, initial_size=RED_CARDS_BATCH_SIZE, max_size=RED_CARDS_MAX_BATCH_SIZE
+)
+
+# Local mirror of deck notes for duplicate checks before writing to Anki
+deck_index = DeckIndex(anki_service, sync_interval=DECK_INDEX_SYNC_INTERVAL)
+
+# Background job manager for long /process and red-card runs
+job_manager = JobManager(
+    JobStore(JOBS_DB_PATH), workers=JOB_WORKERS, heartbeat_interval=JOB_LEASE / 3, lease=JOB_LEASE
+)
     
 # Each card has Front, Back, and an optional Status (holding "OK" or the error message).
 class CardModel(BaseModel):
@@ -100,6 +213,217 @@ class FullManualAddCardsInput(BaseModel):
     deckName: str = Field(None)
     pairs: str = Field(...)
 
+class JobSubmittedResponse(BaseModel):
+    jobId: str
+
+class JobStatusResponse(BaseModel):
+    id: str
+    kind: str
+    status: str = Field(..., description="queued, running, done, failed or cancelled")
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created: float
+    updated: float
+
+async def read_upload(upload: UploadFile) -> Optional[Dict[str, str]]:
+    """Validates, preprocesses and base64-encodes one uploaded image; None if it can't be used."""
+    try:
+        with STAGE_DURATION.time(stage="image_read"):
+            content = await read_and_validate_image(upload)
+        with STAGE_DURATION.time(stage="image_preprocess"):
+            content, mime_type = await preprocess_image_async(content)
+        with STAGE_DURATION.time(stage="image_hash"):
+            content_hash = await image_hash_async(content)
+        with STAGE_DURATION.time(stage="base64_encode"):
+            base64_img = await encode_base64_async(content)
+        return {
+            "filename": upload.filename,
+            "base64": base64_img,
+            "mime_type": mime_type,
+            "hash": content_hash,
+            "pixels": image_pixels(content),
+        }
+    except Exception as e:
+        ERRORS.inc(stage="image_read", type=type(e).__name__)
+        logger.exception(f"Failed to read image {upload.filename}: {e}")
+        return None
+
+
+async def read_uploads(files: List[UploadFile]) -> List[Dict[str, str]]:
+    """
+    Reads every upload (see read_upload) and keeps one image of each group of
+    near-duplicates, the one with the largest payload.
+    """
+    images = [img for img in await asyncio.gather(*(read_upload(f) for f in files)) if img]
+    groups = near_duplicate_groups([img["hash"] for img in images], IMAGE_DEDUP_DISTANCE)
+    kept = [max((images[i] for i in group), key=lambda img: len(img["base64"])) for group in groups]
+    for group in groups:
+        if len(group) > 1:
+            names = ", ".join(repr(images[i]["filename"]) for i in group)
+            logger.info(f"Extracting near-duplicate images {names} once")
+    if len(kept) < len(images):
+        IMAGES_DEDUPLICATED.inc(len(images) - len(kept))
+    return kept
+
+
+def image_groups(images: List[Dict[str, str]]) -> List[List[Dict[str, str]]]:
+    """Splits images into packs extracted with one vision call each (see images.pack_images)."""
+    groups = pack_images([image.get("pixels") for image in images], IMAGE_PACK_PIXELS, IMAGE_PACK_MAX_IMAGES)
+    return [[images[i] for i in group] for group in groups]
+
+
+async def extract_cards(
+    text: Optional[str],
+    images: List[Dict[str, str]],
+    use_cache: bool = True,
+    on_cards: Optional[Callable[[List[CardModel]], Awaitable[None]]] = None,
+) -> List[CardModel]:
+    """
+    Extracts cards from text and from already encoded images (see read_upload).
+    `on_cards` is awaited with each source's cards as soon as they are ready.
+    """
+    async def from_text():
+        logger.info("Extracting pairs from text.")
+        cards = []
+        # Long text is extracted segment by segment; report each segment's cards right away
+        async for text_pairs in iter_pairs_from_text(text, use_cache=use_cache):
+            # Convert each extracted pair to CardModel (Status=None by default)
+            segment_cards = [CardModel(Front=p["Front"], Back=p["Back"]) for p in text_pairs]
+            if on_cards:
+                await on_cards(segment_cards)
+            cards.extend(segment_cards)
+        return cards
+
+    async def from_images(group: List[Dict[str, str]]):
+        try:
+            per_image = await extract_pairs_from_images(group, use_cache=use_cache)
+        except Exception as e:
+            names = ", ".join(repr(image["filename"]) for image in group)
+            logger.exception(f"Failed to process images {names}: {e}")
+            per_image = [[] for _ in group]
+        cards = []
+        for pairs in per_image:
+            image_cards = [CardModel(Front=p["Front"], Back=p["Back"]) for p in pairs]
+            if on_cards:
+                await on_cards(image_cards)
+            cards.extend(image_cards)
+        return cards
+
+    sources = []
+    # 1) Extract from text (if provided)
+    if text and text.strip():
+        sources.append(from_text())
+    # 2) Extract from images (if provided)
+    if images:
+        groups = image_groups(images)
+        logger.info(f"Extracting pairs from {len(images)} images in {len(groups)} calls.")
+        sources.extend(from_images(group) for group in groups)
+
+    all_cards: List[CardModel] = []
+    for cards_list in await asyncio.gather(*sources):
+        all_cards.extend(cards_list)
+    return all_cards
+
+
+async def stream_cards(
+    text: Optional[str], images: List[Dict[str, str]], use_cache: bool = True
+) -> AsyncIterator[CardModel]:
+    """Like extract_cards, but yields each card as soon as the model has finished writing it."""
+    streams = []
+    if text and text.strip():
+        streams.append(stream_pairs_from_text(text, use_cache=use_cache))
+    streams.extend(stream_pairs_from_images(group, use_cache=use_cache) for group in image_groups(images))
+    async for pair in merge_streams(streams):
+        yield CardModel(Front=pair["Front"], Back=pair["Back"])
+
+
+async def add_cards_checked(deck_name: str, cards: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+    """
+    Like AnkiService.add_cards_bulk, but cards already in the deck index (or repeated
+    within `cards`) are reported as duplicates without being sent to Anki.
+    """
+    duplicates = await deck_index.split_duplicates(deck_name, cards)
+    new_cards = [card for card, dup in zip(cards, duplicates) if dup is None]
+    new_responses = iter(await anki_service.add_cards_bulk(deck_name, new_cards))
+
+    responses = []
+    for card, dup in zip(cards, duplicates):
+        if dup is None:
+            response = next(new_responses)
+            if response["success"]:
+                deck_index.add(deck_name, response["noteId"], card)
+        elif dup:
+            response = {"success": False, "duplicate": True, "noteId": dup,
+                        "error": f"Duplicate: already in deck (noteId={dup})"}
+        else:
+            response = {"success": False, "duplicate": True, "error": "Duplicate: repeated in this request"}
+        responses.append(response)
+    return responses
+
+
+async def add_cards_with_status(deck_name: str, cards: List[CardModel]) -> List[CardModel]:
+    """Adds cards to Anki in bulk and sets each card's Status to 'OK' or the error."""
+    responses = await add_cards_checked(
+        deck_name, [{"Front": card.Front, "Back": card.Back} for card in cards]
+    )
+    for card, response in zip(cards, responses):
+        if not response["success"]:
+            card.Status = response.get("error", "Unknown error occurred.")
+        else:
+            card.Status = "OK"
+    return cards
+
+
+async def drop_known_cards(deck_name: str, cards: List[CardModel]) -> List[CardModel]:
+    """Removes cards that are already in the deck (or repeated) according to the deck index."""
+    duplicates = await deck_index.split_duplicates(
+        deck_name, [{"Front": card.Front, "Back": card.Back} for card in cards]
+    )
+    return [card for card, dup in zip(cards, duplicates) if dup is None]
+
+
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+
+def _stream_event(fmt: str, event_type: str, **data: Any) -> str:
+    """One event of a streamed /process response, as an NDJSON line or an SSE message."""
+    payload = json.dumps({"type": event_type, **data})
+    if fmt == "sse":
+        return f"event: {event_type}\ndata: {payload}\n\n"
+    return payload + "\n"
+
+
+async def process_stream(
+    fmt: str,
+    deck_name: str,
+    mode: str,
+    text: Optional[str],
+    images: List[Dict[str, str]],
+    use_cache: bool,
+    skip_known: bool,
+) -> AsyncIterator[str]:
+    """
+    Body of a streamed /process response: a "card" event per extracted card as
+    soon as it is ready, in auto mode an "added" event per card once they are
+    added in bulk, then "done" (or "error" when nothing was extracted).
+    """
+    cards: List[CardModel] = []
+    async for card in stream_cards(text, images, use_cache=use_cache):
+        if mode == "manual" and skip_known and not await drop_known_cards(deck_name, [card]):
+            continue
+        cards.append(card)
+        yield _stream_event(fmt, "card", card=card.model_dump())
+
+    if not cards:
+        yield _stream_event(fmt, "error", detail="No cards extracted from text or images.")
+        return
+    logger.info("Streamed %d cards", len(cards))
+    if mode == "auto":
+        for card in await add_cards_with_status(deck_name, cards):
+            yield _stream_event(fmt, "added", card=card.model_dump())
+    yield _stream_event(fmt, "done", count=len(cards))
+
+
 # Consolidated endpoint
 @app.post("/process", response_model=CardsResponse, status_code=status.HTTP_200_OK)
 async def handle_process(
@@ -107,11 +431,18 @@ async def handle_process(
     files: List[UploadFile] = File([]),
     deckName: Optional[str] = Form(None),
     mode: str = Form("manual"),
+    use_cache: bool = Form(True),
+    skip_known: bool = Form(False),
+    stream: Optional[str] = Form(None),
 ) -> CardsResponse:
     """
     Single endpoint for text + images:
       - manual => {"cards":[{Front, Back, Status=None}, ...]}
       - auto   => {"cards":[{Front, Back, Status='OK' or 'Error'}, ...]}
+    Pass use_cache=false to skip cached LLM responses. With skip_known=true,
+    manual mode leaves out cards already in the deck.
+    With stream=ndjson or stream=sse, cards are sent one by one as the model
+    writes them (see process_stream).
     """
     deckName = deckName or DEFAULT_DECK_NAME
 
@@ -120,35 +451,20 @@ async def handle_process(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid mode. Use 'auto' or 'manual'."
         )
+    if stream is not None and stream not in STREAM_MEDIA_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid stream format. Use 'ndjson' or 'sse'."
+        )
 
-    all_cards: List[CardModel] = []
-
-    # 1) Extract from text (if provided)
-    if text and text.strip():
-        logger.info(f"Extracting pairs from text (mode={mode}, deck={deckName}).")
-        text_pairs = await extract_pairs_from_text(text)
-        # Convert each extracted pair to CardModel (Status=None by default)
-        for p in text_pairs:
-            all_cards.append(CardModel(Front=p["Front"], Back=p["Back"]))
-
-    # 2) Extract from images (if provided)
-    if files:
-        logger.info(f"Extracting pairs from {len(files)} images (mode={mode}, deck={deckName}).")
-
-        async def process_image(upload: UploadFile):
-            try:
-                content = await read_and_validate_image(upload)
-                base64_img = image_to_base64(BytesIO(content))
-                pairs = await extract_pairs_from_image(base64_img, image_caption=upload.filename)
-                # Return list of CardModel
-                return [CardModel(Front=p["Front"], Back=p["Back"]) for p in pairs]
-            except Exception as e:
-                logger.exception(f"Failed to process image {upload.filename}: {e}")
-                return []
-
-        image_cards_lists = await asyncio.gather(*(process_image(f) for f in files))
-        for cards_list in image_cards_lists:
-            all_cards.extend(cards_list)
+    logger.info(f"Processing input (mode={mode}, deck={deckName}).")
+    images = await read_uploads(files)
+    if stream:
+        return StreamingResponse(
+            process_stream(stream, deckName, mode, text, images, use_cache, skip_known),
+            media_type=STREAM_MEDIA_TYPES[stream],
+        )
+    all_cards = await extract_cards(text, images, use_cache=use_cache)
 
     if not all_cards:
         raise HTTPException(
@@ -156,20 +472,16 @@ async def handle_process(
             detail="No cards extracted from text or images."
         )
     
-    logger.info(f"All extracted cards: {all_cards}")
+    logger.info("Extracted %d cards", len(all_cards))
+    logger.debug("All extracted cards: %s", all_cards)
     # 3) If 'manual', just return them with Status=None
     if mode == "manual":
+        if skip_known:
+            all_cards = await drop_known_cards(deckName, all_cards)
         return CardsResponse(cards=all_cards)
 
-    # 4) If 'auto', add to Anki & update Status
-    for card in all_cards:
-        response = await anki_service.add_card(deckName, card.Front, card.Back)
-        if not response["success"]:
-            card.Status = response.get("error", "Unknown error occurred.")
-        else:
-            card.Status = "OK"
-
-    return CardsResponse(cards=all_cards)
+    # 4) If 'auto', add to Anki in bulk & update Status
+    return CardsResponse(cards=await add_cards_with_status(deckName, all_cards))
 
 
 # Add selected cards to Anki
@@ -191,13 +503,14 @@ async def add_cards(input_data: AddCardsInput) -> CardsResponse:
 
     results: List[CardModel] = []
 
-    for pair in pairs:
-        # We assume pair is already a CardModel from the AddCardsInput
+    # We assume pair is already a CardModel from the AddCardsInput
+    responses = await add_cards_checked(
+        deckName, [{"Front": pair.Front, "Back": pair.Back} for pair in pairs]
+    )
+    for pair, response in zip(pairs, responses):
         front = pair.Front
         back = pair.Back
 
-        # Attempt to add
-        response = await anki_service.add_card(deckName, front, back)
         if not response["success"]:
             # Save the error message in the Status
             results.append(CardModel(Front=front, Back=back, Status=response.get("error", "Unknown error occurred.")))
@@ -208,77 +521,149 @@ async def add_cards(input_data: AddCardsInput) -> CardsResponse:
 
 
 ### 1) GET RED CARDS
-@app.get("/get_cards_red", response_model=CardsResponse)
-async def get_cards_red(deck_name: str) -> CardsResponse:
+@app.get("/get_cards_red", response_model=RedCardsResponse)
+async def get_cards_red(deck_name: str) -> RedCardsResponse:
     """
     Returns the flagged (red) cards from the given deck
     as a list of {noteId, Front, Back}.
     """
-    card_ids = await anki_service.get_cards_red(deck_name)
-    if not card_ids:
-        return RedCardsResponse(cards=[])
-
-    cards_info = await anki_service.cards_info(card_ids)
-    # Convert to RedCardModel (Front/Back only)
-    red_cards = []
-    for card_info in cards_info:
-        note_id = card_info.get("noteId")
-        fields = card_info.get("fields", {})
-        front_value = fields.get("Front", {}).get("value", "")
-        back_value = fields.get("Back", {}).get("value", "")
-        red_cards.append(RedCardModel(
-            noteId=note_id,
-            Front=front_value,
-            Back=back_value
-        ))
-    logger.info(red_cards)
+    red_cards = [
+        RedCardModel(noteId=card["noteId"], Front=card["Front"], Back=card["Back"])
+        for card in await load_red_cards(deck_name)
+    ]
+    logger.debug("Red cards: %s", red_cards)
     return RedCardsResponse(cards=red_cards)
 
 
+def _json_bytes(content: Any) -> bytes:
+    # Same encoding as JSONResponse
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+async def json_response(content: Any, size: int) -> Response:
+    """
+    JSON response for a large plain-data result. Skips FastAPI's
+    jsonable_encoder and, when `size` (characters of card text) is large,
+    encodes off the event loop (see offload.run).
+    """
+    body = await offload.run(_json_bytes, content, size=size)
+    return Response(body, media_type="application/json")
+
+
 ### 2) UPDATE CARDS RED AUTO
-@app.post("/update_cards_red_auto", response_model=BeforeAfterResponse)
-async def update_cards_red_auto(deck_name: str) -> BeforeAfterResponse:
+def _output_tokens(new_cards_chunk: List[List[Dict[str, str]]]) -> int:
+    return estimate_tokens(json.dumps(new_cards_chunk))
+
+
+def _unchanged_result(card: Dict[str, Any], status: str) -> Dict[str, Any]:
+    """BeforeAfterCard dict for a red card left as it was."""
+    return {
+        "noteId": card["noteId"],
+        "beforeFront": card["Front"],
+        "beforeBack": card["Back"],
+        "afterFront": card["Front"],
+        "afterBack": card["Back"],
+        "Status": status,
+    }
+
+
+async def load_red_cards(deck_name: str, cards_num: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Returns the red-flagged notes of a deck (at most `cards_num`) as {noteId, Front, Back}
+    dicts with the fields as stored in Anki. Front and Back of the whole batch are also
+    normalized in one pass, off the event loop when the batch is large: each dict carries
+    the plain text the model sees under "prompt" and its [sound:...] tags under "media",
+    so rewrites can put the audio back (see red_card_prompts, with_red_card_media).
+    """
     card_ids = await anki_service.get_cards_red(deck_name)
-    # logger.info(f"card_ids = {card_ids}")
-    cards_info = await anki_service.cards_info(card_ids)
-    # logger.info(f"cards_info = {cards_info}")
-
-    before_cards = []
-    for cinfo in cards_info:
-        note_id = cinfo.get("noteId")
-        fields = cinfo.get("fields", {})
-        front_value = fields.get("Front", {}).get("value", "")
-        back_value = fields.get("Back", {}).get("value", "")
-        before_cards.append({
-            "noteId": note_id,
-            "Front": front_value,
-            "Back": back_value
+    if not card_ids:
+        return []
+    if cards_num is not None:
+        card_ids = card_ids[:cards_num]
+    logger.debug("card_ids: %s", card_ids)
+    cards_info = [cinfo for cinfo in await anki_service.cards_info(card_ids) if cinfo]
+    fields = await normalize_notes(cards_info, ("Front", "Back"))
+    cards = []
+    for i, cinfo in enumerate(cards_info):
+        raw = cinfo.get("fields", {})
+        cards.append({
+            "noteId": cinfo.get("noteId"),
+            "Front": raw.get("Front", {}).get("value", ""),
+            "Back": raw.get("Back", {}).get("value", ""),
+            "prompt": {"Front": fields["Front"].text[i], "Back": fields["Back"].text[i]},
+            "media": {"Front": fields["Front"].media[i], "Back": fields["Back"].media[i]},
         })
+    return cards
+
+
+def red_card_prompts(chunk: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """The normalized {noteId, Front, Back} of loaded red cards, as sent to the model."""
+    return [{"noteId": card["noteId"], **card["prompt"]} for card in chunk]
+
+
+def with_red_card_media(
+    chunk: List[Dict[str, Any]], new_cards_chunk: List[List[Dict[str, str]]]
+) -> List[List[Dict[str, str]]]:
+    """Appends each red card's [sound:...] tags to the same field of every card rewritten from it."""
+    def attach(text: str, tags: List[str]) -> str:
+        return " ".join([text, *(tag for tag in tags if tag not in text)]).strip()
 
     results = []
-    batch_size = 5
-    # 1) chunk the cards and call change_anki_pairs in chunks
-    for i in range(0, len(before_cards), batch_size):
-        chunk = before_cards[i : i + batch_size]
-
-        # call change_anki_pairs on this chunk
-        new_cards_chunk = await change_anki_pairs(chunk)
-        logger.info(f"Lenght of chunk {len(cards_info)} lenght of new_cards_chunk {len(new_cards_chunk)}")
-        if len(new_cards_chunk) != len(chunk):
-            logger.info(f"Warning: Expected {len(chunk)} new cards, but got {len(new_cards_chunk)}")
-            continue
-        logger.info(f"chunk = {chunk}")
-        logger.info(f"new_cards_chunk = {new_cards_chunk}")
-
-        # 2) apply the auto logic in a separate helper
-        batch_results = await apply_auto_changes_for_chunk(
-            chunk=chunk,
-            new_cards_chunk=new_cards_chunk,
-            deck_name=deck_name,
-            anki_service=anki_service
-        )
-        results.extend(batch_results)
-    logger.info(results)
+    for card, new_cards in zip(chunk, new_cards_chunk):
+        media = card["media"]
+        results.append([
+            {**new, "Front": attach(new.get("Front", ""), media["Front"]), "Back": attach(new.get("Back", ""), media["Back"])}
+            for new in new_cards
+        ])
+    return results
+
+
+async def rewrite_red_cards_auto(
+    deck_name: str,
+    use_cache: bool = True,
+    on_results: Optional[Callable[[List[Dict[str, Any]], List[Dict[str, Any]]], Awaitable[None]]] = None,
+    skip_note_ids: Collection[int] = (),
+) -> List[Dict[str, Any]]:
+    """
+    Rewrites all red cards of a deck with the LLM and applies the changes to Anki.
+    Notes in `skip_note_ids` (already handled by an earlier run) are left out.
+    `on_results` is awaited with each chunk and its BeforeAfterCard dicts once applied.
+    """
+    before_cards = [card for card in await load_red_cards(deck_name) if card["noteId"] not in skip_note_ids]
+
+    # 1) rewrite adaptively sized chunks concurrently; mismatched chunks are split and retried
+    async def rewrite_chunk(chunk):
+        return await rewrite_pairs(red_card_prompts(chunk), use_cache=use_cache)
+
+    # 2) apply the auto logic as soon as each chunk is final
+    applied: Dict[int, List[Dict[str, Any]]] = {}
+
+    async def apply_chunk(chunk, new_cards_chunk):
+        if isinstance(new_cards_chunk, Exception):
+            batch_results = [_unchanged_result(card, f"REWRITE_ERROR: {new_cards_chunk}") for card in chunk]
+        else:
+            batch_results = await apply_auto_changes_for_chunk(
+                chunk=chunk,
+                new_cards_chunk=with_red_card_media(chunk, new_cards_chunk),
+                deck_name=deck_name,
+                anki_service=anki_service
+            )
+        applied[id(chunk)] = batch_results
+        if on_results:
+            await on_results(chunk, batch_results)
+
+    outcomes = await run_adaptive_chunks(
+        before_cards, rewrite_chunk, red_cards_sizer, _output_tokens,
+        max_concurrency=LLM_MAX_CONCURRENCY, on_outcome=apply_chunk,
+    )
+    results = [r for chunk, _ in outcomes for r in applied[id(chunk)]]
+    logger.debug("Red card results: %s", results)
+    return results
+
+
+@app.post("/update_cards_red_auto", response_model=BeforeAfterResponse)
+async def update_cards_red_auto(deck_name: str, use_cache: bool = True) -> BeforeAfterResponse:
+    results = await rewrite_red_cards_auto(deck_name, use_cache=use_cache)
     return BeforeAfterResponse(cards=results)
 
 
@@ -287,63 +672,35 @@ async def update_cards_red_auto(deck_name: str) -> BeforeAfterResponse:
 async def update_cards_red_manual_get(
     deck_name: str = Query(...),
     cards_num: int = Query(3),
+    use_cache: bool = Query(True),
 ):
     """
     Fetches up to `cards_num` red cards from the specified deck.
     This is a GET endpoint; parameters come in as query params:
       e.g. /update_cards_red_manual_get?deck_name=test&cards_num=10
     """
-    card_ids = await anki_service.get_cards_red(deck_name)
-    card_ids = card_ids[:cards_num]
     logger.info(f"Fetching red cards from the deck: {deck_name}")
-    logger.info(f"card_ids: {card_ids}")
-    cards_info = await anki_service.cards_info(card_ids)
-    before_cards = []
-    for cinfo in cards_info:
-        try:
-            logger.info(cinfo.__getitem__("noteId"), cinfo.__getitem__("fields"))
-        except Exception as e:
-            logger.error(cinfo, e)
-        if not cinfo:
-            continue
-        
-        note_id = cinfo.get("noteId")
-        fields = cinfo.get("fields", {})
-        front_value = fields.get("Front", {}).get("value", "")
-        front_value, _ = remove_sound_tags(front_value)
-        back_value = fields.get("Back", {}).get("value", "")
-        back_value, _ = remove_sound_tags(back_value)
-        before_cards.append({
-            "noteId": note_id,
-            "Front": front_value,
-            "Back": back_value
-        })
-
+    # Suggestions are reviewed without audio; only the sound tags are stripped
+    before_cards = [
+        {**card, "Front": remove_sound_tags(card["Front"])[0], "Back": remove_sound_tags(card["Back"])[0]}
+        for card in await load_red_cards(deck_name, cards_num)
+    ]
+
+    # 1) rewrite adaptively sized chunks concurrently; mismatched chunks are split and retried
+    async def rewrite_chunk(chunk):
+        return await rewrite_pairs(red_card_prompts(chunk), use_cache=use_cache)
+
+    outcomes = await run_adaptive_chunks(
+        before_cards, rewrite_chunk, red_cards_sizer, _output_tokens, max_concurrency=LLM_MAX_CONCURRENCY
+    )
+    # 2) apply manual logic; cards that could not be rewritten come back without suggestions
     results = []
-    batch_size = 5
-    # 1) chunk the cards and call change_anki_pairs in chunks
-    for i in range(0, len(before_cards), batch_size):
-        chunk = before_cards[i : i + batch_size]
-
-        # call change_anki_pairs on this chunk
-        new_cards_chunk = await change_anki_pairs(chunk)
-        logger.info(f"Length of chunk {len(chunk)}, length of new_cards_chunk {len(new_cards_chunk)}")
-        if len(new_cards_chunk) != len(chunk):
-            logger.info(f"Warning: Expected {len(chunk)} new cards, but got {len(new_cards_chunk)}")
-            logger.info(chunk)
-            logger.info(new_cards_chunk)
-            continue
-        logger.info(f"chunk = {chunk}")
-        logger.info(f"new_cards_chunk = {new_cards_chunk}")
+    for chunk, new_cards_chunk in outcomes:
+        if isinstance(new_cards_chunk, Exception):
+            new_cards_chunk = [[] for _ in chunk]
+        results.extend(apply_manual_changes_for_chunk(chunk=chunk, new_cards_chunk=new_cards_chunk))
 
-        # 2) apply manual logic
-        batch_results = apply_manual_changes_for_chunk(
-            chunk=chunk,
-            new_cards_chunk=new_cards_chunk
-        )
-        results.extend(batch_results)
-    
-    return results
+    return await json_response(results, size=cards_text_size(before_cards))
 
 
 @app.post("/update_cards_red_manual_adding")
@@ -360,8 +717,9 @@ async def update_cards_red_manual_adding(
           add new notes for the rest of selected suggestions
     """
     results = []
+    flag_note_ids = []
     logger.info("Red cards manual update")
-    logger.info(f"data = \n{data}\n",'--------------','\n\n')
+    logger.debug("data = %s", data)
     for item in data:
         note_id = item["noteId"]
         old_front = item["oldFront"]
@@ -374,8 +732,7 @@ async def update_cards_red_manual_adding(
         # Case 1: No selected suggestions => do nothing
         if not selected_sugs:
             logger.info("No selected suggestions - skipping update")
-            logger.info(item)
-            logger.info('---------------------------------------------------')
+            logger.debug("item = %s", item)
             results.append({
                 "noteId": note_id,
                 "action": "SKIP",
@@ -386,8 +743,7 @@ async def update_cards_red_manual_adding(
         # Case 2: Exactly 1 => update old note
         if len(selected_sugs) == 1:
             logger.info("Only one is selected - updating the old note")
-            logger.info(item)
-            logger.info('---------------------------------------------------')
+            logger.debug("item = %s", item)
             chosen = selected_sugs[0]
             new_front = chosen["Front"]
             new_back = chosen["Back"]
@@ -396,11 +752,9 @@ async def update_cards_red_manual_adding(
                 status = update_resp["error"]
             else:
                 status = "OK"
-                
-            cards_flag_yellow = await anki_service.set_note_cards_flag_yellow(note_id)
-            logger.info('Change cards flag result\n'
-                f'{cards_flag_yellow}\n\n')
-            
+
+            flag_note_ids.append(note_id)
+
             results.append({
                 "noteId": note_id,
                 "beforeFront": old_front,
@@ -417,8 +771,7 @@ async def update_cards_red_manual_adding(
         else:
             # 3a) Update the old note with the first suggestion
             logger.info("More than one is selected - updating the old note with the first selected suggestion")
-            logger.info(item)
-            logger.info('---------------------------------------------------')
+            logger.debug("item = %s", item)
             first = selected_sugs[0]
             first_front = first["Front"]
             first_back = first["Back"]
@@ -436,10 +789,8 @@ async def update_cards_red_manual_adding(
                 })
                 continue
             
-            # Set yellow flag
-            cards_flag_yellow = await anki_service.set_note_cards_flag_yellow(note_id)
-            logger.info('Change cards flag result\n'
-                f'{cards_flag_yellow}\n\n')
+            # Set yellow flag (after the loop)
+            flag_note_ids.append(note_id)
             results.append({
                 "noteId": note_id,
                 "beforeFront": old_front,
@@ -472,11 +823,13 @@ async def update_cards_red_manual_adding(
                         "back": ext_back,
                         "status": "OK"
                     })
-                cards_flag_yellow = await anki_service.set_note_cards_flag_yellow(note_id)
-                logger.info('Change cards flag result\n'
-                    f'{cards_flag_yellow}\n\n')
-                
-    logger.info(f"{'------------'}\n{results}\n{'-----------'}\n\n")
+
+    # Flag all touched notes yellow in one go
+    if flag_note_ids:
+        cards_flag_yellow = await anki_service.set_flags_bulk(flag_note_ids, 2)
+        logger.info("Change cards flag result: %s", cards_flag_yellow)
+
+    logger.debug("Manual update results: %s", results)
     return {"status": "DONE", "results": results}
 
 
@@ -502,10 +855,10 @@ async def full_manual_add_cards(input_data: FullManualAddCardsInput):
         raise HTTPException(status_code=400, detail=f"Error parsing pairs: {e}")
 
     results = []
-    for pair in parsed_pairs:
+    add_responses = await add_cards_checked(deck_name, parsed_pairs)
+    for pair, add_resp in zip(parsed_pairs, add_responses):
         front = pair["Front"]
         back = pair["Back"]
-        add_resp = await anki_service.add_card(deck_name, front, back)
         if not add_resp["success"]:
             results.append(
                 {
@@ -521,6 +874,206 @@ async def full_manual_add_cards(input_data: FullManualAddCardsInput):
     return {"status": results}
 
 
+### 5) BACKGROUND JOBS
+async def process_job(ctx: JobContext, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Job version of /process: streams each extracted (and, in auto mode, added) card."""
+    rate_limit_key.set(ctx.job_id)
+
+    async def on_cards(cards: List[CardModel]):
+        for card in cards:
+            await ctx.emit("card", stage="extract", card=card.model_dump())
+
+    await ctx.emit("stage", stage="extract")
+    all_cards = await extract_cards(
+        params.get("text"), params.get("images", []), use_cache=params.get("use_cache", True), on_cards=on_cards
+    )
+    if not all_cards:
+        raise ValueError("No cards extracted from text or images.")
+
+    if params["mode"] == "auto":
+        await ctx.emit("stage", stage="apply")
+        await add_cards_with_status(params["deckName"], all_cards)
+        for card in all_cards:
+            await ctx.emit("card", stage="apply", card=card.model_dump())
+    elif params.get("skip_known", False):
+        all_cards = await drop_known_cards(params["deckName"], all_cards)
+
+    return CardsResponse(cards=all_cards).model_dump()
+
+
+async def red_auto_job(ctx: JobContext, params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Job version of /update_cards_red_auto: streams results chunk by chunk.
+    Each applied chunk is checkpointed, so a re-queued job replays those
+    results and rewrites only the notes it had not reached.
+    """
+    rate_limit_key.set(ctx.job_id)
+    checkpoint = ctx.checkpoint or {"applied": [], "results": []}
+    earlier_results = checkpoint["results"]
+    applied, done_results = list(checkpoint["applied"]), list(earlier_results)
+    for result in earlier_results:
+        await ctx.emit("card", stage="apply", card=result)
+    # Chunks finish concurrently; saves go out one at a time so the last one is the newest
+    save_lock = asyncio.Lock()
+
+    async def on_results(chunk: List[Dict[str, Any]], batch_results: List[Dict[str, Any]]):
+        async with save_lock:
+            applied.extend(card["noteId"] for card in chunk)
+            done_results.extend(batch_results)
+            await ctx.save_checkpoint({"applied": list(applied), "results": list(done_results)})
+        for result in batch_results:
+            await ctx.emit("card", stage="apply", card=result)
+
+    await ctx.emit("stage", stage="rewrite")
+    results = await rewrite_red_cards_auto(
+        params["deck_name"], use_cache=params.get("use_cache", True), on_results=on_results,
+        skip_note_ids=set(applied),
+    )
+    return BeforeAfterResponse(cards=earlier_results + results).model_dump()
+
+
+async def red_auto_batch_job(ctx: JobContext, params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Offline version of /update_cards_red_auto: every chunk goes into one batch
+    file, and the results are applied to Anki in bulk once the batch is done.
+    Progress lives in a manifest under BATCH_DIR, so a restarted job resumes
+    polling its batch instead of starting over.
+    """
+    deck_name = params["deck_name"]
+    manifest_path = os.path.join(BATCH_DIR, f"{ctx.job_id}.json")
+    manifest = BatchManifest.load(manifest_path)
+    if manifest is None:
+        await ctx.emit("stage", stage="load")
+        before_cards = await load_red_cards(deck_name)
+        size = red_cards_sizer.size
+        chunks = {
+            f"chunk-{i // size}": before_cards[i : i + size]
+            for i in range(0, len(before_cards), size)
+        }
+        manifest = BatchManifest.create(manifest_path, chunks, deck_name=deck_name)
+
+    async def on_status(batch_id: str, batch_status: str):
+        await ctx.emit("stage", stage="batch", batchId=batch_id, status=batch_status)
+
+    async def apply(bodies: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        chunk, new_cards_chunk, failed = [], [], []
+        for custom_id, body in bodies.items():
+            cards = manifest.data["chunks"][custom_id]
+            try:
+                new_cards = json.loads(batch_output_text(body)).get("Cards", [])
+                error = None if len(new_cards) == len(cards) else f"expected {len(cards)} items, got {len(new_cards)}"
+            except ValueError as e:
+                error = f"unreadable output: {e}"
+            if error is None:
+                chunk.extend(cards)
+                new_cards_chunk.extend(with_red_card_media(cards, new_cards))
+            elif len(cards) > 1:
+                # Split the chunk; the halves stay pending and go into the next batch round
+                logger.warning(f"Batch {custom_id}: {error}, splitting")
+                mid = len(cards) // 2
+                manifest.data["chunks"][f"{custom_id}a"] = cards[:mid]
+                manifest.data["chunks"][f"{custom_id}b"] = cards[mid:]
+            else:
+                logger.error(f"Batch {custom_id}: {error}")
+                failed.extend(_unchanged_result(card, f"REWRITE_ERROR: {error}") for card in cards)
+        await ctx.emit("stage", stage="apply")
+        results = await apply_auto_changes_for_chunk(chunk, new_cards_chunk, deck_name, anki_service) + failed
+        for result in results:
+            await ctx.emit("card", stage="apply", card=result)
+        return results
+
+    unresolved = await run_batch(
+        manifest, batch_backend, lambda cards: change_pairs_request(red_card_prompts(cards)), apply,
+        poll_interval=BATCH_POLL_INTERVAL, max_rounds=BATCH_MAX_ROUNDS, on_status=on_status,
+    )
+    if unresolved:
+        logger.warning(f"{len(unresolved)} red card chunks got no batch result: {unresolved}")
+    return BeforeAfterResponse(cards=manifest.data["results"]).model_dump()
+
+
+job_manager.register("process", process_job)
+job_manager.register("update_cards_red_auto", red_auto_job)
+job_manager.register("update_cards_red_auto_batch", red_auto_batch_job)
+
+
+@app.post("/jobs/process", response_model=JobSubmittedResponse, status_code=status.HTTP_202_ACCEPTED)
+async def submit_process_job(
+    text: Optional[str] = Form(None),
+    files: List[UploadFile] = File([]),
+    deckName: Optional[str] = Form(None),
+    mode: str = Form("manual"),
+    use_cache: bool = Form(True),
+    skip_known: bool = Form(False),
+) -> JobSubmittedResponse:
+    """
+    Same input as /process, but returns a job ID right away.
+    Follow progress with /jobs/{job_id} or /jobs/{job_id}/events.
+    """
+    if mode not in ("manual", "auto"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid mode. Use 'auto' or 'manual'."
+        )
+    # Images are read now: uploads don't outlive the request, and the job must survive restarts
+    images = await read_uploads(files)
+    job_id = await job_manager.submit("process", {
+        "text": text,
+        "images": images,
+        "deckName": deckName or DEFAULT_DECK_NAME,
+        "mode": mode,
+        "use_cache": use_cache,
+        "skip_known": skip_known,
+    })
+    return JobSubmittedResponse(jobId=job_id)
+
+
+@app.post("/jobs/update_cards_red_auto", response_model=JobSubmittedResponse, status_code=status.HTTP_202_ACCEPTED)
+async def submit_red_auto_job(deck_name: str, use_cache: bool = True, offline: bool = False) -> JobSubmittedResponse:
+    """
+    With offline=true the rewrite goes through the batch backend: cheaper,
+    but results may take hours. use_cache does not apply to offline runs.
+    """
+    if offline:
+        job_id = await job_manager.submit("update_cards_red_auto_batch", {"deck_name": deck_name})
+        return JobSubmittedResponse(jobId=job_id)
+    job_id = await job_manager.submit("update_cards_red_auto", {"deck_name": deck_name, "use_cache": use_cache})
+    return JobSubmittedResponse(jobId=job_id)
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job(job_id: str) -> JobStatusResponse:
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found.")
+    return JobStatusResponse(**job)
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, last_event_id: Optional[str] = Header(None)):
+    """
+    Server-Sent Events stream of a job's progress ("status", "stage" and "card" events).
+    Reconnecting clients resume after the Last-Event-ID they received. A "reset" event
+    means the job was re-queued: drop the progress received before it, which the job
+    replays as it resumes.
+    """
+    if await job_manager.get(job_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found.")
+    after = int(last_event_id) if last_event_id and last_event_id.isdigit() else 0
+
+    async def stream():
+        async for event in job_manager.events(job_id, after=after):
+            yield f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    if not await job_manager.cancel(job_id):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Job not found or already finished.")
+    return {"status": "CANCELLING"}
+
+
 # Endpoint to get all decks
 @app.get("/get_decks", response_model=DecksResponse)
 async def get_decks():
@@ -532,6 +1085,70 @@ async def get_decks():
         )
     return {"decks": response["decks"]}
 
+# Versions of the compiled prompts, for matching metrics and cached responses to prompt changes
+@app.get("/prompts")
+async def get_prompts():
+    return {
+        name: {"version": prompt.version, "prefixTokens": estimate_tokens(prompt.prefix)}
+        for name, prompt in PROMPTS.items()
+    }
+
+
+# Hit/miss counters of the LLM response cache
+@app.get("/llm_cache_stats")
+async def llm_cache_stats():
+    return {**response_cache.stats(), "image_index": image_index.stats()}
+
+
+def _cache_metrics():
+    stats = response_cache.stats()
+    yield ("llm_cache_lookups_total", "counter", "LLM response cache lookups by result.", [
+        ({"result": "hit_memory"}, stats["hits_memory"]),
+        ({"result": "hit_disk"}, stats["hits_disk"]),
+        ({"result": "miss"}, stats["misses"]),
+    ])
+    yield ("llm_cache_hit_ratio", "gauge", "Share of LLM cache lookups served from cache.", [
+        ({}, stats["hit_rate"]),
+    ])
+    images = image_index.stats()
+    yield ("image_index_lookups_total", "counter", "Image hash index lookups by result.", [
+        ({"result": "hit"}, images["hits"]),
+        ({"result": "miss"}, images["misses"]),
+    ])
+
+
+REGISTRY.add_collector(_cache_metrics)
+
+
+# Prometheus text exposition of latency histograms and counters
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.middleware("http")
+async def record_request_metrics(request, call_next):
+    start = time.perf_counter()
+    # Each request gets its own fair-share queue in the OpenAI rate limiter
+    rate_limit_key.set(uuid.uuid4().hex)
+    response = await call_next(request)
+    # Label by route template (e.g. /jobs/{job_id}) to keep label cardinality bounded
+    route = request.scope.get("route")
+    labels = dict(method=request.method, path=getattr(route, "path", "unmatched"), status=str(response.status_code))
+    body = response.body_iterator
+
+    async def timed_body():
+        # call_next returns once the headers are ready; streamed bodies (NDJSON, SSE)
+        # take much longer, so the request is timed when its body is done
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, **labels)
+
+    response.body_iterator = timed_body()
+    return response
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -543,8 +1160,3 @@ app.add_middleware(
     allow_methods=["GET", "POST", "OPTIONS"],  # Explicitly allow OPTIONS
     allow_headers=["Content-Type", "Authorization"],  # Adjust as needed
 )
-
-# Event handler to close the httpx.AsyncClient on shutdown
-@app.on_event("shutdown")
-async def shutdown_event():
-    await anki_service.client.aclose()
@@ -0,0 +1,160 @@
+# src/metrics.py
+
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Seconds; covers in-process steps (ms) up to slow LLM calls (tens of seconds)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Sample = Tuple[Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+class Counter:
+    """Monotonic counter with labels. Meant to be updated from the event loop thread."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(labels[n] for n in self.labelnames)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram with labels."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values: Dict[tuple, list] = {}  # key -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(labels[n] for n in self.labelnames)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    @contextmanager
+    def time(self, **labels: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def timed(self, **labels: str) -> Callable:
+        """Decorator observing the duration of an async function."""
+        def decorator(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.time(**labels):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, state in self._values.items():
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': le})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {state[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List = []
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]) -> None:
+        """`collector` returns (name, type, help, [(labels, value), ...]) tuples at scrape time."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, metric_type, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                lines.extend(f"{name}{_format_labels(labels)} {value}" for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_DURATION = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Latency of backend endpoints.", ("method", "path", "status")
+))
+STAGE_DURATION = REGISTRY.register(Histogram(
+    "pipeline_stage_duration_seconds", "Latency of in-process pipeline stages.", ("stage",)
+))
+ANKI_METHOD_DURATION = REGISTRY.register(Histogram(
+    "anki_method_duration_seconds", "Latency of AnkiService methods.", ("method",)
+))
+ANKI_REQUEST_DURATION = REGISTRY.register(Histogram(
+    "anki_request_duration_seconds", "Latency of single AnkiConnect HTTP requests.", ("action",)
+))
+LLM_FUNCTION_DURATION = REGISTRY.register(Histogram(
+    "llm_function_duration_seconds", "Latency of processing functions, cache hits included.", ("function",)
+))
+LLM_REQUEST_DURATION = REGISTRY.register(Histogram(
+    "llm_request_duration_seconds", "Latency of OpenAI Responses API calls.", ("operation", "prompt_version")
+))
+LLM_RATE_LIMIT_WAIT = REGISTRY.register(Histogram(
+    "llm_rate_limit_wait_seconds", "Time OpenAI calls spent queued for rate limit budget.", ("operation",)
+))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "llm_tokens_total", "Tokens reported in Responses API usage.", ("operation", "prompt_version", "kind")
+))
+UPSTREAM_CALLS = REGISTRY.register(Counter(
+    "upstream_calls_total", "Outbound calls by service and outcome.", ("service", "operation", "outcome")
+))
+IMAGES_DEDUPLICATED = REGISTRY.register(Counter(
+    "images_deduplicated_total", "Uploaded images dropped as near-duplicates of another upload in the request.", ()
+))
+ERRORS = REGISTRY.register(Counter(
+    "errors_total", "Errors by stage and exception type.", ("stage", "type")
+))
@@ -0,0 +1,110 @@
+# src/normalize.py
+"""
+Batch normalization of Anki field values (as returned by notesInfo).
+
+normalize_fields takes a whole list of values and returns columns: the
+plain text, the [sound:...] tags each value carried, and its cloze target.
+Rather than looping over the values, it joins them with a separator
+character and runs each precompiled pattern once over the joined text;
+matches are mapped back to their value by offset.
+"""
+
+import bisect
+import html
+import re
+from dataclasses import dataclass
+from itertools import accumulate
+from typing import Any, Dict, List, Sequence
+
+from src import offload
+
+# Joins values for the batch passes; no pattern below matches across it
+_SEP = "\x1f"
+
+_SOUND_PATTERN = re.compile(r"\[sound:[^\]\x1f]+\]")
+_BREAK_PATTERN = re.compile(r"<br\s*/?>|</div>|</p>", re.IGNORECASE)
+_TAG_PATTERN = re.compile(r"<[^>\x1f]+>")
+_CLOZE_PATTERN = re.compile(r"\{\{c\d+::([^\x1f]*?)(?:::[^}\x1f]*)?\}\}")
+
+
+@dataclass
+class NormalizedFields:
+    """Columnar result of normalize_fields; entry i belongs to input value i."""
+
+    # Plain text: sound tags and HTML markup removed, entities decoded, <br>/<div> as newlines.
+    # Cloze markers are kept, since cards need them
+    text: List[str]
+    # Same text with every {{cN::...}} replaced by its content
+    plain: List[str]
+    # The [sound:...] tags, in order
+    media: List[List[str]]
+    # Lower-cased, whitespace-collapsed content of the first cloze, or ''
+    cloze: List[str]
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    def slice(self, start: int, stop: int) -> "NormalizedFields":
+        return NormalizedFields(
+            text=self.text[start:stop],
+            plain=self.plain[start:stop],
+            media=self.media[start:stop],
+            cloze=self.cloze[start:stop],
+        )
+
+
+def _owners(parts: Sequence[str]) -> List[int]:
+    """Start offset of each part in _SEP.join(parts)."""
+    return [0] + list(accumulate(len(part) + 1 for part in parts))[:-1]
+
+
+def normalize_fields(values: Sequence[str]) -> NormalizedFields:
+    """Normalizes a batch of field values in one pass per pattern (see NormalizedFields)."""
+    if not values:
+        return NormalizedFields(text=[], plain=[], media=[], cloze=[])
+    values = [(value or "").replace(_SEP, " ") for value in values]
+    blob = _SEP.join(values)
+
+    media: List[List[str]] = [[] for _ in values]
+    starts = _owners(values)
+    for match in _SOUND_PATTERN.finditer(blob):
+        media[bisect.bisect_right(starts, match.start()) - 1].append(match.group(0))
+
+    blob = _SOUND_PATTERN.sub("", blob)
+    blob = html.unescape(_TAG_PATTERN.sub("", _BREAK_PATTERN.sub("\n", blob)))
+    text = [part.strip() for part in blob.split(_SEP)]
+
+    blob = _SEP.join(text)
+    cloze = [""] * len(text)
+    starts = _owners(text)
+    for match in _CLOZE_PATTERN.finditer(blob):
+        i = bisect.bisect_right(starts, match.start()) - 1
+        if not cloze[i]:
+            cloze[i] = " ".join(match.group(1).lower().split())
+    plain = _CLOZE_PATTERN.sub(r"\1", blob).split(_SEP)
+    return NormalizedFields(text=text, plain=plain, media=media, cloze=cloze)
+
+
+async def normalize_fields_async(values: Sequence[str]) -> NormalizedFields:
+    """normalize_fields in the process pool when the batch is large (see offload.run)."""
+    return await offload.run(
+        normalize_fields, list(values), kind="process", size=sum(len(value or "") for value in values)
+    )
+
+
+def field_values(infos: Sequence[Dict[str, Any]], name: str) -> List[str]:
+    """The `name` field of each notesInfo entry, '' where it is missing."""
+    return [info.get("fields", {}).get(name, {}).get("value", "") for info in infos]
+
+
+async def normalize_notes(infos: Sequence[Dict[str, Any]], names: Sequence[str] = ("Front", "Back")) -> Dict[str, NormalizedFields]:
+    """
+    Normalizes the `names` fields of notesInfo entries as one batch; returns
+    a column set per field name, in the order of `infos`.
+    """
+    values: List[str] = []
+    for name in names:
+        values.extend(field_values(infos, name))
+    result = await normalize_fields_async(values)
+    n = len(infos)
+    return {name: result.slice(i * n, (i + 1) * n) for i, name in enumerate(names)}
@@ -0,0 +1,98 @@
+# src/offload.py
+"""
+Runs CPU-bound work off the event loop, so a large batch doesn't stall
+every other request.
+
+Two pools, created on first use:
+- "thread" for work that releases the GIL or is a short C call on a big
+  input (base64, json.loads, Pillow). Even while it holds the GIL, the loop
+  gets it back every switch interval instead of waiting for the whole call.
+- "process" for pure-Python transforms over many cards (regex loops) that
+  would hold the GIL throughout. The function and its arguments must be
+  picklable, i.e. module-level functions and plain data.
+
+Inputs below OFFLOAD_MIN_SIZE run inline: for them the hand-off costs more
+than it saves. set_executor plugs in another pool, or None to run a kind
+inline everywhere.
+"""
+
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Bytes or characters of input below which work stays on the event loop
+OFFLOAD_MIN_SIZE = int(os.getenv("OFFLOAD_MIN_SIZE", "65536"))
+OFFLOAD_THREAD_WORKERS = int(os.getenv("OFFLOAD_THREAD_WORKERS", "4"))
+# 0 sends "process" work to the thread pool instead
+OFFLOAD_PROCESS_WORKERS = int(os.getenv("OFFLOAD_PROCESS_WORKERS", "2"))
+
+
+def _thread_pool() -> Executor:
+    return ThreadPoolExecutor(max_workers=OFFLOAD_THREAD_WORKERS, thread_name_prefix="offload")
+
+
+def _process_pool() -> Optional[Executor]:
+    if OFFLOAD_PROCESS_WORKERS <= 0:
+        return _get("thread")
+    # spawn, not fork: the server process already runs threads
+    return ProcessPoolExecutor(max_workers=OFFLOAD_PROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+
+_FACTORIES: Dict[str, Callable[[], Optional[Executor]]] = {"thread": _thread_pool, "process": _process_pool}
+_executors: Dict[str, Optional[Executor]] = {}
+# Pools created here, as opposed to ones passed to set_executor
+_owned: Dict[str, Executor] = {}
+
+
+def _get(kind: str) -> Optional[Executor]:
+    if kind not in _executors:
+        executor = _FACTORIES[kind]()
+        _executors[kind] = executor
+        if executor is not None:
+            _owned[kind] = executor
+    return _executors[kind]
+
+
+def set_executor(kind: str, executor: Optional[Executor]) -> None:
+    """Uses `executor` for `kind` work from now on; None runs it inline on the event loop."""
+    if kind not in _FACTORIES:
+        raise ValueError(f"Unknown executor kind: {kind}")
+    _executors[kind] = executor
+
+
+async def run(func: Callable[..., T], *args: Any, kind: str = "thread", size: Optional[int] = None) -> T:
+    """
+    func(*args) in the `kind` pool. With a `size` (bytes, characters) below
+    OFFLOAD_MIN_SIZE it runs inline instead.
+    """
+    if size is not None and size < OFFLOAD_MIN_SIZE:
+        return func(*args)
+    executor = _get(kind)
+    if executor is None:
+        return func(*args)
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(executor, functools.partial(func, *args))
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM-killed); start a fresh pool next time and do this one here
+        logger.error(f"{kind} pool broken; running {getattr(func, '__name__', func)} inline")
+        _executors.pop(kind, None)
+        _owned.pop(kind, None)
+        return func(*args)
+
+
+def shutdown() -> None:
+    """Stops the pools created here; called on server shutdown."""
+    for executor in set(_owned.values()):
+        executor.shutdown(wait=False, cancel_futures=True)
+    _owned.clear()
+    _executors.clear()
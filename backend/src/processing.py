@@ -1,117 +1,404 @@
+import asyncio
 import httpx
+import importlib.util
 import json
-from openai import AsyncOpenAI
-import openai
+import logging
 import os
-from typing import List, Dict
-from src.prompts import get_extract_text_prompt, get_extract_image_prompt, get_change_pairs_prompt
+from typing import Any, AsyncIterator, Callable, List, Dict, Optional, Tuple
+from src.prompts import CHANGE_PAIRS, EXTRACT_IMAGE, EXTRACT_IMAGES, EXTRACT_TEXT, Prompt
+from src.cache import ResponseCache, make_cache_key
+from src.image_index import ImageIndex
+from src.images import IMAGE_DEDUP_DISTANCE
+from src.ratelimit import RateLimiter, estimate_request_tokens
+from src.adaptive import ChunkOutputError
+from src import offload
+from src.json_stream import CardStreamParser
+from src.chunking import estimate_tokens, split_text
+from src.utils import card_key, merge_streams
+from src.metrics import (
+    ERRORS,
+    LLM_FUNCTION_DURATION,
+    LLM_RATE_LIMIT_WAIT,
+    LLM_REQUEST_DURATION,
+    LLM_TOKENS,
+    UPSTREAM_CALLS,
+)
+
+logger = logging.getLogger(__name__)
 
 
 proxy_url = os.getenv("OPENAI_PROXY")
-if proxy_url is not None and proxy_url != "":
-    http_client = httpx.AsyncClient(proxy=proxy_url)
-else:
-    http_client = httpx.AsyncClient()
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# Connection pool of the OpenAI client. Idle connections are kept for
+# OPENAI_KEEPALIVE_EXPIRY seconds so bursts of calls skip the TLS handshake;
+# HTTP/2 (multiplexing calls over one connection) is used when h2 is installed.
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "10"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "true").lower() in ("1", "true", "yes")
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("OpenAI API key is not set in environment variables.")
+# Created by get_client() on first use, so importing this module (and serving
+# routes that never call the model) does not load the openai package
+client = None
 
-client = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client)
 
+def get_client():
+    """Returns the shared AsyncOpenAI client, creating it on first use."""
+    global client
+    if client is None:
+        from openai import AsyncOpenAI
 
+        if not OPENAI_API_KEY:
+            raise ValueError("OpenAI API key is not set in environment variables.")
+        http_client = httpx.AsyncClient(
+            proxy=proxy_url or None,
+            http2=OPENAI_HTTP2 and importlib.util.find_spec("h2") is not None,
+            timeout=httpx.Timeout(600.0, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+                keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+            ),
+        )
+        # No SDK retries: a 429 retried inside the SDK would bypass the shared
+        # rate limiter's pause; _call_model does all retrying
+        client = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client, max_retries=0)
+    return client
 
-# Asynchronous function to process text with OpenAI API
-async def extract_pairs_from_text(text: str):
-    # return [{"Front": "knack for", "Back": "An aptitude for doing something."},
-    #         {"Front": "knack for", "Back": "An aptitude for doing something."},
-    #         {"Front": "knack for", "Back": "An aptitude for doing something."},
-            # {"Front": "knack for", "Back": "An aptitude for doing something."},
-    #         {"Front": "knack for", "Back": "An aptitude for doing something."},
-    #         {"Front": "knack for", "Back": "An aptitude for doing something."},
-    #         {"Front": "knack for", "Back": "An aptitude for doing something."},
-    #         {"Front": "knack for", "Back": "An aptitude for doing something."},
-    #         {"Front": "knack for", "Back": "An aptitude for doing something."},
-    #         {"Front": "knack for", "Back": "An aptitude for doing something."},
-    #         {"Front": "knack for", "Back": "An aptitude for doing something."},
-    #         {"Front": "knack for", "Back": "An aptitude for doing something."},
-    #         {"Front": "knack for", "Back": "An aptitude for doing something."}]
-    prompt = get_extract_text_prompt()
+
+async def close_client() -> None:
+    """Closes the OpenAI client and its connection pool, if one was created."""
+    global client
+    if client is not None:
+        await client.close()
+        client = None
+
+# Long text is split into segments of about this many input tokens, extracted concurrently
+TEXT_SEGMENT_TOKENS = int(os.getenv("TEXT_SEGMENT_TOKENS", "1500"))
+TEXT_SEGMENT_CONCURRENCY = int(os.getenv("TEXT_SEGMENT_CONCURRENCY", "4"))
+
+# Output budget of one change_anki_pairs call; red card chunks are sized to fit it
+CHANGE_PAIRS_MAX_OUTPUT_TOKENS = int(os.getenv("CHANGE_PAIRS_MAX_OUTPUT_TOKENS", "4096"))
+# Timeout of a call = LLM_TIMEOUT_BASE + its output budget at LLM_MIN_OUTPUT_RATE tokens/second,
+# so a chunk sized to fill the budget is not cut off by a fixed timeout
+LLM_TIMEOUT_BASE = float(os.getenv("LLM_TIMEOUT_BASE", "20"))
+LLM_MIN_OUTPUT_RATE = float(os.getenv("LLM_MIN_OUTPUT_RATE", "40"))
+
+
+def output_timeout(max_output_tokens: int) -> float:
+    """Seconds to allow a call that may generate up to `max_output_tokens` tokens."""
+    return LLM_TIMEOUT_BASE + max_output_tokens / LLM_MIN_OUTPUT_RATE
+
+# Cache of model outputs keyed on (model, instructions, schema, input)
+response_cache = ResponseCache(
+    os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3"),
+    memory_items=int(os.getenv("LLM_CACHE_MEMORY_ITEMS", "256")),
+    max_bytes=int(os.getenv("LLM_CACHE_MAX_MB", "100")) * 1024 * 1024,
+    max_age=float(os.getenv("LLM_CACHE_MAX_AGE_DAYS", "30")) * 24 * 3600,
+)
+
+# Cards extracted per image, found by perceptual hash so near-duplicate
+# screenshots (not just byte-identical ones) skip the vision call
+image_index = ImageIndex(
+    os.getenv("IMAGE_INDEX_PATH", "image_index.sqlite3"),
+    max_distance=IMAGE_DEDUP_DISTANCE,
+    max_entries=int(os.getenv("IMAGE_INDEX_MAX_ENTRIES", "20000")),
+)
+
+# Shared OpenAI budget (0 disables a limit). Images are counted as a flat
+# LLM_IMAGE_TOKENS each; 429s are retried after Retry-After up to LLM_RATE_LIMIT_RETRIES times.
+# Each of the WEB_CONCURRENCY server processes gets an equal share of the budget.
+LLM_IMAGE_TOKENS = int(os.getenv("LLM_IMAGE_TOKENS", "1000"))
+LLM_RATE_LIMIT_RETRIES = int(os.getenv("LLM_RATE_LIMIT_RETRIES", "5"))
+# Connection errors and 5xx are retried this many times with backoff (timeouts are not)
+LLM_SERVER_ERROR_RETRIES = int(os.getenv("LLM_SERVER_ERROR_RETRIES", "2"))
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+
+def _worker_share(limit: int) -> int:
+    return max(1, limit // WEB_CONCURRENCY) if limit > 0 else 0
+
+
+rate_limiter = RateLimiter(
+    rpm=_worker_share(int(os.getenv("LLM_RPM", "500"))),
+    tpm=_worker_share(int(os.getenv("LLM_TPM", "200000"))),
+)
+
+
+def _retry_after(exc: Exception, attempt: int) -> float:
+    """Seconds to wait before a retry: Retry-After(-ms) headers if present, else exponential backoff."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
     try:
-        resp = await client.responses.create(
-            model="gpt-4o-mini-2024-07-18",
-            instructions=prompt,
-            input=json.dumps(text),
-            text={
-                "format": {
-                    "type": "json_schema",
-                    "name": "Anki_cards",
-                    "strict": True,
-                    "schema": {
-                        "type": "object",
-                        "properties": {
-                            "Cards": {
-                                "type": "array",
-                                "items": {
-                                    "type": "array",
-                                    "items": {
-                                        "type": "object",
-                                        "properties": {
-                                            "Front": {"type": "string",
-                                                    "description": "One sentence with EXACTLY ONE {{c1::...}} around the target, then newline + [short English definition]"},
-                                            "Back":  {"type": "string",
-                                                    "description": "1–3 short synonyms/near-phrases, comma-separated"}
-                                        },
-                                        "required": ["Front", "Back"],
-                                        "additionalProperties": False
-                                    },
-                                },
-                            },
-                        },
-                        "required": ["Cards"],
-                        "additionalProperties": False,
-                    },
-                },
-            },
-            timeout=30,
-            max_output_tokens=1024,
-        )
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return min(60.0, 2.0 ** attempt)
 
+
+def _response_text(resp) -> str:
+    """Returns the output text of a Responses API result, concatenating output_text items if needed."""
+    output_str = None
+    try:
+        output_str = resp.output_text
+    except Exception:
         output_str = None
+
+    if not output_str:
+        chunks = []
+        for item in getattr(resp, "output", []) or []:
+            if getattr(item, "type", None) == "message":
+                for c in getattr(item, "content", []) or []:
+                    if getattr(c, "type", None) == "output_text" and isinstance(getattr(c, "text", None), str):
+                        chunks.append(c.text)
+        output_str = "".join(chunks).strip()
+    return output_str
+
+
+async def _call_model(operation: str, reserved: int, **request: Any):
+    """
+    client.responses.create under the shared rate limiter. 429s pause the
+    limiter for Retry-After and are retried; connection errors and 5xx are
+    retried after a backoff (the client itself does not retry). Any other
+    error releases the reserved tokens and propagates.
+    """
+    llm = get_client()
+    import openai
+
+    rate_limited = server_errors = 0
+    while True:
+        LLM_RATE_LIMIT_WAIT.observe(await rate_limiter.acquire(reserved), operation=operation)
         try:
-            output_str = resp.output_text
-        except Exception:
-            output_str = None
-
-        if not output_str:
-            chunks = []
-            for item in getattr(resp, "output", []) or []:
-                if getattr(item, "type", None) == "message":
-                    for c in getattr(item, "content", []) or []:
-                        if getattr(c, "type", None) == "output_text" and isinstance(getattr(c, "text", None), str):
-                            chunks.append(c.text)
-            output_str = "".join(chunks).strip()
-
-        if output_str:
-            data = json.loads(output_str)
-            pairs_out = data.get("Cards", [])
-            return pairs_out
-        else:
-            raise ValueError("No response.")
+            return await llm.responses.create(**request)
+        except openai.RateLimitError as e:
+            rate_limiter.release(reserved, 0)
+            UPSTREAM_CALLS.inc(service="openai", operation=operation, outcome="rate_limited")
+            if getattr(e, "code", None) == "insufficient_quota" or rate_limited >= LLM_RATE_LIMIT_RETRIES:
+                raise
+            rate_limiter.pause(_retry_after(e, rate_limited))
+            rate_limited += 1
+        except (openai.APIConnectionError, openai.InternalServerError) as e:
+            rate_limiter.release(reserved, 0)
+            UPSTREAM_CALLS.inc(service="openai", operation=operation, outcome="error")
+            if isinstance(e, openai.APITimeoutError) or server_errors >= LLM_SERVER_ERROR_RETRIES:
+                raise
+            await asyncio.sleep(_retry_after(e, server_errors))
+            server_errors += 1
+        except BaseException:
+            rate_limiter.release(reserved, 0)
+            UPSTREAM_CALLS.inc(service="openai", operation=operation, outcome="error")
+            raise
 
-    except Exception as e:
-        print(f"OpenAI API error: {e}")
-        return []
-    
-    
-# Asynchronous function to process image with OpenAI API
-async def extract_pairs_from_image(base64_image, image_caption=""):    
+
+def _record_result(operation: str, prompt_version: str, reserved: int, resp) -> None:
+    """Counts a finished response in metrics and settles its token reservation; raises if it is incomplete."""
+    UPSTREAM_CALLS.inc(service="openai", operation=operation, outcome="ok")
+    usage = getattr(resp, "usage", None)
+    if usage is not None:
+        input_tokens = getattr(usage, "input_tokens", 0) or 0
+        output_tokens = getattr(usage, "output_tokens", 0) or 0
+        # Input tokens served from the provider's prompt-prefix cache
+        cached_tokens = getattr(getattr(usage, "input_tokens_details", None), "cached_tokens", 0) or 0
+        labels = dict(operation=operation, prompt_version=prompt_version)
+        LLM_TOKENS.inc(input_tokens, kind="input", **labels)
+        LLM_TOKENS.inc(cached_tokens, kind="cached_input", **labels)
+        LLM_TOKENS.inc(output_tokens, kind="output", **labels)
+        rate_limiter.release(reserved, input_tokens + output_tokens)
+    if getattr(resp, "status", None) == "incomplete":
+        reason = getattr(getattr(resp, "incomplete_details", None), "reason", None)
+        raise ChunkOutputError(f"Model output incomplete: {reason}", truncated=reason == "max_output_tokens")
+
+
+def _cache_key(request: Dict[str, Any]) -> str:
+    return make_cache_key(request["model"], request["instructions"], request["text"], request["input"])
+
+
+async def _decode_json(text: str) -> Any:
+    """json.loads, off the event loop for large model outputs (see offload.run)."""
+    return await offload.run(json.loads, text, size=len(text))
+
+
+def _flatten_cards(data: Dict[str, Any]) -> List[Dict[str, str]]:
+    """Cards of a {"Cards": [...]} result; nested lists (text schema) are flattened."""
+    pairs_out = []
+    for item in data.get("Cards", []):
+        pairs_out.extend(item if isinstance(item, list) else [item])
+    return pairs_out
+
+
+async def _create_json(
+    operation: str,
+    use_cache: bool = True,
+    validate: Optional[Callable[[Dict[str, Any]], None]] = None,
+    **request: Any,
+) -> Dict[str, Any]:
+    """
+    Calls client.responses.create and returns the decoded JSON output.
+    Successful outputs are stored in response_cache; with use_cache=False the
+    lookup is skipped (the fresh result still refreshes the cache).
+    `validate` raises for decoded output the caller can't use; such output is
+    neither cached nor served from the cache. `operation` labels the call in metrics.
+    """
+    key = _cache_key(request)
+    if use_cache:
+        cached = await response_cache.get(key)
+        if cached is not None:
+            data = await _decode_json(cached)
+            try:
+                if validate:
+                    validate(data)
+                return data
+            except ChunkOutputError as e:
+                logger.warning(f"Ignoring cached {operation} output: {e}")
+
+    reserved = estimate_request_tokens(request, image_tokens=LLM_IMAGE_TOKENS)
+    prompt_version = _prompt_version(request)
+    with LLM_REQUEST_DURATION.time(operation=operation, prompt_version=prompt_version):
+        resp = await _call_model(operation, reserved, **request)
+    _record_result(operation, prompt_version, reserved, resp)
+    output_str = _response_text(resp)
+    if not output_str:
+        raise ValueError("No content returned by the model")
+    data = await _decode_json(output_str)
+    if validate:
+        validate(data)
+    await response_cache.set(key, output_str)
+    return data
+
+
+async def _stream_cards(operation: str, use_cache: bool = True, **request: Any) -> AsyncIterator[Dict[str, str]]:
+    """
+    Streaming counterpart of _create_json for {"Cards": [...]} outputs: reads
+    the Responses event stream and yields each card as soon as its JSON object
+    is complete. Cached outputs are replayed; complete outputs are cached.
+    """
+    key = _cache_key(request)
+    if use_cache:
+        cached = await response_cache.get(key)
+        if cached is not None:
+            for card in _flatten_cards(await _decode_json(cached)):
+                yield card
+            return
+
+    reserved = estimate_request_tokens(request, image_tokens=LLM_IMAGE_TOKENS)
+    parser = CardStreamParser()
+    final = None
+    prompt_version = _prompt_version(request)
+    with LLM_REQUEST_DURATION.time(operation=operation, prompt_version=prompt_version):
+        stream = await _call_model(operation, reserved, stream=True, **request)
+        try:
+            # Closes the upstream connection when the consumer stops early (client gone,
+            # cancelled by merge_streams) or an error event is raised below
+            async with stream:
+                async for event in stream:
+                    event_type = getattr(event, "type", "")
+                    if event_type == "response.output_text.delta":
+                        for card in parser.feed(event.delta):
+                            yield card
+                    elif event_type in ("response.completed", "response.incomplete"):
+                        final = event.response
+                    elif event_type == "response.failed":
+                        error = getattr(event.response, "error", None)
+                        raise RuntimeError(f"Model response failed: {getattr(error, 'message', error)}")
+                    elif event_type == "error":
+                        raise RuntimeError(f"Model stream error: {getattr(event, 'message', event)}")
+        finally:
+            if final is None:
+                rate_limiter.release(reserved, 0)
+                UPSTREAM_CALLS.inc(service="openai", operation=operation, outcome="error")
+    if final is None:
+        raise ValueError("Model stream ended without a final response")
+    _record_result(operation, prompt_version, reserved, final)
+    await _decode_json(parser.text)  # only cache complete, valid output
+    await response_cache.set(key, parser.text)
+
+
+def _prompt_fields(prompt: Prompt) -> Dict[str, Any]:
+    """
+    Request fields taken from a compiled prompt. prompt_cache_key routes calls
+    sharing the prompt prefix together so the provider's prefix cache hits;
+    the version is also sent as metadata and used to label metrics.
+    """
+    return dict(
+        instructions=prompt.instructions,
+        text=prompt.schema,
+        prompt_cache_key=prompt.version,
+        metadata={"prompt_version": prompt.version},
+    )
+
+
+def _prompt_version(request: Dict[str, Any]) -> str:
+    return (request.get("metadata") or {}).get("prompt_version", "")
+
+
+IMAGE_MODEL = "gpt-4o-mini-2024-07-18"
+# Single-image and packed extractions share image_index entries; changing either prompt invalidates them
+IMAGE_INDEX_VERSION = f"{IMAGE_MODEL}:{EXTRACT_IMAGE.version}:{EXTRACT_IMAGES.version}"
+
+
+def extract_text_request(text: str) -> Dict[str, Any]:
+    """Responses API request body for extracting cards from one text segment."""
+    return dict(
+        model="gpt-4o-mini-2024-07-18",
+        input=json.dumps(text),
+        max_output_tokens=1024,
+        **_prompt_fields(EXTRACT_TEXT),
+    )
+
+
+def extract_image_request(base64_image: str, image_caption: str = "", mime_type: str = "image/jpeg") -> Dict[str, Any]:
+    """Responses API request body for extracting cards from one image."""
+    user_content = []
+    if image_caption:
+        user_content.append({
+            "type": "input_text",
+            "text": "Image caption: " + image_caption,
+        })
+    user_content.append({
+        "type": "input_image",
+        "image_url": f"data:{mime_type};base64,{base64_image}",
+    })
+    return dict(
+        model=IMAGE_MODEL,
+        input=[{"role": "user", "content": user_content}],
+        max_output_tokens=1024,
+        **_prompt_fields(EXTRACT_IMAGE),
+    )
+
+
+def extract_images_request(images: List[Dict[str, str]]) -> Dict[str, Any]:
+    """
+    Responses API request body for extracting cards from several images in one
+    call. Each image (base64, mime_type and filename, see main.read_upload)
+    follows an "Image N: <filename>" label that the cards refer back to.
+    """
+    user_content = []
+    for n, image in enumerate(images, 1):
+        user_content.append({
+            "type": "input_text",
+            "text": f"Image {n}: {image.get('filename') or ''}",
+        })
+        user_content.append({
+            "type": "input_image",
+            "image_url": f"data:{image['mime_type']};base64,{image['base64']}",
+        })
+    return dict(
+        model=IMAGE_MODEL,
+        input=[{"role": "user", "content": user_content}],
+        max_output_tokens=1024 * len(images),
+        **_prompt_fields(EXTRACT_IMAGES),
+    )
+
+
+@LLM_FUNCTION_DURATION.timed(function="extract_text_segment")
+async def _extract_pairs_from_segment(text: str, use_cache: bool = True) -> List[Dict[str, str]]:
     # return [{"Front": "knack for", "Back": "An aptitude for doing something."},
     #         {"Front": "knack for", "Back": "An aptitude for doing something."},
     #         {"Front": "knack for", "Back": "An aptitude for doing something."},
-    #         {"Front": "knack for", "Back": "An aptitude for doing something."},
-    #         {"Front": "knack for", "Back": "An aptitude for doing something."},
+            # {"Front": "knack for", "Back": "An aptitude for doing something."},
     #         {"Front": "knack for", "Back": "An aptitude for doing something."},
     #         {"Front": "knack for", "Back": "An aptitude for doing something."},
     #         {"Front": "knack for", "Back": "An aptitude for doing something."},
@@ -121,86 +408,308 @@ async def extract_pairs_from_image(base64_image, image_caption=""):
     #         {"Front": "knack for", "Back": "An aptitude for doing something."},
     #         {"Front": "knack for", "Back": "An aptitude for doing something."},
     #         {"Front": "knack for", "Back": "An aptitude for doing something."}]
-    """Send an image and caption to OpenAI for structured processing and return extracted information."""
     try:
-        user_content = []
-        if image_caption:
-            user_content.append({
-                "type": "input_text",
-                "text": "Image caption: " + image_caption,
-            })
-        user_content.append({
-            "type": "input_image",
-            "image_url": f"data:image/jpeg;base64,{base64_image}",
-        })
+        data = await _create_json("extract_text", use_cache=use_cache, timeout=30, **extract_text_request(text))
+    except (ChunkOutputError, json.JSONDecodeError) as e:
+        # Output cut off: extract the halves of the segment separately
+        truncated = getattr(e, "truncated", True)
+        parts = split_text(text, max_tokens=estimate_tokens(text) // 2) if truncated else [text]
+        if len(parts) < 2:
+            ERRORS.inc(stage="extract_text", type=type(e).__name__)
+            logger.error(f"Text extraction failed: {e}")
+            return []
+        logger.warning(f"Text extraction of {estimate_tokens(text)} tokens failed ({e}); retrying as {len(parts)} parts")
+        results = await asyncio.gather(*(_extract_pairs_from_segment(part, use_cache=use_cache) for part in parts))
+        return [card for cards in results for card in cards]
+    except Exception as e:
+        ERRORS.inc(stage="extract_text", type=type(e).__name__)
+        logger.error(f"OpenAI API error: {e}")
+        return []
+    # The schema nests cards in lists; flatten them to a plain list of {Front, Back}
+    return _flatten_cards(data)
+
+
+async def iter_pairs_from_text(text: str, use_cache: bool = True) -> AsyncIterator[List[Dict[str, str]]]:
+    """
+    Splits long text into token-budgeted segments, extracts cards from them
+    concurrently and yields each segment's new cards as soon as it completes.
+    Cards whose cloze target (or Front) was already yielded are dropped.
+    """
+    segments = split_text(text, max_tokens=TEXT_SEGMENT_TOKENS)
+    semaphore = asyncio.Semaphore(TEXT_SEGMENT_CONCURRENCY)
 
-        resp = await client.responses.create(
-            model="gpt-4o-mini-2024-07-18",
-            instructions=get_extract_image_prompt(),
-            input=[{"role": "user", "content": user_content}],
-            text={
-                "format": {
-                    "type": "json_schema",
-                    "name": "image_cards_extraction",
-                    "strict": True,
-                    "schema": {
-                        "type": "object",
-                        "properties": {
-                            "Cards": {
-                                "type": "array",
-                                "items": {
-                                    "type": "object",
-                                    "properties": {
-                                        "Front": {
-                                            "type": "string",
-                                            "description": "One sentence with EXACTLY ONE {{c1::...}} around the target, then newline + [short English definition]",
-                                        },
-                                        "Back": {
-                                            "type": "string",
-                                            "description": "1–3 short synonyms/near-phrases, comma-separated",
-                                        },
-                                    },
-                                    "required": ["Front", "Back"],
-                                    "additionalProperties": False,
-                                },
-                            },
-                        },
-                        "required": ["Cards"],
-                        "additionalProperties": False,
-                    },
-                }
-            },
-            max_output_tokens=1024,
+    async def extract(segment: str):
+        async with semaphore:
+            return await _extract_pairs_from_segment(segment, use_cache=use_cache)
+
+    seen = set()
+    for future in asyncio.as_completed([extract(segment) for segment in segments]):
+        new_cards = []
+        for card in await future:
+            key = card_key(card)
+            if key in seen:
+                continue
+            seen.add(key)
+            new_cards.append(card)
+        yield new_cards
+
+
+# Asynchronous function to process text with OpenAI API
+@LLM_FUNCTION_DURATION.timed(function="extract_pairs_from_text")
+async def extract_pairs_from_text(text: str, use_cache: bool = True) -> List[Dict[str, str]]:
+    pairs_out = []
+    async for cards in iter_pairs_from_text(text, use_cache=use_cache):
+        pairs_out.extend(cards)
+    return pairs_out
+    
+    
+def _image_number(card: Dict[str, Any], count: int) -> Optional[int]:
+    """0-based position of the image a packed-extraction card names, or None if it names none of the `count` images."""
+    number = card.get("Image")
+    if isinstance(number, int) and 1 <= number <= count:
+        return number - 1
+    logger.warning(f"Dropping card attributed to unknown image {number!r}: {card.get('Front')!r}")
+    return None
+
+
+async def _extract_image_group(images: List[Dict[str, str]], use_cache: bool) -> List[List[Dict[str, str]]]:
+    """
+    One vision call for all of `images`; returns each image's cards. A packed
+    answer cut off by max_output_tokens is retried as two smaller packs.
+    """
+    if len(images) == 1:
+        image = images[0]
+        request = extract_image_request(image["base64"], image.get("filename") or "", image["mime_type"])
+        data = await _create_json("extract_image", use_cache=use_cache, **request)
+        return [data.get("Cards", [])]
+    try:
+        data = await _create_json("extract_images", use_cache=use_cache, **extract_images_request(images))
+    except ChunkOutputError as e:
+        half = len(images) // 2
+        logger.warning(f"Packed extraction of {len(images)} images failed ({e}); retrying as {half} + {len(images) - half}")
+        first, second = await asyncio.gather(
+            _extract_image_group(images[:half], use_cache), _extract_image_group(images[half:], use_cache)
         )
+        return first + second
+    per_image: List[List[Dict[str, str]]] = [[] for _ in images]
+    for card in data.get("Cards", []):
+        n = _image_number(card, len(images))
+        if n is not None:
+            per_image[n].append({"Front": card["Front"], "Back": card["Back"]})
+    return per_image
 
-        output_str = None
+
+@LLM_FUNCTION_DURATION.timed(function="extract_pairs_from_images")
+async def extract_pairs_from_images(images: List[Dict[str, str]], use_cache: bool = True) -> List[List[Dict[str, str]]]:
+    """
+    Extracts cards from several images with one vision call and returns each
+    image's cards, in order. `images` are dicts with base64, filename,
+    mime_type and an optional hash, as built by main.read_upload. Every card
+    of a packed answer names its image, so results map back to the uploads.
+
+    Images whose near-duplicate is in image_index are not sent; new results
+    are added to it.
+    """
+    results: List[Optional[List[Dict[str, str]]]] = [None] * len(images)
+    if use_cache:
+        for i, image in enumerate(images):
+            if image.get("hash"):
+                results[i] = await image_index.lookup(image["hash"], IMAGE_INDEX_VERSION)
+                if results[i] is not None:
+                    logger.info(f"Reusing cards of a near-duplicate of image {image.get('filename')!r}")
+    pending = [i for i, pairs in enumerate(results) if pairs is None]
+    if pending:
         try:
-            output_str = resp.output_text
-        except Exception:
-            output_str = None
-
-        if not output_str:
-            chunks = []
-            for item in getattr(resp, "output", []) or []:
-                if getattr(item, "type", None) == "message":
-                    for c in getattr(item, "content", []) or []:
-                        if getattr(c, "type", None) == "output_text" and isinstance(getattr(c, "text", None), str):
-                            chunks.append(c.text)
-            output_str = "".join(chunks).strip()
-
-        if output_str:
-            data = json.loads(output_str)
-            pairs = data.get("Cards", [])
-            return pairs
-        else:
-            raise ValueError("No response.")
+            extracted = await _extract_image_group([images[i] for i in pending], use_cache)
+        except Exception as e:
+            ERRORS.inc(stage="extract_image", type=type(e).__name__)
+            logger.error(f"OpenAI API error: {e}")
+            extracted = [[] for _ in pending]
+        for i, pairs in zip(pending, extracted):
+            results[i] = pairs
+            if images[i].get("hash") and pairs:
+                await image_index.add(images[i]["hash"], IMAGE_INDEX_VERSION, pairs)
+    return results
 
+
+# Asynchronous function to process image with OpenAI API
+@LLM_FUNCTION_DURATION.timed(function="extract_pairs_from_image")
+async def extract_pairs_from_image(
+    base64_image,
+    image_caption="",
+    use_cache: bool = True,
+    mime_type: str = "image/jpeg",
+    image_hash: Optional[str] = None,
+):
+    """
+    Send an image and caption to OpenAI for structured processing and return extracted information.
+
+    With `image_hash` (see images.image_hash), cards of a near-duplicate image
+    extracted earlier are reused from image_index, and new results are added to it.
+    """
+    image = {"base64": base64_image, "filename": image_caption, "mime_type": mime_type, "hash": image_hash}
+    return (await extract_pairs_from_images([image], use_cache=use_cache))[0]
+
+
+async def _stream_or_log(stage: str, cards: AsyncIterator[Dict[str, str]]) -> AsyncIterator[Dict[str, str]]:
+    """Passes cards through; a failing stream is logged and ends early, keeping the cards already sent."""
+    try:
+        async for card in cards:
+            yield card
     except Exception as e:
-        print(f"OpenAI API error: {e}")
-        return []
+        ERRORS.inc(stage=stage, type=type(e).__name__)
+        logger.error(f"OpenAI API error: {e}")
 
 
-async def change_anki_pairs(pairs: List[Dict[str, str]]) -> List[List[Dict[str, str]]]:
+async def stream_pairs_from_text(text: str, use_cache: bool = True) -> AsyncIterator[Dict[str, str]]:
+    """
+    Streaming version of iter_pairs_from_text: segments are extracted
+    concurrently and each card is yielded as soon as the model finishes it.
+    Cards whose cloze target (or Front) was already yielded are dropped.
+    """
+    segments = split_text(text, max_tokens=TEXT_SEGMENT_TOKENS)
+    semaphore = asyncio.Semaphore(TEXT_SEGMENT_CONCURRENCY)
+
+    def extract(segment: str) -> AsyncIterator[Dict[str, str]]:
+        cards = _stream_cards("extract_text", use_cache=use_cache, timeout=30, **extract_text_request(segment))
+        return _stream_or_log("extract_text", cards)
+
+    seen = set()
+    async for card in merge_streams([extract(segment) for segment in segments], semaphore):
+        key = card_key(card)
+        if key in seen:
+            continue
+        seen.add(key)
+        yield card
+
+
+async def _stream_image_group(
+    images: List[Dict[str, str]], use_cache: bool
+) -> AsyncIterator[Tuple[int, Dict[str, str]]]:
+    """Streaming version of _extract_image_group: yields (image position, card) pairs."""
+    if len(images) == 1:
+        image = images[0]
+        request = extract_image_request(image["base64"], image.get("filename") or "", image["mime_type"])
+        async for card in _stream_cards("extract_image", use_cache=use_cache, **request):
+            yield 0, card
+        return
+    async for card in _stream_cards("extract_images", use_cache=use_cache, **extract_images_request(images)):
+        n = _image_number(card, len(images))
+        if n is not None:
+            yield n, {"Front": card["Front"], "Back": card["Back"]}
+
+
+async def stream_pairs_from_images(images: List[Dict[str, str]], use_cache: bool = True) -> AsyncIterator[Dict[str, str]]:
+    """
+    Streaming version of extract_pairs_from_images. Cards reused from
+    image_index come first; the rest are yielded as the model writes them.
+    """
+    pending = []
+    for image in images:
+        cached = None
+        if use_cache and image.get("hash"):
+            cached = await image_index.lookup(image["hash"], IMAGE_INDEX_VERSION)
+        if cached is None:
+            pending.append(image)
+            continue
+        for card in cached:
+            yield card
+    if not pending:
+        return
+    collected: List[List[Dict[str, str]]] = [[] for _ in pending]
+    try:
+        async for n, card in _stream_image_group(pending, use_cache):
+            collected[n].append(card)
+            yield card
+    except Exception as e:
+        # Keep the cards already sent, but don't index a partial answer
+        ERRORS.inc(stage="extract_image", type=type(e).__name__)
+        logger.error(f"OpenAI API error: {e}")
+        return
+    for image, pairs in zip(pending, collected):
+        if image.get("hash") and pairs:
+            await image_index.add(image["hash"], IMAGE_INDEX_VERSION, pairs)
+
+
+def stream_pairs_from_image(
+    base64_image: str,
+    image_caption: str = "",
+    use_cache: bool = True,
+    mime_type: str = "image/jpeg",
+    image_hash: Optional[str] = None,
+) -> AsyncIterator[Dict[str, str]]:
+    """Streaming version of extract_pairs_from_image."""
+    image = {"base64": base64_image, "filename": image_caption, "mime_type": mime_type, "hash": image_hash}
+    return stream_pairs_from_images([image], use_cache=use_cache)
+
+
+def change_pairs_request(pairs: List[Dict[str, str]]) -> Dict[str, Any]:
+    """Responses API request body for rewriting `pairs`; shared by change_anki_pairs and batch files."""
+    return dict(
+        model="gpt-4o-mini-2024-07-18",
+        input=json.dumps(pairs),
+        max_output_tokens=CHANGE_PAIRS_MAX_OUTPUT_TOKENS,
+        **_prompt_fields(CHANGE_PAIRS),
+    )
+
+
+def batch_output_text(body: Dict[str, Any]) -> str:
+    """Output text of a Responses API result in its JSON form, as found in batch output files."""
+    if body.get("output_text"):
+        return body["output_text"]
+    chunks = []
+    for item in body.get("output") or []:
+        if item.get("type") == "message":
+            for c in item.get("content") or []:
+                if c.get("type") == "output_text" and isinstance(c.get("text"), str):
+                    chunks.append(c["text"])
+    return "".join(chunks).strip()
+
+
+async def respond_locally(body: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Answers one batch request line through the regular client, in the same
+    JSON shape the Batch API writes. Used by the local batch backend.
+    """
+    timeout = output_timeout(body.get("max_output_tokens", CHANGE_PAIRS_MAX_OUTPUT_TOKENS))
+    data = await _create_json("change_pairs_batch", use_cache=False, timeout=timeout, **body)
+    text = json.dumps(data)
+    return {"output": [{"type": "message", "content": [{"type": "output_text", "text": text}]}]}
+
+
+@LLM_FUNCTION_DURATION.timed(function="rewrite_pairs")
+async def rewrite_pairs(pairs: List[Dict[str, str]], use_cache: bool = True) -> List[List[Dict[str, str]]]:
+    """
+    Like change_anki_pairs, but raises instead of returning empty suggestions:
+    ChunkOutputError when the output is cut off or does not have exactly one
+    list per input card, and the underlying error for anything else. A timed
+    out call counts as truncated: a smaller chunk has less to generate.
+    """
+    import openai
+
+    def validate(data: Dict[str, Any]) -> None:
+        cards = data.get("Cards", [])
+        if len(cards) != len(pairs) or not all(isinstance(c, list) for c in cards):
+            raise ChunkOutputError(f"The model returned {len(cards)} items, expected {len(pairs)}")
+
+    request = change_pairs_request(pairs)
+    try:
+        data = await _create_json(
+            "change_pairs", use_cache=use_cache, validate=validate,
+            timeout=output_timeout(request["max_output_tokens"]), **request
+        )
+    except json.JSONDecodeError as e:
+        # Output cut off mid-JSON without the response saying so
+        raise ChunkOutputError(f"Unreadable model output: {e}", truncated=True) from e
+    except openai.APITimeoutError as e:
+        raise ChunkOutputError(f"Model call for {len(pairs)} cards timed out: {e}", truncated=True) from e
+    logger.debug("change_anki_pairs output: %s", data)
+    # Expecting object with "Cards": [ [ {Front,Back}, ... ], ... ]
+    return data["Cards"]
+
+
+@LLM_FUNCTION_DURATION.timed(function="change_anki_pairs")
+async def change_anki_pairs(pairs: List[Dict[str, str]], use_cache: bool = True) -> List[List[Dict[str, str]]]:
     """
     Takes a list of input cards, each {Front,Back}, returns a 2D array, e.g.:
       [ 
@@ -208,7 +717,7 @@ async def change_anki_pairs(pairs: List[Dict[str, str]]) -> List[List[Dict[str,
          [ {Front,Back}, ... ],                # for pairs[1]
          ...
       ]
-    The outer list must match the length of `pairs`, with each sub-list having >= 1 items.
+    The outer list matches the length of `pairs`; on any error every sub-list is empty.
     """
 
     # 0) Debug short-circuit:
@@ -221,89 +730,10 @@ async def change_anki_pairs(pairs: List[Dict[str, str]]) -> List[List[Dict[str,
     # Uncomment to skip the LLM and return debug data
     # return debug_result
 
-    # 1) get the prompt
-    prompt = get_change_pairs_prompt()
-
-    # 2) Create the JSON schema for the structured outputs
-    schema = {
-        "name": "changing_anki_cards",
-       
-    }
-
-    # 3) Call the model via Python SDK Responses API
     try:
-        resp = await client.responses.create(
-            model="gpt-4o-mini-2024-07-18",
-            instructions=prompt,
-            input=json.dumps(pairs),
-            text={
-                "format": {
-                    "type": "json_schema",
-                    "name": "Anki_cards",
-                    "strict": True,
-                    "schema": {
-                        "type": "object",
-                        "properties": {
-                            "Cards": {
-                                "type": "array",
-                                "items": {
-                                    "type": "array",
-                                    "items": {
-                                        "type": "object",
-                                        "properties": {
-                                            "Front": {"type": "string",
-                                                    "description": "One sentence with EXACTLY ONE {{c1::...}} around the target, then newline + [short English definition]"},
-                                            "Back":  {"type": "string",
-                                                    "description": "1–3 short synonyms/near-phrases, comma-separated"}
-                                        },
-                                        "required": ["Front", "Back"],
-                                        "additionalProperties": False
-                                    },
-                                },
-                            },
-                        },
-                        "required": ["Cards"],
-                        "additionalProperties": False,
-                    },
-                },
-            },
-            timeout=30,
-            max_output_tokens=1024,
-        )
-
-        # 4) Extract output text
-        output_str = None
-        try:
-            output_str = resp.output_text
-        except Exception:
-            output_str = None
-
-        if not output_str:
-            print(resp)
-            # Fallback: concatenate output_text items
-            text_chunks = []
-            try:
-                for item in getattr(resp, "output", []) or []:
-                    if getattr(item, "type", None) == "message":
-                        for c in getattr(item, "content", []) or []:
-                            if getattr(c, "type", None) == "output_text" and isinstance(getattr(c, "text", None), str):
-                                text_chunks.append(c.text)
-            except Exception:
-                pass
-            output_str = "".join(text_chunks).strip()
-
-        if not output_str:
-            raise ValueError("No content returned by the model")
-        print(output_str)
-        data = json.loads(output_str)
-        # Expecting object with "Cards": [ [ {Front,Back}, ... ], ... ]
-        cards = data.get("Cards", [])
-        if len(cards) != len(pairs):
-            print(f"WARNING: The model returned {len(cards)} items, expected {len(pairs)}")
-
-        return cards
-
+        return await rewrite_pairs(pairs, use_cache=use_cache)
     except Exception as e:
-        print(f"Error in change_anki_pairs: {e}")
+        ERRORS.inc(stage="change_pairs", type=type(e).__name__)
+        logger.error(f"Error in change_anki_pairs: {e}")
         # Return an empty 2D array shape-compatible with input
         return [[] for _ in pairs]
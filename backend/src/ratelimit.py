@@ -0,0 +1,170 @@
+# src/ratelimit.py
+
+import asyncio
+import contextvars
+import json
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional
+
+from src.chunking import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Fairness key for queued calls; set per HTTP request or job so one large
+# upload cannot starve everyone else's calls
+rate_limit_key: contextvars.ContextVar[str] = contextvars.ContextVar("rate_limit_key", default="default")
+
+
+def estimate_request_tokens(request: Dict[str, Any], image_tokens: int = 1000) -> int:
+    """
+    Rough token cost of a Responses API request: instructions, schema and text
+    input by character count, a flat `image_tokens` per input image, plus the
+    max_output_tokens the call may use.
+    """
+    text_parts = [request.get("instructions") or "", json.dumps(request.get("text") or {})]
+    images = 0
+    payload = request.get("input")
+    if isinstance(payload, str):
+        text_parts.append(payload)
+    else:
+        for message in payload or []:
+            content = message.get("content") if isinstance(message, dict) else None
+            if isinstance(content, str):
+                text_parts.append(content)
+                continue
+            for item in content or []:
+                if item.get("type") == "input_image":
+                    images += 1
+                else:
+                    text_parts.append(item.get("text") or "")
+    return estimate_tokens("".join(text_parts)) + images * image_tokens + (request.get("max_output_tokens") or 0)
+
+
+class _Bucket:
+    """Token bucket refilled continuously up to `per_minute`; 0 disables the limit."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        if self.capacity <= 0:
+            return 0.0
+        self._refill(now)
+        # Requests larger than a whole minute's budget wait for a full bucket
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60.0 / self.capacity
+
+    def take(self, amount: float) -> None:
+        if self.capacity > 0:
+            self.level -= min(amount, self.capacity)
+
+    def drain(self, now: float) -> None:
+        self._refill(now)
+        self.level = min(self.level, 0.0)
+
+    def give_back(self, amount: float) -> None:
+        """Corrects a reservation; negative amounts charge extra usage."""
+        if self.capacity > 0:
+            self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute budget shared by all OpenAI calls.
+
+    Callers `acquire(tokens)` before each call. Waiters are queued per
+    `rate_limit_key` and served round-robin across keys, FIFO within a key.
+    `pause(seconds)` holds every queue, e.g. when the API answers 429 with
+    Retry-After, and empties both buckets: the server's budget is spent, so
+    calls resume at the refill rate rather than in a burst.
+    """
+
+    def __init__(self, rpm: int = 0, tpm: int = 0):
+        self._requests = _Bucket(rpm)
+        self._tokens = _Bucket(tpm)
+        self._queues: "OrderedDict[str, Deque[tuple]]" = OrderedDict()
+        self._paused_until = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    async def acquire(self, tokens: int) -> float:
+        """Waits for budget to send one request of about `tokens` tokens; returns seconds waited."""
+        start = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(rate_limit_key.get(), deque()).append((future, tokens))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Budget was granted just before cancellation; return it
+                self._requests.give_back(1)
+                self._tokens.give_back(tokens)
+            self._dispatch()
+            raise
+        return time.monotonic() - start
+
+    def release(self, reserved: int, used: int) -> None:
+        """Settles a token reservation against what the call actually used (0 for failed calls)."""
+        self._tokens.give_back(reserved - used)
+        self._dispatch()
+
+    def pause(self, seconds: float) -> None:
+        now = time.monotonic()
+        self._requests.drain(now)
+        self._tokens.drain(now)
+        until = now + seconds
+        if until > self._paused_until:
+            logger.warning(f"OpenAI rate limited, pausing calls for {seconds:.1f}s")
+            self._paused_until = until
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._queues:
+            key, queue = next(iter(self._queues.items()))
+            while queue and queue[0][0].done():
+                queue.popleft()  # cancelled waiter
+            if not queue:
+                del self._queues[key]
+                continue
+            future, tokens = queue[0]
+            now = time.monotonic()
+            delay = max(
+                self._paused_until - now,
+                self._requests.wait_time(1, now),
+                self._tokens.wait_time(tokens, now),
+            )
+            if delay > 0:
+                self._schedule(delay)
+                return
+            queue.popleft()
+            self._requests.take(1)
+            self._tokens.take(tokens)
+            future.set_result(None)
+            # Round-robin: the served key goes to the back of the line
+            if queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+
+    def _schedule(self, delay: float) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._dispatch()
@@ -0,0 +1,45 @@
+# src/serve.py
+
+import os
+
+import uvicorn
+
+# Production entry point: python -m src.serve
+#
+# Runs WEB_CONCURRENCY uvicorn worker processes (default: one per available
+# core) without auto-reload. Each process builds its own HTTP clients; the
+# LLM response cache and the job queue live in SQLite files that every
+# process shares, and the OpenAI rate limits are split evenly between them.
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "2341"))
+# Seconds to let in-flight requests finish on shutdown before workers are killed
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+KEEP_ALIVE_TIMEOUT = int(os.getenv("KEEP_ALIVE_TIMEOUT", "5"))
+
+
+def _available_cores() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def main() -> None:
+    workers = max(1, int(os.getenv("WEB_CONCURRENCY") or _available_cores()))
+    # Read by every worker process, e.g. to take its share of the OpenAI budget
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    if workers > 1:
+        # One rotating log file per process; a shared file would be rotated by several writers
+        os.environ.setdefault("LOG_FILE", "logs.{pid}.txt")
+    uvicorn.run(
+        "src.main:app",
+        host=HOST,
+        port=PORT,
+        workers=workers,
+        reload=False,
+        timeout_keep_alive=KEEP_ALIVE_TIMEOUT,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+# src/sqlite_store.py
+
+import sqlite3
+
+# How long a writer waits for another process's transaction before giving up
+BUSY_TIMEOUT = 30.0
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """
+    Opens a SQLite file that several server processes share.
+
+    WAL lets readers proceed while one process writes, and the busy timeout
+    makes concurrent writers queue instead of failing with "database is locked".
+    """
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
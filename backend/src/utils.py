@@ -1,84 +1,90 @@
-import base64
+import asyncio
+import binascii
+import logging
 import os
-from io import BytesIO
 from fastapi import UploadFile, HTTPException, status 
 import re
-from typing import List, Dict, Tuple
+from typing import Any, AsyncIterator, List, Dict, Optional, Tuple
+from src import offload
 from src.anki import AnkiService
+from src.images import sniff_mime_type
 
+logger = logging.getLogger(__name__)
 
-# Function to convert an image file to base64 format
-def image_to_base64(image):
+# Uploaded images over this size are rejected without reading the rest
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", str(5 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# A multiple of 3, so only the last chunk gets base64 padding
+BASE64_CHUNK_SIZE = 3 * 64 * 1024
+
+
+def encode_base64(content: bytes) -> str:
     """
-    Convert an image file or binary stream to a Base64 encoded string.
-    :param image: File path (str) or BytesIO object
-    :return: Base64 encoded string
+    Base64 of `content`, encoded chunk by chunk into one preallocated buffer
+    rather than through intermediate copies of the whole image.
     """
-    if isinstance(image, (str, bytes, os.PathLike)):
-        # If image is a file path
-        with open(image, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode("utf-8")
-    elif isinstance(image, BytesIO):
-        # If image is a binary stream
-        return base64.b64encode(image.read()).decode("utf-8")
-    else:
-        raise TypeError("Expected a file path or BytesIO object.")
-    
-    
-async def read_and_validate_image(file: UploadFile) -> bytes:
-    # Validate the image content-type
-    if file.content_type not in ["image/jpeg", "image/png", "image/jpg", "image/webp"]:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, 
-            detail=f"Invalid image type: {file.filename}"
-        )
-
-    # Read the file content asynchronously
-    content = await file.read()
-
-    # Check file size (limit to 5MB)
-    if len(content) > 5 * 1024 * 1024:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"File too large: {file.filename}",
-        )
-    return content
-
-
-def process_sound_tags(cards: List[Dict[str, str]]) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+    out = bytearray(4 * ((len(content) + 2) // 3))
+    view = memoryview(content)
+    pos = 0
+    for start in range(0, len(content), BASE64_CHUNK_SIZE):
+        encoded = binascii.b2a_base64(view[start:start + BASE64_CHUNK_SIZE], newline=False)
+        out[pos:pos + len(encoded)] = encoded
+        pos += len(encoded)
+    return out.decode("ascii")
+
+
+async def encode_base64_async(content: bytes) -> str:
+    """encode_base64 off the event loop for large inputs (see offload.run)."""
+    return await offload.run(encode_base64, content, size=len(content))
+
+
+async def read_and_validate_image(file: UploadFile, max_bytes: int = MAX_IMAGE_BYTES) -> bytes:
     """
-    Process cards to handle sound tags.
-    
-    Args:
-        cards (List[Dict[str, str]]): List of cards with 'Front' and 'Back' fields.
-    
-    Returns:
-        Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
-        - Updated cards with `[sound:...]` tags removed from 'Front' and 'Back'.
-        - A separate list of stored sound tags with their associated text.
+    Reads an uploaded image in chunks. The type is checked from the file's
+    magic bytes, not the client's content_type; uploads over `max_bytes` are
+    rejected as soon as that is known, without reading the rest.
     """
-    updated_cards = []
-    sound_tags = []
-    
-    print("Processing sound tags...")
+    def reject(reason: str):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"{reason}: {file.filename}")
 
-    for card in cards:
-        print("Processing card:", card)
-        updated_card = {}
-        front_text, front_sounds = remove_sound_tags(card.get("Front", ""))
-        back_text, back_sounds = remove_sound_tags(card.get("Back", ""))
+    # The multipart parser already counted the bytes
+    if file.size is not None and file.size > max_bytes:
+        reject("File too large")
+    content = bytearray(file.size or 0)
+    length = 0
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        if length == 0 and sniff_mime_type(chunk) is None:
+            reject("Invalid image type")
+        if length + len(chunk) > max_bytes:
+            reject("File too large")
+        # Fills the preallocated buffer; grows it only if the size was unknown
+        content[length:length + len(chunk)] = chunk
+        length += len(chunk)
+    if length == 0:
+        reject("Invalid image type")
+    del content[length:]
+    # Immutable for the hashing and cache keys downstream; one copy of at most max_bytes
+    return bytes(content)
 
-        updated_card["Front"] = front_text
-        updated_card["Back"] = back_text
-        updated_cards.append(updated_card)
 
-        # Store sound tags separately with their associated text
-        if front_sounds:
-            sound_tags.append({"Field": "Front", "Text": card["Front"], "Sounds": front_sounds})
-        if back_sounds:
-            sound_tags.append({"Field": "Back", "Text": card["Back"], "Sounds": back_sounds})
+_CLOZE_PATTERN = re.compile(r"\{\{c\d+::(.*?)(?:::[^}]*)?\}\}")
+_SOUND_PATTERN = re.compile(r"\[sound:[^\]]+\]")
 
-    return updated_cards
+
+def cards_text_size(cards: List[Dict[str, str]]) -> int:
+    """Characters in the Front and Back of `cards`; sizes card batches for offload.run."""
+    return sum(len(card.get("Front", "")) + len(card.get("Back", "")) for card in cards)
+
+
+def cloze_target(front: str) -> str:
+    """Returns the normalized text inside the first {{cN::...}} of a card front, or ''."""
+    match = _CLOZE_PATTERN.search(front or "")
+    return " ".join(match.group(1).lower().split()) if match else ""
+
+
+def card_key(card: Dict[str, str]) -> str:
+    """Key for duplicate detection: the cloze target, or the normalized Front if there is none."""
+    return cloze_target(card.get("Front", "")) or " ".join(card.get("Front", "").lower().split())
 
 
 def remove_sound_tags(text: str) -> Tuple[str, List[str]]:
@@ -93,9 +99,8 @@ def remove_sound_tags(text: str) -> Tuple[str, List[str]]:
         - Cleaned text without `[sound:...]` tags.
         - List of extracted sound tags.
     """
-    sound_pattern = re.compile(r"\[sound:[^\]]+\]")
-    sounds = sound_pattern.findall(text)  # Extract all `[sound:...]` tags
-    cleaned_text = sound_pattern.sub("", text).strip()  # Remove tags and clean up
+    sounds = _SOUND_PATTERN.findall(text)  # Extract all `[sound:...]` tags
+    cleaned_text = _SOUND_PATTERN.sub("", text).strip()  # Remove tags and clean up
     return cleaned_text, sounds
 
 
@@ -110,109 +115,78 @@ async def apply_auto_changes_for_chunk(
       - If new_cards == 1 => update old note in place
       - If new_cards >= 2 => delete old note, create brand-new notes
       - If new_cards == 0 => NO_CHANGES
+    Changes are sent to Anki in bulk: one update, one delete and one add
+    request per batch, whatever the chunk size.
     Returns a list of BeforeAfterCard for each operation.
     """
-    results = []
-    for idx, old_card in enumerate(chunk):
-        note_id = old_card["noteId"]
-        old_front = old_card["Front"]
-        old_back = old_card["Back"]
+    def before_after(note_id, old_card, after_front, after_back, status):
+        return {
+            'noteId': note_id,
+            'beforeFront': old_card["Front"],
+            'beforeBack': old_card["Back"],
+            'afterFront': after_front,
+            'afterBack': after_back,
+            'Status': status
+        }
 
-        # If the new_cards_chunk array is missing or not a list, skip
-        if idx >= len(new_cards_chunk) or not isinstance(new_cards_chunk[idx], list):
-            # No new data => skip
-            results.append({
-                'noteId': note_id,
-                'beforeFront': old_front,
-                'beforeBack': old_back,
-                'afterFront': old_front,
-                'afterBack': old_back,
-                'Status': "NO_CHANGES"
-            })
-            continue
-
-        new_cards = new_cards_chunk[idx]
-
-        # Cases:
-        if not new_cards:  # empty
-            results.append({
-                'noteId': note_id,
-                'beforeFront': old_front,
-                'beforeBack': old_back,
-                'afterFront': old_front,
-                'afterBack': old_back,
-                'Status': "NO_CHANGES"
+    updates, replaced = [], []
+    for idx, old_card in enumerate(chunk):
+        new_cards = new_cards_chunk[idx] if idx < len(new_cards_chunk) else None
+        if isinstance(new_cards, list) and len(new_cards) == 1:
+            updates.append({
+                "noteId": old_card["noteId"],
+                "Front": new_cards[0].get("Front", old_card["Front"]),
+                "Back": new_cards[0].get("Back", old_card["Back"]),
             })
-            continue
-
-        if len(new_cards) == 1:
-            # Exactly 1 => update old note in place
-            first_new = new_cards[0]
-            new_front = first_new.get("Front", old_front)
-            new_back = first_new.get("Back", old_back)
+        elif isinstance(new_cards, list) and len(new_cards) >= 2:
+            replaced.append(old_card["noteId"])
 
-            update_resp = await anki_service.update_card(note_id, new_front, new_back)
-            if not update_resp["success"]:
-                results.append({
-                    'noteId': note_id,
-                    'beforeFront': old_front,
-                    'beforeBack': old_back,
-                    'afterFront': new_front,
-                    'afterBack': new_back,
-                    'Status': update_resp["error"]
-                })
-            else:
-                results.append({
-                    'noteId': note_id,
-                    'beforeFront': old_front,
-                    'beforeBack': old_back,
-                    'afterFront': new_front,
-                    'afterBack': new_back,
-                    'Status': "OK"
-                })
+    updated = {
+        u["noteId"]: (u, resp) for u, resp in zip(updates, await anki_service.update_cards_bulk(updates))
+    }
+    delete_resp = await anki_service.delete_notes(replaced)
+    replaced = set(replaced)
+    additions = []
+    if delete_resp["success"]:
+        for idx, old_card in enumerate(chunk):
+            if old_card["noteId"] in replaced:
+                additions.extend(
+                    {"Front": c.get("Front", ""), "Back": c.get("Back", "")} for c in new_cards_chunk[idx]
+                )
+    add_results = iter(await anki_service.add_cards_bulk(deck_name, additions))
 
-        else:
-            # 2 or more => delete old note + create brand-new notes
-            del_resp = await anki_service.delete_note(note_id)
-            if not del_resp["success"]:
+    results = []
+    for idx, old_card in enumerate(chunk):
+        note_id = old_card["noteId"]
+        if note_id in updated:
+            update, update_resp = updated[note_id]
+            status = "OK" if update_resp["success"] else update_resp["error"]
+            results.append(before_after(note_id, old_card, update["Front"], update["Back"], status))
+        elif note_id in replaced:
+            if not delete_resp["success"]:
                 # If can't delete, skip
-                results.append({
-                    'noteId': note_id,
-                    'beforeFront': old_front,
-                    'beforeBack': old_back,
-                    'afterFront': old_front,
-                    'afterBack': old_back,
-                    'Status': f"DELETE_ERROR: {del_resp['error']}"
-                })
+                results.append(before_after(
+                    note_id, old_card, old_card["Front"], old_card["Back"],
+                    f"DELETE_ERROR: {delete_resp['error']}"
+                ))
                 continue
-
-            # Record that old note was deleted
-            
-            results.append({
-                'noteId': note_id,
-                'beforeFront': old_front,
-                'beforeBack': old_back,
-                'afterFront': "(deleted)",
-                'afterBack': "(deleted)",
-                'Status': "DELETED_OLD"
-            })
-
-            # Create brand-new notes for each new card
-            for c in new_cards:
-                ext_front = c.get("Front", "")
-                ext_back = c.get("Back", "")
-                add_resp = await anki_service.add_card(deck_name, ext_front, ext_back)
+            results.append(before_after(note_id, old_card, "(deleted)", "(deleted)", "DELETED_OLD"))
+            # One result per brand-new note created in place of the old one
+            for c in new_cards_chunk[idx]:
+                add_resp = next(add_results)
                 status = "OK" if add_resp["success"] else add_resp.get("error", "Unknown error")
-                
                 results.append({
                     'noteId': add_resp.get("noteId", 0),
                     'beforeFront': "(new card)",
                     'beforeBack': "(new card)",
-                    'afterFront': ext_front,
-                    'afterBack': ext_back,
+                    'afterFront': c.get("Front", ""),
+                    'afterBack': c.get("Back", ""),
                     'Status': status
                 })
-    print(f"results = {results}")
+        else:
+            # Missing or empty suggestions => leave the note as it is
+            results.append(before_after(note_id, old_card, old_card["Front"], old_card["Back"], "NO_CHANGES"))
+    logger.debug("results = %s", results)
     return results
 
 
@@ -233,8 +207,7 @@ def apply_manual_changes_for_chunk(chunk, new_cards_chunk):
         old_front = old_card["Front"]
         old_back = old_card["Back"]
 
-        print(f"old_card = {old_card}")
-        print(f"new_cards_chunk[idx] = {new_cards}")
+        logger.debug("old_card = %s, new_cards = %s", old_card, new_cards)
 
         # Convert new suggestions into structured dictionary format
         new_suggestions = [{"Front": new_card.get("Front", ""), "Back": new_card.get("Back", "")} for new_card in new_cards]
@@ -248,3 +221,43 @@ def apply_manual_changes_for_chunk(chunk, new_cards_chunk):
         })
 
     return results
+
+
+async def merge_streams(
+    streams: List[AsyncIterator[Any]], semaphore: Optional[asyncio.Semaphore] = None
+) -> AsyncIterator[Any]:
+    """
+    Yields items from several async iterators as they arrive. With a
+    semaphore, only that many iterators are consumed at once. Consumers
+    are cancelled if the caller stops early.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    async def drain(stream: AsyncIterator[Any]):
+        try:
+            if semaphore is None:
+                async for item in stream:
+                    await queue.put(item)
+            else:
+                async with semaphore:
+                    async for item in stream:
+                        await queue.put(item)
+        finally:
+            await queue.put(done)
+
+    tasks = [asyncio.create_task(drain(stream)) for stream in streams]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            item = await queue.get()
+            if item is done:
+                remaining -= 1
+            else:
+                yield item
+        # Surface errors from the streams themselves
+        for task in tasks:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
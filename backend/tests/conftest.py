@@ -0,0 +1,13 @@
+import os
+import tempfile
+
+# src.processing and src.main open their SQLite files and read their budgets at import
+_tmp = tempfile.mkdtemp(prefix="anki-tests-")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ["LLM_CACHE_PATH"] = os.path.join(_tmp, "llm_cache.sqlite3")
+os.environ["IMAGE_INDEX_PATH"] = os.path.join(_tmp, "image_index.sqlite3")
+os.environ["JOBS_DB_PATH"] = os.path.join(_tmp, "jobs.sqlite3")
+os.environ["BATCH_DIR"] = os.path.join(_tmp, "batches")
+os.environ["LOG_FILE"] = os.path.join(_tmp, "logs.txt")
+os.environ["LLM_RPM"] = "0"
+os.environ["LLM_TPM"] = "0"
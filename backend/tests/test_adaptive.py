@@ -0,0 +1,50 @@
+import asyncio
+
+from src.adaptive import ChunkOutputError, ChunkSizer, run_adaptive_chunks
+
+
+def test_sizer_grows_to_fill_headroom():
+    sizer = ChunkSizer(max_output_tokens=1000, initial_size=2, max_size=100, headroom=0.5)
+    sizer.record_success(cards=2, output_tokens=100)  # 50 tokens per card -> target 10
+    assert sizer.size == 4  # at most doubles
+    sizer.record_success(cards=4, output_tokens=200)
+    assert sizer.size == 8
+    sizer.record_success(cards=8, output_tokens=400)
+    assert sizer.size == 10
+
+
+def test_sizer_halves_after_truncation():
+    sizer = ChunkSizer(max_output_tokens=1000, initial_size=8)
+    sizer.record_failure(cards=8, truncated=True)
+    assert sizer.size == 4
+    assert sizer.tokens_per_card == 125
+
+
+def test_failed_chunks_are_split_down_to_single_items():
+    calls = []
+
+    async def process(chunk):
+        calls.append(list(chunk))
+        if 3 in chunk and len(chunk) > 1:
+            raise ChunkOutputError("mismatch")
+        if chunk == [3]:
+            raise ChunkOutputError("still wrong")
+        return [x * 10 for x in chunk]
+
+    sizer = ChunkSizer(max_output_tokens=1000, initial_size=8)
+    outcomes = asyncio.run(run_adaptive_chunks(list(range(8)), process, sizer, lambda r: 10 * len(r)))
+
+    assert [item for chunk, _ in outcomes for item in chunk] == list(range(8))
+    failed = [chunk for chunk, result in outcomes if isinstance(result, Exception)]
+    assert failed == [[3]]
+    assert all(result == [x * 10 for x in chunk] for chunk, result in outcomes if chunk != [3])
+    assert calls[0] == list(range(8))
+
+
+def test_other_errors_are_not_split():
+    async def process(chunk):
+        raise RuntimeError("boom")
+
+    sizer = ChunkSizer(max_output_tokens=1000, initial_size=4)
+    outcomes = asyncio.run(run_adaptive_chunks([1, 2, 3, 4], process, sizer, len))
+    assert len(outcomes) == 1 and isinstance(outcomes[0][1], RuntimeError)
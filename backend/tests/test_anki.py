@@ -0,0 +1,87 @@
+import asyncio
+
+import httpx
+
+from src.anki import AnkiService, AnkiUnavailableError, CircuitBreaker
+
+
+def make_service(handler, **kwargs) -> AnkiService:
+    service = AnkiService("http://anki", retry_attempts=1, breaker_threshold=1, breaker_reset=0.0, **kwargs)
+    service.client = httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://anki")
+    return service
+
+
+def test_breaker_opens_and_closes():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60.0)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    breaker.reset_timeout = 0.0
+    assert breaker.allow()
+    assert not breaker.allow()  # one trial at a time
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_cancelled_half_open_trial_is_released():
+    calls = {"n": 0}
+    hang = asyncio.Event()
+
+    async def handler(request):
+        calls["n"] += 1
+        if calls["n"] == 1:
+            raise httpx.ConnectError("refused")
+        if calls["n"] == 2:
+            await hang.wait()
+        return httpx.Response(200, json={"result": 6, "error": None})
+
+    async def scenario():
+        service = make_service(handler)
+        payload = {"action": "version", "version": 6}
+        try:
+            await service._post(payload)
+        except httpx.ConnectError:
+            pass
+        assert service.breaker.state == "half_open"  # reset_timeout=0 elapsed at once
+
+        trial = asyncio.create_task(service._post(payload))
+        await asyncio.sleep(0.01)
+        trial.cancel()
+        try:
+            await trial
+        except asyncio.CancelledError:
+            pass
+
+        response = await service._post(payload)
+        assert response.json()["result"] == 6
+        assert service.breaker.state == "closed"
+        await service.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_open_breaker_rejects_without_calling_anki():
+    calls = {"n": 0}
+
+    def handler(request):
+        calls["n"] += 1
+        raise httpx.ConnectError("refused")
+
+    async def scenario():
+        service = make_service(handler)
+        service.breaker.reset_timeout = 60.0
+        try:
+            await service._post({"action": "version", "version": 6})
+        except httpx.ConnectError:
+            pass
+        try:
+            await service._post({"action": "version", "version": 6})
+        except AnkiUnavailableError:
+            pass
+        else:
+            raise AssertionError("expected AnkiUnavailableError")
+        assert calls["n"] == 1
+        await service.aclose()
+
+    asyncio.run(scenario())
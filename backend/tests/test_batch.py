@@ -0,0 +1,114 @@
+import asyncio
+import json
+
+from src.batch import BatchManifest, LocalBatchBackend, parse_batch_output, run_batch
+
+
+def chunks(n: int):
+    return {f"chunk-{i}": [{"noteId": i, "Front": f"front {i}", "Back": ""}] for i in range(n)}
+
+
+def build_request(cards):
+    return {"input": json.dumps(cards)}
+
+
+async def apply(results):
+    return sorted(results)
+
+
+def test_parse_batch_output_skips_failed_lines():
+    lines = [
+        {"custom_id": "a", "response": {"status_code": 200, "body": {"ok": 1}}, "error": None},
+        {"custom_id": "b", "response": {"status_code": 500, "body": {}}, "error": None},
+        {"custom_id": "c", "response": None, "error": {"message": "boom"}},
+    ]
+    text = "\n".join(json.dumps(line) for line in lines) + "\n\n"
+    assert parse_batch_output(text) == {"a": {"ok": 1}}
+
+
+def test_manifest_round_trip(tmp_path):
+    path = str(tmp_path / "runs" / "run.json")
+    manifest = BatchManifest.create(path, chunks(3), deck="Deck")
+    manifest.data["done"].append("chunk-1")
+    manifest.save()
+
+    loaded = BatchManifest.load(path)
+    assert loaded.data["deck"] == "Deck"
+    assert loaded.pending() == ["chunk-0", "chunk-2"]
+    assert BatchManifest.load(str(tmp_path / "missing.json")) is None
+
+
+def test_missing_results_are_resubmitted(tmp_path):
+    failed_once = set()
+
+    async def respond(body):
+        cards = json.loads(body["input"])
+        note_id = cards[0]["noteId"]
+        if note_id % 2 == 0 and note_id not in failed_once:
+            failed_once.add(note_id)
+            raise RuntimeError("overloaded")
+        return {"noteId": note_id}
+
+    async def scenario():
+        backend = LocalBatchBackend(str(tmp_path / "local"), respond)
+        manifest = BatchManifest.create(str(tmp_path / "run.json"), chunks(4))
+        missing = await run_batch(manifest, backend, build_request, apply, poll_interval=0.01)
+        assert missing == []
+        assert manifest.data["rounds"] == 2
+        assert sorted(manifest.data["done"]) == sorted(chunks(4))
+        assert manifest.data["results"] == ["chunk-1", "chunk-3", "chunk-0", "chunk-2"]
+        assert BatchManifest.load(manifest.path).data["batch_id"] is None
+
+    asyncio.run(scenario())
+
+
+def test_gives_up_after_max_rounds(tmp_path):
+    async def respond(body):
+        if json.loads(body["input"])[0]["noteId"] == 0:
+            raise RuntimeError("bad request")
+        return {}
+
+    async def scenario():
+        backend = LocalBatchBackend(str(tmp_path / "local"), respond)
+        manifest = BatchManifest.create(str(tmp_path / "run.json"), chunks(2))
+        missing = await run_batch(manifest, backend, build_request, apply, poll_interval=0.01, max_rounds=2)
+        assert missing == ["chunk-0"]
+        assert manifest.data["rounds"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_restart_polls_the_outstanding_batch(tmp_path):
+    calls = []
+
+    async def respond(body):
+        calls.append(body)
+        return {}
+
+    async def scenario():
+        manifest = BatchManifest.create(str(tmp_path / "run.json"), chunks(3))
+        first = LocalBatchBackend(str(tmp_path / "local"), respond)
+
+        async def interrupt(batch_id, status):
+            raise asyncio.CancelledError
+
+        try:
+            await run_batch(manifest, first, build_request, apply, poll_interval=0.01, on_status=interrupt)
+        except asyncio.CancelledError:
+            pass
+        batch_id = manifest.data["batch_id"]
+        assert batch_id is not None
+
+        # A new process with a fresh backend resumes the saved batch instead of submitting again
+        resumed = BatchManifest.load(manifest.path)
+        second = LocalBatchBackend(str(tmp_path / "local"), respond)
+        seen = []
+
+        async def record(batch_id, status):
+            seen.append(batch_id)
+
+        assert await run_batch(resumed, second, build_request, apply, poll_interval=0.01, on_status=record) == []
+        assert set(seen) == {batch_id}
+        assert resumed.data["rounds"] == 1
+
+    asyncio.run(scenario())
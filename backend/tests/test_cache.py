@@ -0,0 +1,101 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from src import cache as cache_module
+from src import processing
+from src.cache import ResponseCache
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+def make_cache(tmp_path, monkeypatch, **kwargs):
+    clock = Clock()
+    monkeypatch.setattr(cache_module, "time", clock)
+    return ResponseCache(str(tmp_path / "cache.sqlite3"), **kwargs), clock
+
+
+def test_memory_then_disk_hits(tmp_path, monkeypatch):
+    cache, _ = make_cache(tmp_path, monkeypatch)
+
+    async def scenario():
+        await cache.set("k", "value")
+        assert await cache.get("k") == "value"
+        cache._memory.clear()
+        assert await cache.get("k") == "value"
+        assert await cache.get("k") == "value"  # back in memory
+        # Another process sees the disk tier
+        assert await ResponseCache(cache.path).get("k") == "value"
+        assert await cache.get("other") is None
+
+    asyncio.run(scenario())
+    assert (cache.hits_memory, cache.hits_disk, cache.misses) == (2, 1, 1)
+
+
+def test_entries_expire_after_max_age(tmp_path, monkeypatch):
+    cache, clock = make_cache(tmp_path, monkeypatch, max_age=60)
+
+    async def scenario():
+        await cache.set("k", "value")
+        clock.now += 59
+        assert await cache.get("k") == "value"
+        clock.now += 2
+        assert await cache.get("k") is None
+        # Purged from disk too, not just skipped
+        assert cache._db().execute("SELECT COUNT(*) FROM responses").fetchone()[0] == 0
+
+    asyncio.run(scenario())
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    cache, clock = make_cache(tmp_path, monkeypatch, memory_items=2, max_bytes=25)
+
+    async def scenario():
+        for key in ("a", "b"):
+            await cache.set(key, key * 10)
+            clock.now += 1
+        assert await cache.get("a") == "a" * 10  # "b" is now the least recently used
+        clock.now += 1
+        await cache.set("c", "c" * 10)
+
+        assert list(cache._memory) == ["a", "c"]
+        cache._memory.clear()
+        assert await cache.get("b") is None
+        assert await cache.get("a") == "a" * 10
+        assert await cache.get("c") == "c" * 10
+
+    asyncio.run(scenario())
+
+
+class CountingResponses:
+    def __init__(self):
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        text = json.dumps({"Cards": [[{"Front": f"call {self.calls}", "Back": ""}]]})
+        return SimpleNamespace(output_text=text, status="completed", usage=None)
+
+
+def test_use_cache_false_skips_the_lookup(tmp_path, monkeypatch):
+    responses = CountingResponses()
+    monkeypatch.setattr(processing, "client", SimpleNamespace(responses=responses))
+    monkeypatch.setattr(processing, "response_cache", ResponseCache(str(tmp_path / "cache.sqlite3")))
+    request = processing.extract_text_request("Some text.")
+
+    async def front(use_cache):
+        data = await processing._create_json("extract_text", use_cache=use_cache, **request)
+        return data["Cards"][0][0]["Front"]
+
+    async def scenario():
+        return [await front(True), await front(True), await front(False), await front(True)]
+
+    # The bypassing call still refreshes the cached answer
+    assert asyncio.run(scenario()) == ["call 1", "call 1", "call 2", "call 2"]
+    assert responses.calls == 2
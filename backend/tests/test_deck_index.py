@@ -0,0 +1,57 @@
+import asyncio
+import time
+
+import httpx
+
+from src.anki import AnkiService
+from src.deck_index import DeckIndex
+from benchmarks.mock_anki import MockAnki
+
+
+def make_index(mock: MockAnki) -> DeckIndex:
+    service = AnkiService("http://anki")
+    service.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=mock.app), base_url="http://anki")
+    return DeckIndex(service)
+
+
+def test_incremental_sync_fetches_only_changed_notes():
+    mock = MockAnki()
+    ids = mock.seed_notes("Deck", 20, fields=lambda i: {"Front": f"{{{{c1::word {i}}}}} here", "Back": "x"})
+
+    async def scenario():
+        index = make_index(mock)
+        await index.sync("Deck")
+        assert index.find_duplicate("Deck", {"Front": "{{c1::Word 3}} elsewhere"}) == ids[3]
+        assert mock.calls["notesInfo"] == 1
+
+        # Every note was edited "today", but none since the last sync
+        await index.sync("Deck", force=True)
+        assert mock.calls["notesInfo"] == 1
+
+        mock.notes[ids[5]]["fields"]["Front"] = "{{c1::changed}}"
+        mock.notes[ids[5]]["mod"] = int(time.time()) + 1
+        await index.sync("Deck", force=True)
+        assert mock.calls["notesInfo"] == 2
+        assert index.find_duplicate("Deck", {"Front": "{{c1::changed}}"}) == ids[5]
+        assert index.find_duplicate("Deck", {"Front": "{{c1::word 5}} here"}) is None
+
+        del mock.notes[ids[0]]
+        await index.sync("Deck", force=True)
+        assert index.find_duplicate("Deck", {"Front": "{{c1::word 0}}"}) is None
+        await index.anki_service.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_split_duplicates_marks_repeats_within_the_batch():
+    mock = MockAnki()
+    ids = mock.seed_notes("Deck", 1, fields=lambda i: {"Front": "{{c1::known}} word", "Back": "x"})
+
+    async def scenario():
+        index = make_index(mock)
+        cards = [{"Front": "{{c1::Known}} again"}, {"Front": "{{c1::new}} one"}, {"Front": "{{c1::new}} two"}]
+        result = await index.split_duplicates("Deck", cards)
+        await index.anki_service.aclose()
+        return result
+
+    assert asyncio.run(scenario()) == [ids[0], None, 0]
@@ -0,0 +1,91 @@
+import asyncio
+import os
+import random
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+from src.image_index import ImageIndex
+from src.images import hash_distance, image_hash, near_duplicate_groups
+
+
+def make_page(seed: int, width: int = 600, height: int = 1200) -> Image.Image:
+    """A page of random 'text' bars on white, with a light status bar on top."""
+    rnd = random.Random(seed)
+    img = Image.new("RGB", (width, height), (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    draw.rectangle([0, 0, width, 50], fill=(240, 240, 240))
+    y = 80
+    while y < height - 50:
+        x = 30
+        while x < width - 80:
+            word = rnd.randint(20, 70)
+            draw.rectangle([x, y, min(x + word, width - 30), y + 14], fill=(20, 20, 20))
+            x += word + 12
+        y += rnd.choice((32, 32, 32, 64))
+    return img
+
+
+def encode(img: Image.Image, fmt: str = "PNG", quality: int = 90) -> bytes:
+    out = BytesIO()
+    img.save(out, format=fmt, quality=quality)
+    return out.getvalue()
+
+
+def test_resized_and_cropped_copies_hash_close():
+    page = make_page(1)
+    width, height = page.size
+    original = image_hash(encode(page))
+    resized = image_hash(encode(page.resize((width * 3 // 4, height * 3 // 4)), "JPEG", 70))
+    cropped = image_hash(encode(page.crop((0, 50, width, height))))
+    other = image_hash(encode(make_page(2)))
+
+    assert hash_distance(original, resized) <= 32
+    assert hash_distance(original, cropped) <= 32
+    assert hash_distance(original, other) > 32
+    assert near_duplicate_groups([original, other, None, resized, cropped]) == [[0, 3, 4], [1], [2]]
+
+
+def test_undecodable_image_has_no_hash():
+    assert image_hash(b"not an image") is None
+
+
+def test_index_matches_near_duplicates_of_the_same_version(tmp_path):
+    page = make_page(3)
+    original = image_hash(encode(page))
+    copy = image_hash(encode(page.resize((400, 800)), "JPEG", 70))
+    cards = [{"Front": "{{c1::tackle}} the issue", "Back": ""}]
+
+    async def scenario():
+        index = ImageIndex(str(tmp_path / "images.sqlite3"))
+        assert await index.lookup(original, "v1") is None
+        await index.add(original, "v1", cards)
+        assert await index.lookup(copy, "v1") == cards
+        assert await index.lookup(copy, "v2") is None
+        assert await index.lookup(image_hash(encode(make_page(4))), "v1") is None
+
+        # Rows written by another process are picked up on the next lookup
+        other = ImageIndex(index.path)
+        assert await other.lookup(copy, "v1") == cards
+        assert (index.hits, index.misses) == (1, 3)
+
+    asyncio.run(scenario())
+
+
+def test_index_drops_oldest_entries(tmp_path):
+    hashes = [image_hash(encode(make_page(seed))) for seed in range(3)]
+
+    async def scenario():
+        index = ImageIndex(str(tmp_path / "images.sqlite3"), max_entries=2)
+        for i, value in enumerate(hashes):
+            await index.add(value, "v1", [{"Front": str(i), "Back": ""}])
+        assert await index.lookup(hashes[0], "v1") is None
+        assert await index.lookup(hashes[2], "v1") == [{"Front": "2", "Back": ""}]
+
+        # A second index that still holds the trimmed row in memory drops it
+        stale = ImageIndex(index.path, max_entries=10)
+        await stale.lookup(hashes[1], "v1")
+        await index.add(image_hash(encode(make_page(5))), "v1", [])
+        assert await stale.lookup(hashes[1], "v1") is None
+
+    asyncio.run(scenario())
@@ -0,0 +1,40 @@
+from io import BytesIO
+
+from PIL import Image
+
+from src.images import image_pixels, pack_images
+
+
+def encode(width: int, height: int, fmt: str = "PNG") -> bytes:
+    out = BytesIO()
+    Image.new("RGB", (width, height), (255, 255, 255)).save(out, format=fmt)
+    return out.getvalue()
+
+
+def test_image_pixels_reads_the_header():
+    assert image_pixels(encode(1170, 2532)) == 1170 * 2532
+    assert image_pixels(encode(640, 480, "JPEG")) == 640 * 480
+    assert image_pixels(b"not an image") is None
+
+
+def test_pack_images_fills_by_decreasing_size():
+    sizes = [(1170, 2532), (640, 480), (3024, 4032), (640, 480), (1170, 2532), (800, 600)]
+    pixels = [image_pixels(encode(w, h)) for w, h in sizes]
+    budget = 4_000_000
+
+    packs = pack_images(pixels, pixel_budget=budget, max_images=3)
+
+    # 3024x4032 alone exceeds the budget and gets its own pack. The two phone
+    # screenshots (2.96M each) can't share one; the small images fill in after
+    # them, largest first, until the first screenshot's pack holds 3 images
+    assert packs == [[0, 1, 5], [2], [3, 4]]
+    assert [sum(pixels[i] for i in pack) for pack in packs] == [3_749_640, 12_192_768, 3_269_640]
+    assert sorted(i for pack in packs for i in pack) == list(range(len(sizes)))
+
+
+def test_pack_images_respects_count_and_unknown_sizes():
+    # Unknown sizes count as the whole budget
+    assert pack_images([3, 3, None, 4, 2], pixel_budget=6, max_images=6) == [[0, 1], [2], [3, 4]]
+    assert pack_images([1] * 5, pixel_budget=100, max_images=2) == [[0, 1], [2, 3], [4]]
+    assert pack_images([1] * 3, pixel_budget=100, max_images=1) == [[0], [1], [2]]
+    assert pack_images([], pixel_budget=10) == []
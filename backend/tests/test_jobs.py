@@ -0,0 +1,160 @@
+import asyncio
+import time
+
+from src.jobs import CANCELLED, DONE, QUEUED, RUNNING, JobManager, JobStore
+
+
+def make_store(tmp_path) -> JobStore:
+    return JobStore(str(tmp_path / "jobs.sqlite3"))
+
+
+def test_claim_is_exclusive(tmp_path):
+    store = make_store(tmp_path)
+    store.create("a", "kind", {})
+    assert store.claim("w1") == "a"
+    assert store.claim("w2") is None
+    assert store.get("a")["status"] == RUNNING
+
+
+def test_stale_jobs_are_requeued_with_a_reset_event(tmp_path):
+    store = make_store(tmp_path)
+    store.create("a", "kind", {})
+    store.claim("w1")
+    assert store.add_event("a", {"type": "card", "n": 1}) == 1
+    assert store.add_event("a", {"type": "card", "n": 2}) == 2
+
+    assert store.requeue_stale(lease=60.0) == []  # lease still fresh
+    store._conn.execute("UPDATE jobs SET heartbeat = ? WHERE id = 'a'", (time.time() - 120,))
+    assert store.requeue_stale(lease=60.0) == ["a"]
+    assert store.get("a")["status"] == QUEUED
+
+    # A client that saw seq 2 still gets everything after it, starting with the reset
+    events = store.events_since("a", 2)
+    assert [e["type"] for e in events] == ["reset"]
+    store.claim("w2")
+    assert store.add_event("a", {"type": "card", "n": 1}) == 4
+
+
+def test_heartbeat_reports_cancel_requests(tmp_path):
+    store = make_store(tmp_path)
+    store.create("a", "kind", {})
+    store.claim("w1")
+    store.request_cancel("a")
+    assert store.heartbeat("w1", ["a"]) == ["a"]
+
+
+def test_job_runs_and_streams_events(tmp_path):
+    async def handler(ctx, params):
+        await ctx.emit("card", n=params["n"])
+        return {"n": params["n"]}
+
+    async def scenario():
+        manager = JobManager(make_store(tmp_path), workers=1, poll_interval=0.05)
+        manager.register("echo", handler)
+        await manager.start()
+        try:
+            job_id = await manager.submit("echo", {"n": 7})
+            events = [e async for e in manager.events(job_id)]
+            return events, await manager.get(job_id)
+        finally:
+            await manager.stop()
+
+    events, job = asyncio.run(scenario())
+    assert [e["type"] for e in events] == ["status", "card", "status"]
+    assert events[-1]["status"] == DONE and job["result"] == {"n": 7}
+
+
+def test_cancel_running_job(tmp_path):
+    async def scenario():
+        running = asyncio.Event()
+
+        async def handler(ctx, params):
+            running.set()
+            await asyncio.sleep(60)
+
+        manager = JobManager(make_store(tmp_path), workers=1, poll_interval=0.05)
+        manager.register("slow", handler)
+        await manager.start()
+        try:
+            job_id = await manager.submit("slow", {})
+            await running.wait()
+            assert await manager.cancel(job_id)
+            events = [e async for e in manager.events(job_id)]
+            return events[-1]
+        finally:
+            await manager.stop()
+
+    assert asyncio.run(scenario())["status"] == CANCELLED
+
+
+def test_stop_waits_for_handlers_and_releases_jobs(tmp_path):
+    store = make_store(tmp_path)
+    unwound = []
+
+    async def scenario():
+        running = asyncio.Event()
+
+        async def handler(ctx, params):
+            running.set()
+            try:
+                await asyncio.sleep(60)
+            finally:
+                await asyncio.sleep(0.05)  # e.g. a last request to Anki
+                unwound.append(True)
+
+        manager = JobManager(store, workers=1, poll_interval=0.05)
+        manager.register("slow", handler)
+        await manager.start()
+        job_id = await manager.submit("slow", {})
+        await running.wait()
+        await manager.stop()
+        return job_id
+
+    job_id = asyncio.run(scenario())
+    assert unwound == [True]
+    assert store.get(job_id)["status"] == QUEUED
+
+
+def test_cancel_queued_job_stores_its_status_event(tmp_path):
+    store = make_store(tmp_path)
+    store.create("a", "kind", {})
+    seq = store.cancel_queued("a", {"type": "status", "status": CANCELLED, "error": None})
+    assert seq == 1 and store.get("a")["status"] == CANCELLED
+    assert store.cancel_queued("a", {"type": "status", "status": CANCELLED, "error": None}) is None
+
+
+def test_requeued_job_resumes_from_its_checkpoint(tmp_path):
+    store = make_store(tmp_path)
+    seen = []
+
+    async def handler(ctx, params):
+        seen.append(ctx.checkpoint)
+        done = (ctx.checkpoint or {}).get("done", 0)
+        await ctx.save_checkpoint({"done": done + 1})
+        if done == 0:
+            await asyncio.sleep(60)
+        return {"done": done + 1}
+
+    async def run_once():
+        manager = JobManager(store, workers=1, poll_interval=0.05)
+        manager.register("steps", handler)
+        await manager.start()
+        return manager
+
+    async def scenario():
+        manager = await run_once()
+        job_id = await manager.submit("steps", {})
+        while not seen:
+            await asyncio.sleep(0.01)
+        await manager.stop()
+
+        manager = await run_once()
+        try:
+            events = [e async for e in manager.events(job_id)]
+            return events[-1], await manager.get(job_id)
+        finally:
+            await manager.stop()
+
+    last, job = asyncio.run(scenario())
+    assert seen == [None, {"done": 1}]
+    assert last["status"] == DONE and job["result"] == {"done": 2}
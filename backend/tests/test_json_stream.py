@@ -0,0 +1,40 @@
+import json
+
+from src.json_stream import CardStreamParser
+
+
+def feed_in_pieces(text: str, size: int):
+    parser = CardStreamParser()
+    cards = []
+    for i in range(0, len(text), size):
+        cards.extend(parser.feed(text[i : i + size]))
+    return parser, cards
+
+
+def test_flat_cards_are_yielded_as_they_complete():
+    parser = CardStreamParser()
+    assert parser.feed('{"Cards": [{"Front": "a", "Ba') == []
+    assert parser.feed('ck": "b"}, {"Front"') == [{"Front": "a", "Back": "b"}]
+    assert parser.feed(': "c", "Back": "d"}]}') == [{"Front": "c", "Back": "d"}]
+    assert json.loads(parser.text)["Cards"][1]["Front"] == "c"
+
+
+def test_nested_schema_and_any_split_point():
+    data = {"Cards": [[{"Front": "x", "Back": "y"}], [{"Front": "p", "Back": "q"}, {"Front": "r", "Back": "s"}]]}
+    text = json.dumps(data)
+    for size in (1, 2, 7, len(text)):
+        parser, cards = feed_in_pieces(text, size)
+        assert cards == [card for group in data["Cards"] for card in group]
+        assert parser.text == text
+
+
+def test_braces_and_quotes_inside_strings():
+    cards = [{"Front": 'She {{c1::said}} "}{" \\ ok', "Back": "[not] {json}"}]
+    text = json.dumps({"Cards": cards})
+    assert feed_in_pieces(text, 3)[1] == cards
+
+
+def test_truncated_output_yields_only_complete_cards():
+    text = json.dumps({"Cards": [{"Front": "a", "Back": "b"}, {"Front": "c", "Back": "d"}]})
+    parser, cards = feed_in_pieces(text[: text.index('"c"') + 5], 4)
+    assert cards == [{"Front": "a", "Back": "b"}]
@@ -0,0 +1,27 @@
+import json
+import logging
+
+from src import logging_config
+
+
+def test_stop_logging_detaches_the_queue(capsys):
+    root = logging.getLogger()
+    saved_handlers, saved_level = list(root.handlers), root.level
+    try:
+        logging_config.stop_logging()  # started when src.main was imported
+        for _ in range(2):  # e.g. two lifespans in one process
+            logging_config.setup_logging()
+            logging.getLogger("test").info("queued")
+            logging_config.stop_logging()
+            assert not any(isinstance(h, logging_config.TruncatingQueueHandler) for h in root.handlers)
+
+            logging.getLogger("test").warning("after stop")
+            lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+            assert [line["message"] for line in lines] == ["queued", "after stop"]
+    finally:
+        logging_config.stop_logging()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        for handler in saved_handlers:
+            root.addHandler(handler)
+        root.setLevel(saved_level)
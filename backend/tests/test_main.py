@@ -0,0 +1,103 @@
+import asyncio
+
+import httpx
+
+from src import main, processing
+from benchmarks.fake_openai import FakeAsyncOpenAI
+from benchmarks.mock_anki import MockAnki
+
+
+def test_endpoints(monkeypatch):
+    """One app lifespan for every check: the job manager's queue belongs to one event loop."""
+    mock = MockAnki()
+    deck = main.DEFAULT_DECK_NAME
+    # The fake LLM's first text call yields '{{c1::brought up 1.0}}', '... 1.1', '... 1.2'
+    mock.seed_notes(deck, 1, fields=lambda i: {"Front": "{{c1::brought up 1.0}}", "Back": "x"})
+    red_ids = mock.seed_notes(
+        "Red", 2, flag=1,
+        fields=lambda i: {"Front": f"[sound:w{i}.mp3]word&nbsp;{i}<br>example", "Back": f"<div>meaning {i}</div>"},
+    )
+    monkeypatch.setattr(main.anki_service, "client", httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=mock.app), base_url="http://anki"
+    ))
+
+    async def process(client, **data):
+        processing.client = FakeAsyncOpenAI(latency=0.0)  # restarts the fake's call numbering
+        resp = await client.post("/process", data={"text": "Some text.", "use_cache": "false", **data})
+        resp.raise_for_status()
+        return [card["Front"] for card in resp.json()["cards"]]
+
+    async def scenario():
+        async with main.lifespan(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://backend") as client:
+                # skip_known is opt-in
+                assert len(await process(client, mode="manual")) == 3
+                fronts = await process(client, mode="manual", skip_known="true")
+                assert len(fronts) == 2 and not any("brought up 1.0}}" in f for f in fronts)
+
+                # Red cards come back as stored; the model sees them normalized
+                red = (await client.get("/get_cards_red", params={"deck_name": "Red"})).json()["cards"]
+                assert [(c["Front"], c["Back"]) for c in red] == [
+                    ("[sound:w0.mp3]word&nbsp;0<br>example", "<div>meaning 0</div>"),
+                    ("[sound:w1.mp3]word&nbsp;1<br>example", "<div>meaning 1</div>"),
+                ]
+
+                resp = await client.get(
+                    "/update_cards_red_manual_get", params={"deck_name": "Red", "use_cache": "false"}
+                )
+                assert [(c["Front"], c["Back"]) for c in resp.json()] == [
+                    ("word&nbsp;0<br>example", "<div>meaning 0</div>"),
+                    ("word&nbsp;1<br>example", "<div>meaning 1</div>"),
+                ]
+                assert "{{c1::word\xa00\nexample}}" in resp.json()[0]["New"][0]["Front"]
+
+                # Audio tags survive an auto rewrite
+                resp = await client.post(
+                    "/update_cards_red_auto", params={"deck_name": "Red", "use_cache": "false"}
+                )
+                assert [c["Status"] for c in resp.json()["cards"]] == ["OK", "OK"]
+                for note_id, note in mock.notes.items():
+                    if note_id in red_ids:
+                        assert "{{c1::word\xa0" in note["fields"]["Front"]
+                        assert note["fields"]["Front"].endswith(f"[sound:w{red_ids.index(note_id)}.mp3]")
+
+    asyncio.run(scenario())
+
+
+class RecordingContext:
+    def __init__(self, checkpoint):
+        self.job_id = "job"
+        self.checkpoint = checkpoint
+        self.saved = []
+        self.cards = []
+
+    async def emit(self, event_type, **data):
+        if event_type == "card":
+            self.cards.append(data["card"])
+
+    async def save_checkpoint(self, checkpoint):
+        self.checkpoint = checkpoint
+        self.saved.append(checkpoint)
+
+
+def test_red_auto_job_resumes_after_applied_chunks(monkeypatch):
+    mock = MockAnki()
+    ids = mock.seed_notes("Resume", 3, flag=1, fields=lambda i: {"Front": f"word {i}", "Back": "x"})
+    monkeypatch.setattr(main.anki_service, "client", httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=mock.app), base_url="http://anki"
+    ))
+    fake = FakeAsyncOpenAI(latency=0.0)
+    monkeypatch.setattr(processing, "client", fake)
+    earlier = {"noteId": ids[0], "beforeFront": "word 0", "beforeBack": "x",
+               "afterFront": "done before", "afterBack": "x", "Status": "OK"}
+    ctx = RecordingContext({"applied": [ids[0]], "results": [earlier]})
+
+    result = asyncio.run(main.red_auto_job(ctx, {"deck_name": "Resume", "use_cache": False}))
+
+    # The applied note is neither sent to the model nor written again
+    assert mock.notes[ids[0]]["fields"]["Front"] == "word 0"
+    assert all("{{c1::word" in mock.notes[i]["fields"]["Front"] for i in ids[1:])
+    assert [card["noteId"] for card in result["cards"]] == ids
+    assert ctx.cards[0] == earlier
+    assert sorted(ctx.checkpoint["applied"]) == sorted(ids)
@@ -0,0 +1,41 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+from src.main import record_request_metrics
+from src.metrics import HTTP_REQUEST_DURATION, Histogram
+
+
+def test_histogram_buckets_and_sum():
+    hist = Histogram("test_seconds", "Test.", ("op",), buckets=(0.1, 1.0))
+    hist.observe(0.05, op="a")
+    hist.observe(0.5, op="a")
+    hist.observe(5.0, op="a")
+    assert hist._values[("a",)] == [1, 1, 1, 5.55]
+
+
+def test_streaming_responses_are_timed_to_the_end_of_the_body():
+    app = FastAPI()
+    app.middleware("http")(record_request_metrics)
+
+    @app.get("/test_stream")
+    async def stream():
+        async def body():
+            for i in range(3):
+                await asyncio.sleep(0.1)
+                yield f"{i}\n"
+
+        return StreamingResponse(body(), media_type="application/x-ndjson")
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            resp = await client.get("/test_stream")
+            assert resp.status_code == 200
+
+    asyncio.run(scenario())
+    state = HTTP_REQUEST_DURATION._values[("GET", "/test_stream", "200")]
+    assert sum(state[:-1]) == 1
+    assert state[-1] >= 0.3
@@ -0,0 +1,42 @@
+import asyncio
+
+from src.normalize import field_values, normalize_fields, normalize_notes
+
+
+def test_columns_line_up_with_values():
+    values = [
+        "<div>{{c1::Hallo&nbsp;Welt::hint}} ist</div>[sound:a.mp3]<br>x [sound:b.mp3]",
+        "",
+        None,
+        "a &amp; b<br/>c",
+        "{{c2::Zwei  Worte}} {{c1::eins}}",
+    ]
+    result = normalize_fields(values)
+    assert len(result) == len(values)
+    assert result.text == ["{{c1::Hallo\xa0Welt::hint}} ist\n\nx", "", "", "a & b\nc", "{{c2::Zwei  Worte}} {{c1::eins}}"]
+    assert result.plain[0] == "Hallo\xa0Welt ist\n\nx"
+    assert result.media == [["[sound:a.mp3]", "[sound:b.mp3]"], [], [], [], []]
+    assert result.cloze == ["hallo welt", "", "", "", "zwei worte"]
+
+
+def test_patterns_do_not_cross_values():
+    result = normalize_fields(["[sound:open", "close] {{c1::a", "b}} <b", "i>"])
+    assert result.media == [[], [], [], []]
+    assert result.cloze == ["", "", "", ""]
+    assert result.text == ["[sound:open", "close] {{c1::a", "b}} <b", "i>"]
+
+
+def test_empty_batch():
+    assert len(normalize_fields([])) == 0
+
+
+def test_normalize_notes_splits_fields():
+    infos = [
+        {"noteId": 1, "fields": {"Front": {"value": "a<br>b"}, "Back": {"value": "[sound:z.mp3]c"}}},
+        {"noteId": 2, "fields": {"Front": {"value": "d"}}},
+    ]
+    assert field_values(infos, "Back") == ["[sound:z.mp3]c", ""]
+    fields = asyncio.run(normalize_notes(infos))
+    assert fields["Front"].text == ["a\nb", "d"]
+    assert fields["Back"].text == ["c", ""]
+    assert fields["Back"].media == [["[sound:z.mp3]"], []]
@@ -0,0 +1,223 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import httpx
+import openai
+
+from src import processing
+from src.adaptive import ChunkOutputError, ChunkSizer, run_adaptive_chunks
+from benchmarks.fake_openai import FakeAsyncOpenAI
+
+
+class TimingOutResponses:
+    """Times out for chunks over `max_cards`; otherwise rewrites every card once."""
+
+    def __init__(self, max_cards):
+        self.max_cards = max_cards
+        self.timeouts = []
+        self.sizes = []
+
+    async def create(self, **kwargs):
+        pairs = json.loads(kwargs["input"])
+        self.timeouts.append(kwargs["timeout"])
+        self.sizes.append(len(pairs))
+        if len(pairs) > self.max_cards:
+            raise openai.APITimeoutError(request=httpx.Request("POST", "https://api.openai.com/v1/responses"))
+        text = json.dumps({"Cards": [[{"Front": p["Front"], "Back": p["Back"]}] for p in pairs]})
+        return SimpleNamespace(output_text=text, status="completed", usage=None)
+
+
+def test_timeout_follows_output_budget():
+    assert processing.output_timeout(4096) > processing.output_timeout(512) > processing.LLM_TIMEOUT_BASE
+
+
+def test_timed_out_chunks_are_split(monkeypatch):
+    responses = TimingOutResponses(max_cards=2)
+    monkeypatch.setattr(processing, "client", SimpleNamespace(responses=responses))
+    pairs = [{"Front": f"front {i}", "Back": f"back {i}"} for i in range(8)]
+
+    async def process(chunk):
+        return await processing.rewrite_pairs(chunk, use_cache=False)
+
+    sizer = ChunkSizer(max_output_tokens=processing.CHANGE_PAIRS_MAX_OUTPUT_TOKENS, initial_size=8)
+    outcomes = asyncio.run(run_adaptive_chunks(pairs, process, sizer, lambda r: 10 * len(r)))
+
+    assert not [result for _, result in outcomes if isinstance(result, Exception)]
+    assert [card[0]["Front"] for _, result in outcomes for card in result] == [p["Front"] for p in pairs]
+    assert responses.timeouts[0] == processing.output_timeout(processing.CHANGE_PAIRS_MAX_OUTPUT_TOKENS)
+    assert sorted(responses.sizes, reverse=True) == [8, 4, 4, 2, 2, 2, 2]
+
+
+def test_single_card_timeout_is_reported(monkeypatch):
+    monkeypatch.setattr(processing, "client", SimpleNamespace(responses=TimingOutResponses(max_cards=0)))
+
+    async def scenario():
+        try:
+            await processing.rewrite_pairs([{"Front": "a", "Back": "b"}], use_cache=False)
+        except ChunkOutputError as e:
+            return e
+
+    assert asyncio.run(scenario()).truncated
+
+
+class MismatchedOnceResponses:
+    """Drops the last item of the first answer; answers correctly after that."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        pairs = json.loads(kwargs["input"])
+        cards = [[{"Front": p["Front"], "Back": p["Back"]}] for p in pairs]
+        if self.calls == 1:
+            cards.pop()
+        return SimpleNamespace(output_text=json.dumps({"Cards": cards}), status="completed", usage=None)
+
+
+def test_mismatched_output_is_not_cached(monkeypatch):
+    responses = MismatchedOnceResponses()
+    monkeypatch.setattr(processing, "client", SimpleNamespace(responses=responses))
+    pairs = [{"Front": f"uncached {i}", "Back": ""} for i in range(2)]
+
+    async def scenario():
+        try:
+            await processing.rewrite_pairs(pairs)
+        except ChunkOutputError:
+            pass
+        else:
+            raise AssertionError("expected ChunkOutputError")
+        first = await processing.rewrite_pairs(pairs)
+        second = await processing.rewrite_pairs(pairs)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == second and len(first) == 2
+    # The retry reached the model; only the valid answer was cached
+    assert responses.calls == 2
+
+
+class TruncatingResponses:
+    """One card per paragraph; output for more than `max_paragraphs` paragraphs hits the output cap."""
+
+    def __init__(self, max_paragraphs):
+        self.max_paragraphs = max_paragraphs
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        paragraphs = json.loads(kwargs["input"]).split("\n\n")
+        if len(paragraphs) > self.max_paragraphs:
+            return SimpleNamespace(
+                output_text='{"Cards": [[{"Front": "cut', status="incomplete", usage=None,
+                incomplete_details=SimpleNamespace(reason="max_output_tokens"),
+            )
+        cards = [[{"Front": f"{{{{c1::{p.split()[0]}}}}}", "Back": ""}] for p in paragraphs]
+        return SimpleNamespace(output_text=json.dumps({"Cards": cards}), status="completed", usage=None)
+
+
+def test_truncated_segment_is_split(monkeypatch):
+    responses = TruncatingResponses(max_paragraphs=2)
+    monkeypatch.setattr(processing, "client", SimpleNamespace(responses=responses))
+    text = "\n\n".join(f"word{i} " + "filler " * 20 for i in range(8))
+
+    cards = asyncio.run(processing.extract_pairs_from_text(text, use_cache=False))
+    assert [card["Front"] for card in cards] == [f"{{{{c1::word{i}}}}}" for i in range(8)]
+    assert responses.calls > 1
+
+
+class RecordingLimiter:
+    def __init__(self):
+        self.released = []
+
+    async def acquire(self, tokens):
+        return 0.0
+
+    def release(self, reserved, used):
+        self.released.append((reserved, used))
+
+    def pause(self, seconds):
+        pass
+
+
+def test_abandoned_stream_is_closed_and_released(monkeypatch):
+    fake = FakeAsyncOpenAI(latency=0.01)
+    streams = []
+    create = fake.responses.create
+
+    async def recording_create(**kwargs):
+        stream = await create(**kwargs)
+        streams.append(stream)
+        return stream
+
+    fake.responses.create = recording_create
+    limiter = RecordingLimiter()
+    monkeypatch.setattr(processing, "client", fake)
+    monkeypatch.setattr(processing, "rate_limiter", limiter)
+
+    async def scenario():
+        cards = processing._stream_cards(
+            "extract_text", use_cache=False, **processing.extract_text_request("Some text to extract cards from.")
+        )
+        first = await cards.__anext__()
+        await cards.aclose()
+        return first
+
+    assert "Front" in asyncio.run(scenario())
+    assert streams[0].closed
+    assert len(limiter.released) == 1 and limiter.released[0][1] == 0
+
+
+def _api_error(cls, status):
+    request = httpx.Request("POST", "https://api.openai.com/v1/responses")
+    return cls("error", response=httpx.Response(status, request=request), body=None)
+
+
+class FailingResponses:
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return SimpleNamespace(output_text="{}", status="completed", usage=None)
+
+
+def test_client_does_not_retry_by_itself(monkeypatch):
+    monkeypatch.setattr(processing, "client", None)
+    llm = processing.get_client()
+    try:
+        assert llm.max_retries == 0
+    finally:
+        asyncio.run(processing.close_client())
+
+
+def test_rate_limits_pause_the_shared_limiter(monkeypatch):
+    responses = FailingResponses([_api_error(openai.RateLimitError, 429)] * 2)
+    limiter = RecordingLimiter()
+    pauses = []
+    limiter.pause = pauses.append
+    monkeypatch.setattr(processing, "client", SimpleNamespace(responses=responses))
+    monkeypatch.setattr(processing, "rate_limiter", limiter)
+
+    asyncio.run(processing._call_model("test", 10, model="m"))
+    assert responses.calls == 3 and len(pauses) == 2
+
+
+def test_server_errors_are_retried_a_few_times(monkeypatch):
+    monkeypatch.setattr(processing, "_retry_after", lambda e, attempt: 0)
+    monkeypatch.setattr(processing, "rate_limiter", RecordingLimiter())
+    errors = [_api_error(openai.InternalServerError, 500)] * (processing.LLM_SERVER_ERROR_RETRIES + 1)
+    responses = FailingResponses(errors)
+    monkeypatch.setattr(processing, "client", SimpleNamespace(responses=responses))
+
+    try:
+        asyncio.run(processing._call_model("test", 10, model="m"))
+    except openai.InternalServerError:
+        pass
+    else:
+        raise AssertionError("expected InternalServerError")
+    assert responses.calls == processing.LLM_SERVER_ERROR_RETRIES + 1
@@ -0,0 +1,103 @@
+import asyncio
+
+from src import ratelimit
+from src.ratelimit import RateLimiter, rate_limit_key
+
+
+class Clock:
+    """Stands in for time.monotonic; the limiter's own timers are never awaited."""
+
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+def make_limiter(monkeypatch, **kwargs):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit, "time", clock)
+    return RateLimiter(**kwargs), clock
+
+
+async def start(limiter, key, tokens, granted):
+    """Queues one acquire under `key`; `granted` gets the key once it goes through."""
+    async def call():
+        rate_limit_key.set(key)
+        await limiter.acquire(tokens)
+        granted.append(key)
+
+    task = asyncio.create_task(call())
+    await asyncio.sleep(0)
+    return task
+
+
+async def settle():
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+def test_unused_tokens_are_refunded(monkeypatch):
+    limiter, _ = make_limiter(monkeypatch, tpm=1000)
+
+    async def scenario():
+        granted = []
+        await start(limiter, "a", 800, granted)
+        await start(limiter, "a", 800, granted)
+        await settle()
+        assert granted == ["a"] and limiter.waiting == 1
+
+        # The first call used 100 of its 800; the refund covers the second
+        limiter.release(800, 100)
+        await settle()
+        assert granted == ["a", "a"] and limiter.waiting == 0
+
+        # Usage over the reservation is charged
+        limiter.release(100, 600)
+        assert limiter._tokens.level == 1000 - 100 - 800 - 500
+
+    asyncio.run(scenario())
+
+
+def test_rate_limit_pause_drains_the_buckets(monkeypatch):
+    limiter, clock = make_limiter(monkeypatch, rpm=60)
+
+    async def scenario():
+        granted = []
+        await start(limiter, "a", 0, granted)
+        limiter.pause(2.0)
+        tasks = [await start(limiter, "a", 0, granted) for _ in range(3)]
+        await settle()
+        assert granted == ["a"]
+
+        clock.now += 1.0
+        limiter._dispatch()
+        await settle()
+        assert granted == ["a"]  # still paused
+
+        # 2 s at 60 rpm refill two requests, not the 59 left before the 429
+        clock.now += 1.0
+        limiter._dispatch()
+        await settle()
+        assert len(granted) == 3 and limiter.waiting == 1
+        for task in tasks:
+            task.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_callers_are_served_round_robin(monkeypatch):
+    limiter, clock = make_limiter(monkeypatch, rpm=60)
+    limiter._requests.level = 0
+
+    async def scenario():
+        granted = []
+        for key in ("a", "a", "a", "b", "b"):
+            await start(limiter, key, 0, granted)
+        for _ in range(5):
+            clock.now += 1.0  # one request's worth of budget
+            limiter._dispatch()
+            await settle()
+        return granted
+
+    assert asyncio.run(scenario()) == ["a", "b", "a", "b", "a"]
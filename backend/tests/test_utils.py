@@ -0,0 +1,39 @@
+import asyncio
+from io import BytesIO
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+from src.utils import card_key, cloze_target, encode_base64, read_and_validate_image, remove_sound_tags
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 200_000
+
+
+def upload(data: bytes, size=True) -> UploadFile:
+    return UploadFile(file=BytesIO(data), filename="shot.png", size=len(data) if size else None)
+
+
+@pytest.mark.parametrize("size", [True, False])
+def test_read_and_validate_image_returns_bytes(size):
+    content = asyncio.run(read_and_validate_image(upload(PNG, size=size)))
+    assert type(content) is bytes and content == PNG
+
+
+@pytest.mark.parametrize("data, max_bytes", [(b"not an image at all", 1000), (PNG, 1000), (b"", 1000)])
+def test_read_and_validate_image_rejects(data, max_bytes):
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(read_and_validate_image(upload(data, size=False), max_bytes=max_bytes))
+    assert e.value.status_code == 400
+
+
+def test_encode_base64_matches_stdlib():
+    import base64
+
+    data = bytes(range(256)) * 3000
+    assert encode_base64(data) == base64.b64encode(data).decode("ascii")
+
+
+def test_card_keys():
+    assert cloze_target("I {{c1::Brought  Up::hint}} it") == "brought up"
+    assert card_key({"Front": "No cloze Here"}) == "no cloze here"
+    assert remove_sound_tags(" a [sound:x.mp3] b ") == ("a  b", ["[sound:x.mp3]"])